@@ -14,44 +14,35 @@ def create_app():
     from config import Config
     app.config.from_object(Config)
     
+    # Static files revalidate via ETag unless linked with a content hash
     app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
     
-    @app.after_request
-    def add_header(response):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
+    from app.caching import init_caching
+    init_caching(app)
     
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
     db.init_app(app)
 
-    with app.app_context():
-        from app import models
-        db.create_all()
-
-        # Auto-migrate: Add new columns if they don't exist
-        try:
-            from sqlalchemy import text
-            with db.engine.connect() as conn:
-                # Add check_ocr_text column
-                try:
-                    conn.execute(text("ALTER TABLE checks ADD COLUMN IF NOT EXISTS check_ocr_text TEXT"))
-                    conn.commit()
-                except Exception:
-                    pass  # Column already exists
-
-                # Add buckslip_ocr_text column
-                try:
-                    conn.execute(text("ALTER TABLE checks ADD COLUMN IF NOT EXISTS buckslip_ocr_text TEXT"))
-                    conn.commit()
-                except Exception:
-                    pass  # Column already exists
-        except Exception as e:
-            print(f"Note: Database migration check: {e}")
+    from app.status_store import init_status_store
+    init_status_store(app)
+
+    from app.storage import init_storage
+    init_storage(app)
+
+    from app import models  # noqa: F401
+
+    # Schema changes are applied at deploy time with `flask db-upgrade`;
+    # AUTO_MIGRATE runs them here instead (dev, tests, single-process setups).
+    if app.config.get('AUTO_MIGRATE'):
+        from app.migrations import upgrade
+        with app.app_context():
+            upgrade()
 
     from app.routes import main_bp
     app.register_blueprint(main_bp)
+
+    from app.cli import register_commands
+    register_commands(app)
     
     return app
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import threading
+
+from flask import request
+
+# Endpoints whose responses are files that never change once written.
+IMAGE_ENDPOINTS = {'main.serve_image', 'main.serve_image_derivative'}
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_static_hashes = {}
+_static_lock = threading.Lock()
+
+
+def static_hash(static_folder, filename):
+    """Short content hash of a static file, recomputed when its mtime changes."""
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _static_lock:
+        cached = _static_hashes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _static_lock:
+        _static_hashes[path] = (mtime, digest)
+    return digest
+
+
+def init_caching(app):
+    """Per-route Cache-Control policy.
+
+    Static assets are linked with a content hash (``?v=``) and cached
+    forever; batch page images are revalidated with ETag/Last-Modified;
+    everything else (HTML pages, JSON APIs, SSE) is ``no-store``.
+    """
+
+    @app.url_defaults
+    def add_static_version(endpoint, values):
+        if endpoint == 'static' and 'v' not in values and 'filename' in values:
+            version = static_hash(app.static_folder, values['filename'])
+            if version:
+                values['v'] = version
+
+    @app.after_request
+    def set_cache_policy(response):
+        if request.endpoint == 'static':
+            if request.args.get('v'):
+                response.cache_control.public = True
+                response.cache_control.max_age = IMMUTABLE_MAX_AGE
+                response.cache_control.immutable = True
+                response.cache_control.no_cache = None
+            else:
+                response.cache_control.no_cache = True
+        elif request.endpoint in IMAGE_ENDPOINTS:
+            # Cheque images carry donor details: browser cache only, never shared caches.
+            response.cache_control.public = None
+            response.cache_control.private = True
+        else:
+            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+            response.headers['Pragma'] = 'no-cache'
+            response.headers['Expires'] = '0'
+        return response
@@ -0,0 +1,249 @@
+import glob
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.utils import secure_filename
+
+
+@click.command('sync-contacts')
+@click.option('--full', is_flag=True, help='Re-download every contact instead of only recent changes.')
+@with_appcontext
+def sync_contacts_command(full):
+    """Sync the local HubSpot contact mirror."""
+    from app.contacts import get_contact_mirror
+
+    mirror = get_contact_mirror(current_app._get_current_object())
+    count = mirror.sync(full=full)
+    click.echo(f"Synced {count} contacts.")
+
+
+def _find_pdfs(sources, recursive):
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            pattern = os.path.join(source, '**', '*.pdf') if recursive else os.path.join(source, '*.pdf')
+            matches = glob.glob(pattern, recursive=recursive)
+            matches += glob.glob(pattern[:-3] + 'PDF', recursive=recursive)
+        else:
+            matches = glob.glob(source, recursive=recursive)
+        paths.extend(sorted(m for m in matches if os.path.isfile(m) and m.lower().endswith('.pdf')))
+
+    seen = set()
+    unique = []
+    for path in paths:
+        real = os.path.realpath(path)
+        if real not in seen:
+            seen.add(real)
+            unique.append(path)
+    return unique
+
+
+@click.command('ingest')
+@click.argument('sources', nargs=-1, required=True)
+@click.option('--appeal-code', '-a', required=True, help='Appeal code for every file (e.g. 020 or 035).')
+@click.option('--workers', '-w', type=int, default=None, help='Batches processed at once (default MAX_ACTIVE_BATCHES).')
+@click.option('--recursive', '-r', is_flag=True, help='Search directories recursively.')
+@click.option('--export', 'export_path', type=click.Path(dir_okay=False), help='Write the ingested checks to a .csv or .jsonl file.')
+@click.option('--force', is_flag=True, help='Ingest files even if the same PDF was ingested before.')
+@with_appcontext
+def ingest_command(sources, appeal_code, workers, recursive, export_path, force):
+    """Process directories or globs of PDFs without going through /upload."""
+    from app import db
+    from app.models import Batch
+    from app.export import checks_query, iter_rows, write_export
+    from app.status_store import get_status
+    from app.uploads import file_digest, start_batch
+    from config import Config
+
+    if appeal_code not in Config.APPEAL_CODES:
+        raise click.BadParameter(f"must be one of {', '.join(Config.APPEAL_CODES)}", param_hint='--appeal-code')
+    if workers:
+        # Read once when the scheduler is created, which has not happened yet in this process.
+        Config.MAX_ACTIVE_BATCHES = workers
+
+    paths = _find_pdfs(sources, recursive)
+    if not paths:
+        click.echo('No PDF files found.')
+        return
+
+    click.echo(f"Hashing {len(paths)} files...")
+    with ThreadPoolExecutor(max_workers=workers or Config.MAX_ACTIVE_BATCHES) as pool:
+        digests = list(pool.map(file_digest, paths))
+
+    app = current_app._get_current_object()
+    upload_folder = app.config['UPLOAD_FOLDER']
+    batches = {}
+    seen_digests = set()
+    skipped = 0
+    for path, digest in zip(paths, digests):
+        existing = None
+        if not force:
+            existing = Batch.query.filter(
+                Batch.source_digest == digest, Batch.status != 'error'
+            ).first()
+        if existing or digest in seen_digests:
+            skipped += 1
+            click.echo(f"skip  {path} (already ingested as batch {existing.id if existing else 'in this run'})")
+            continue
+        seen_digests.add(digest)
+
+        filename = secure_filename(os.path.basename(path))
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        stored_path = os.path.join(upload_folder, f"{timestamp}_{digest[:8]}_{filename}")
+        shutil.copyfile(path, stored_path)
+
+        batch = start_batch(app, stored_path, filename, appeal_code, source_digest=digest)
+        batches[batch.id] = path
+
+    if not batches:
+        click.echo(f"Nothing to do ({skipped} skipped).")
+        return
+
+    click.echo(f"Queued {len(batches)} batches ({skipped} skipped).")
+    pending = set(batches)
+    failed = 0
+    last_report = 0.0
+    while pending:
+        time.sleep(1)
+        statuses = {batch_id: get_status(batch_id) for batch_id in pending}
+        for batch_id, status in statuses.items():
+            if status.get('status') in ('complete', 'error'):
+                pending.discard(batch_id)
+                done = len(batches) - len(pending)
+                if status['status'] == 'error':
+                    failed += 1
+                    click.echo(f"[{done}/{len(batches)}] error {batches[batch_id]}: {status.get('message')}")
+                else:
+                    click.echo(f"[{done}/{len(batches)}] done  {batches[batch_id]} -> batch {batch_id}, "
+                               f"{status.get('checks_found', 0)} checks")
+
+        now = time.monotonic()
+        if pending and now - last_report >= 10:
+            last_report = now
+            active = [s for s in statuses.values() if s.get('status') == 'processing']
+            pages_done = sum(s.get('current_page') or 0 for s in active)
+            pages_total = sum(s.get('total_pages') or 0 for s in active)
+            click.echo(f"      {len(active)} processing ({pages_done}/{pages_total} pages), "
+                       f"{len(pending) - len(active)} queued")
+
+    db.session.expire_all()
+    click.echo(f"Finished: {len(batches) - failed} ingested, {failed} failed, {skipped} skipped.")
+
+    if export_path:
+        count = write_export(export_path, iter_rows(checks_query(batch_ids=batches)))
+        click.echo(f"Exported {count} checks to {export_path}")
+
+
+@click.command('export')
+@click.option('--batch', 'batch_ids', type=int, multiple=True, help='Batch id to export (repeatable).')
+@click.option('--start', help='First upload date to include (YYYY-MM-DD).')
+@click.option('--end', help='Last upload date to include (YYYY-MM-DD).')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Output format (default: from the output file extension, else csv).')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help='Output file; - for stdout.')
+@with_appcontext
+def export_command(batch_ids, start, end, fmt, output):
+    """Export checks as CSV or JSONL."""
+    from app.export import buffered, checks_query, format_for_path, iter_export, iter_rows, parse_date_range
+
+    try:
+        start_at, end_at = parse_date_range(start, end)
+    except ValueError:
+        raise click.BadParameter('dates must be YYYY-MM-DD')
+
+    fmt = fmt or (format_for_path(output) if output != '-' else 'csv')
+    query = checks_query(batch_ids=batch_ids or None, start=start_at, end=end_at)
+    with click.open_file(output, 'w', encoding='utf-8') as f:
+        for chunk in buffered(iter_export(iter_rows(query), fmt)):
+            f.write(chunk)
+
+
+@click.command('purge-expired')
+@click.option('--hours', type=int, default=None, help='Retention window (default DATA_RETENTION_HOURS).')
+@click.option('--chunk-size', type=int, default=None, help='Batches purged per transaction.')
+@click.option('--dry-run', is_flag=True, help='Report what would be reclaimed without deleting anything.')
+@with_appcontext
+def purge_expired_command(hours, chunk_size, dry_run):
+    """Delete images, PDFs and OCR text of submitted batches past retention."""
+    from app.retention import RetentionJanitor, format_report
+
+    janitor = RetentionJanitor(current_app._get_current_object(), retention_hours=hours, chunk_size=chunk_size)
+    report = janitor.run_once(dry_run=dry_run)
+    if report.get('skipped'):
+        click.echo("Another process is already purging; nothing done.")
+    elif dry_run:
+        click.echo(f"Would purge {report['batches']} batches, "
+                   f"{report['bytes'] / (1024 * 1024):.1f} MB on disk.")
+    else:
+        click.echo(format_report(report))
+
+
+@click.command('fingerprint-checks')
+@click.option('--chunk-size', type=int, default=200, help='Checks indexed per transaction.')
+@with_appcontext
+def fingerprint_checks_command(chunk_size):
+    """Index existing checks for duplicate detection (images are hashed while still retained)."""
+    from PIL import Image
+    from app import db
+    from app.duplicates import image_hash, set_fingerprint
+    from app.models import Check, CheckFingerprint
+    from app.storage import StorageError, get_storage
+
+    storage = get_storage()
+    indexed = hashed = 0
+    while True:
+        checks = (
+            Check.query.outerjoin(CheckFingerprint, CheckFingerprint.check_id == Check.id)
+            .filter(CheckFingerprint.check_id.is_(None))
+            .order_by(Check.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not checks:
+            break
+        for check in checks:
+            hash_hex = None
+            if check.check_image_path:
+                try:
+                    with storage.local_path(check.check_image_path) as path, Image.open(path) as image:
+                        hash_hex = image_hash(image)
+                except (StorageError, OSError):
+                    pass
+            set_fingerprint(check, hash_hex)
+            hashed += hash_hex is not None
+        db.session.commit()
+        indexed += len(checks)
+    click.echo(f"Indexed {indexed} checks ({hashed} with an image hash).")
+
+
+@click.command('db-upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Stop after this migration version.')
+@click.option('--status', 'show_status', is_flag=True, help='List migrations and whether they are applied.')
+@with_appcontext
+def db_upgrade_command(target, show_status):
+    """Apply pending database migrations."""
+    from app.migrations import migration_status, upgrade
+
+    if show_status:
+        for version, name, applied_at in migration_status():
+            state = applied_at.strftime('%Y-%m-%d %H:%M:%S') if applied_at else 'pending'
+            click.echo(f"{version:03d}  {state:19}  {name}")
+        return
+    applied = upgrade(target)
+    click.echo(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+
+def register_commands(app):
+    app.cli.add_command(sync_contacts_command)
+    app.cli.add_command(ingest_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(purge_expired_command)
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(fingerprint_checks_command)
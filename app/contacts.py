@@ -0,0 +1,241 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import db
+from app.models import HubSpotContact
+from app.hubspot import HubSpotClient
+from app.matching import bulk_match, contact_from_hubspot, normalize_name, zip5
+from config import Config
+
+SOUNDEX_CODES = {}
+for letters, code in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')):
+    for letter in letters:
+        SOUNDEX_CODES[letter] = code
+
+
+def soundex(word):
+    word = re.sub(r'[^a-z]', '', (word or '').lower())
+    if not word:
+        return ''
+    encoded = word[0].upper()
+    previous = SOUNDEX_CODES.get(word[0], '')
+    for letter in word[1:]:
+        code = SOUNDEX_CODES.get(letter, '')
+        if code and code != previous:
+            encoded += code
+        if letter not in 'hw':
+            previous = code
+    return (encoded + '000')[:4]
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _as_search_result(contact):
+    # Same shape as a HubSpot search result so scoring stays in one place.
+    return {
+        'id': contact.id,
+        'properties': {
+            'firstname': contact.firstname or '',
+            'lastname': contact.lastname or '',
+            'email': contact.email or '',
+            'address': contact.address or '',
+            'city': contact.city or '',
+            'state': contact.state or '',
+            'zip': contact.zip or '',
+        }
+    }
+
+
+class ContactIndex:
+    """In-memory candidate index over the mirrored contacts.
+
+    Candidates for a name come from three postings lists: shared name
+    trigrams (tolerates OCR character errors), Soundex of each name token
+    (tolerates misspellings such as Smyth/Smith or a wrong first name), and
+    the five-digit ZIP.
+    """
+
+    def __init__(self, contacts):
+        self.contacts = {}
+        self.by_trigram = defaultdict(set)
+        self.by_soundex = defaultdict(set)
+        self.by_zip = defaultdict(set)
+
+        self.match_pool = []
+        
+        for contact in contacts:
+            self.contacts[contact.id] = contact
+            self.match_pool.append(contact_from_hubspot(_as_search_result(contact)))
+            for gram in trigrams(contact.name_key or ''):
+                self.by_trigram[gram].add(contact.id)
+            for key in (contact.first_soundex, contact.last_soundex):
+                if key:
+                    self.by_soundex[key].add(contact.id)
+            if contact.zip5:
+                self.by_zip[contact.zip5].add(contact.id)
+
+    def __len__(self):
+        return len(self.contacts)
+
+    def candidates(self, name, zip_code=None, limit=200):
+        name_key = normalize_name(name)
+        scores = defaultdict(float)
+
+        query_grams = trigrams(name_key) if name_key else set()
+        for gram in query_grams:
+            for contact_id in self.by_trigram.get(gram, ()):
+                scores[contact_id] += 1.0 / len(query_grams)
+
+        for token in name_key.split():
+            for contact_id in self.by_soundex.get(soundex(token), ()):
+                scores[contact_id] += 0.25
+
+        zip_key = zip5(zip_code)
+        if zip_key:
+            for contact_id in self.by_zip.get(zip_key, ()):
+                scores[contact_id] += 0.25
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [self.contacts[contact_id] for contact_id, _ in ranked]
+
+
+class ContactMirror:
+    """Local copy of HubSpot contacts used for offline donor matching."""
+
+    def __init__(self, app):
+        self.app = app
+        self.hubspot = HubSpotClient()
+        self._index = None
+        self._index_version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        with self.app.app_context():
+            return db.session.query(
+                func.count(HubSpotContact.id), func.max(HubSpotContact.synced_at)
+            ).one()
+
+    def get_index(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._index is None or now - self._checked_at > Config.CONTACT_INDEX_REFRESH_SECONDS:
+                version = tuple(self._current_version())
+                if self._index is None or version != self._index_version:
+                    with self.app.app_context():
+                        contacts = HubSpotContact.query.all()
+                        for contact in contacts:
+                            db.session.expunge(contact)
+                    self._index = ContactIndex(contacts)
+                    self._index_version = version
+                self._checked_at = now
+            return self._index
+
+    def is_ready(self):
+        return Config.CONTACT_MIRROR_ENABLED and len(self.get_index()) > 0
+    
+    def is_configured(self):
+        return self.is_ready()
+
+    def search_contacts(self, name, zip_code=None, limit=20):
+        if not name:
+            return []
+        candidates = self.get_index().candidates(name, zip_code)
+        scored = self.hubspot._score_matches(
+            [_as_search_result(contact) for contact in candidates], name, zip_code
+        )
+        return scored[:limit]
+
+    def match_bulk(self, queries, top_k=5):
+        """Score a whole batch of checks against every mirrored contact at once."""
+        return bulk_match(queries, self.get_index().match_pool, top_k=top_k)
+    
+    def sync(self, full=False):
+        """Pull contacts modified since the last sync (or all of them)."""
+        with self.app.app_context():
+            since = None
+            if not full:
+                since = db.session.query(func.max(HubSpotContact.hs_lastmodified)).scalar()
+
+            synced = 0
+            page = []
+            for contact in self.hubspot.iter_contacts(modified_since=since):
+                page.append(contact)
+                if len(page) >= 500:
+                    synced += self._upsert(page)
+                    page = []
+            if page:
+                synced += self._upsert(page)
+
+        with self._lock:
+            self._checked_at = 0.0
+        return synced
+
+    def _upsert(self, contacts):
+        now = datetime.utcnow()
+        existing = {
+            c.id: c for c in HubSpotContact.query.filter(
+                HubSpotContact.id.in_([str(c['id']) for c in contacts])
+            )
+        }
+        for data in contacts:
+            props = data.get('properties', {})
+            contact = existing.get(str(data['id']))
+            if contact is None:
+                contact = HubSpotContact(id=str(data['id']))
+                db.session.add(contact)
+            name_tokens = normalize_name(props.get('firstname')).split()
+            last_tokens = normalize_name(props.get('lastname')).split()
+            contact.firstname = props.get('firstname')
+            contact.lastname = props.get('lastname')
+            contact.email = props.get('email')
+            contact.address = props.get('address')
+            contact.city = props.get('city')
+            contact.state = props.get('state')
+            contact.zip = props.get('zip')
+            contact.zip5 = zip5(props.get('zip'))
+            contact.name_key = ' '.join(name_tokens + last_tokens)
+            contact.first_soundex = soundex(name_tokens[0]) if name_tokens else None
+            contact.last_soundex = soundex(last_tokens[-1]) if last_tokens else None
+            contact.hs_lastmodified = _parse_timestamp(props.get('lastmodifieddate'))
+            contact.synced_at = now
+        db.session.commit()
+        return len(contacts)
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_contact_mirror(app):
+    global _mirror
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = ContactMirror(app)
+        return _mirror
+
+
+def get_contact_searcher(app):
+    """The mirror once it has been synced, otherwise the live HubSpot API."""
+    if Config.CONTACT_MIRROR_ENABLED:
+        mirror = get_contact_mirror(app)
+        if mirror.is_ready():
+            return mirror
+    return HubSpotClient()
@@ -0,0 +1,139 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from PIL import Image
+from sqlalchemy import or_
+
+from app import db
+from app.metrics import stage_timer
+from app.models import Check, CheckFingerprint
+from config import Config
+
+# dHash: one bit per horizontal brightness step on a 9x8 thumbnail. Rescans of
+# the same check differ in noise, exposure and compression but keep the same
+# coarse gradients, so their hashes are a few bits apart.
+HASH_SIZE = 8
+
+# The 64 bits are indexed as four 16-bit bands. Two hashes within 3 bits of
+# each other must agree on at least one whole band, so an equality lookup per
+# band finds every such neighbour without scanning the table.
+BAND_BITS = 16
+BANDS = 64 // BAND_BITS
+BAND_COLUMNS = [getattr(CheckFingerprint, f'band{i}') for i in range(BANDS)]
+
+# Band collisions are rare (roughly BANDS / 65536 per stored check); this only
+# guards against pathological hashes such as blank images.
+MAX_CANDIDATES = 500
+
+
+def image_hash(image):
+    """64-bit dHash of a page image as a 16-character hex string."""
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('L')
+    small = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX).convert('L')
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f'{value:016x}'
+
+
+def hash_bands(hash_hex):
+    value = int(hash_hex, 16)
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def _number(check_number):
+    return re.sub(r'\D', '', check_number or '').lstrip('0') or None
+
+
+def _amount(amount):
+    if amount in (None, ''):
+        return None
+    try:
+        return Decimal(str(amount)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+
+
+def fingerprint_key(amount, check_number, check_date):
+    """``amount|number|date`` when all three were read, else None."""
+    amount = _amount(amount)
+    number = _number(check_number)
+    if amount is None or number is None or not check_date:
+        return None
+    date = check_date.isoformat() if hasattr(check_date, 'isoformat') else str(check_date)
+    return f'{amount}|{number}|{date}'
+
+
+def _compatible(a, b):
+    return a is None or b is None or a == b
+
+
+def find_duplicate(check, hash_hex):
+    """Id of the earliest stored check that is likely the same physical check, or None.
+
+    Same amount, check number and date is a duplicate. A near-identical image
+    is one too, unless the amount or the check number read differently
+    (monthly donors send near-identical checks from the same check stock).
+    """
+    key = fingerprint_key(check.amount, check.check_number, check.check_date)
+    clauses = []
+    if key:
+        clauses.append(CheckFingerprint.dup_key == key)
+    if hash_hex:
+        clauses += [column == band for column, band in zip(BAND_COLUMNS, hash_bands(hash_hex))]
+    if not clauses:
+        return None
+
+    rows = (
+        db.session.query(CheckFingerprint.check_id, CheckFingerprint.dup_key, CheckFingerprint.image_hash,
+                         Check.amount, Check.check_number)
+        .join(Check, Check.id == CheckFingerprint.check_id)
+        .filter(or_(*clauses))
+        .order_by(CheckFingerprint.check_id)
+        .limit(MAX_CANDIDATES)
+        .all()
+    )
+    amount = _amount(check.amount)
+    number = _number(check.check_number)
+    for row in rows:
+        if key and row.dup_key == key:
+            return row.check_id
+        if (hash_hex and row.image_hash
+                and hamming(hash_hex, row.image_hash) <= Config.DUPLICATE_HASH_DISTANCE
+                and _compatible(amount, _amount(row.amount))
+                and _compatible(number, _number(row.check_number))):
+            return row.check_id
+    return None
+
+
+def set_fingerprint(check, hash_hex=None):
+    """Create or refresh ``check.fingerprint`` from its current fields (saved with the check)."""
+    fingerprint = check.fingerprint
+    if fingerprint is None:
+        fingerprint = check.fingerprint = CheckFingerprint()
+    if hash_hex:
+        fingerprint.image_hash = hash_hex
+        for i, band in enumerate(hash_bands(hash_hex)):
+            setattr(fingerprint, f'band{i}', band)
+    fingerprint.dup_key = fingerprint_key(check.amount, check.check_number, check.check_date)
+    return fingerprint
+
+
+def flag_duplicate(check, hash_hex):
+    """Point ``check`` at an earlier copy of itself, if any, and index it for later ones."""
+    with stage_timer('dedupe'):
+        original_id = find_duplicate(check, hash_hex)
+        if original_id is not None:
+            check.duplicate_of_id = original_id
+            check.needs_review = True
+        set_fingerprint(check, hash_hex)
+    return original_id
@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from app.models import Batch, Check
+
+EXPORT_COLUMNS = [
+    'batch_id', 'batch_filename', 'appeal_code', 'upload_date',
+    'check_id', 'page_number', 'amount', 'check_date', 'check_number', 'is_money_order',
+    'name', 'address_line1', 'address_line2', 'city', 'state', 'zip_code',
+    'hubspot_contact_id', 'hubspot_contact_name', 'match_confidence',
+    'hubspot_deal_id', 'needs_review',
+]
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export_row(check, batch):
+    return {
+        'batch_id': batch.id,
+        'batch_filename': batch.filename,
+        'appeal_code': batch.appeal_code,
+        'upload_date': batch.upload_date.isoformat() if batch.upload_date else None,
+        'check_id': check.id,
+        'page_number': check.page_number,
+        'amount': f'{check.amount:.2f}' if check.amount is not None else None,
+        'check_date': check.check_date.isoformat() if check.check_date else None,
+        'check_number': check.check_number,
+        'is_money_order': bool(check.is_money_order),
+        'name': check.name,
+        'address_line1': check.address_line1,
+        'address_line2': check.address_line2,
+        'city': check.city,
+        'state': check.state,
+        'zip_code': check.zip_code,
+        'hubspot_contact_id': check.hubspot_contact_id,
+        'hubspot_contact_name': check.hubspot_contact_name,
+        'match_confidence': check.match_confidence,
+        'hubspot_deal_id': check.hubspot_deal_id,
+        'needs_review': bool(check.needs_review),
+    }
+
+
+def parse_date_range(start=None, end=None):
+    """Turn inclusive ``YYYY-MM-DD`` bounds into ``(start, exclusive_end)`` datetimes."""
+    start_at = datetime.strptime(start, '%Y-%m-%d') if start else None
+    end_at = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    return start_at, end_at
+
+
+def export_filename(label, fmt):
+    return f"checks_{label}.{fmt}"
+
+
+def checks_query(batch_ids=None, start=None, end=None):
+    """Checks joined to their batch, optionally limited to batches or an upload-date range.
+
+    ``end`` is exclusive.
+    """
+    query = (
+        Check.query.join(Batch, Check.batch_id == Batch.id)
+        .with_entities(Check, Batch)
+        .order_by(Check.batch_id, Check.page_number, Check.id)
+    )
+    if batch_ids is not None:
+        query = query.filter(Check.batch_id.in_(list(batch_ids)))
+    if start is not None:
+        query = query.filter(Batch.upload_date >= start)
+    if end is not None:
+        query = query.filter(Batch.upload_date < end)
+    return query
+
+
+def iter_rows(query, chunk_size=1000):
+    # Server-side cursor: rows are fetched chunk_size at a time instead of
+    # the driver loading the whole result set into memory first.
+    query = query.execution_options(stream_results=True)
+    for check, batch in query.yield_per(chunk_size):
+        yield export_row(check, batch)
+
+
+def buffered(chunks, size=64 * 1024):
+    """Join small string chunks into writes of roughly ``size`` characters."""
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= size:
+            yield ''.join(pending)
+            pending = []
+            pending_size = 0
+    if pending:
+        yield ''.join(pending)
+
+
+def iter_csv(rows):
+    """Yield CSV text one row at a time, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def iter_export(rows, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return iter_csv(rows) if fmt == 'csv' else iter_jsonl(rows)
+
+
+def format_for_path(path, default='csv'):
+    if path.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if path.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def write_export(path, rows, fmt=None):
+    """Write rows to ``path`` and return the number of rows written."""
+    fmt = fmt or format_for_path(path)
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for chunk in buffered(iter_export(counted(), fmt)):
+            f.write(chunk)
+    return count
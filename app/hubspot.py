@@ -1,23 +1,185 @@
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
 import requests
-from fuzzywuzzy import fuzz
+from requests.adapters import HTTPAdapter
 from config import Config
+from app.cache import TTLCache
+from app.ratelimit import TokenBucket, DailyQuota, CircuitBreaker
+from app.matching import bulk_match, contact_from_hubspot, normalize_name, zip5
+from app.metrics import HUBSPOT_ERRORS, HUBSPOT_SECONDS
+
+_session = None
+_session_lock = threading.Lock()
+
+# Scored search results for repeat donors, shared by all clients in the process
+_search_cache = TTLCache(
+    maxsize=Config.CONTACT_CACHE_SIZE,
+    ttl=Config.CONTACT_CACHE_TTL_SECONDS
+)
+
+def _search_cache_key(name, zip_code):
+    return (normalize_name(name), zip5(zip_code) or '')
+
+def search_cache_stats():
+    return _search_cache.stats()
+
+# Process-wide limits so every thread shares one view of HubSpot's quotas.
+# The CRM search endpoints have their own, lower per-second limit.
+_rate_limiter = TokenBucket(Config.HUBSPOT_RATE_PER_SECOND)
+_search_rate_limiter = TokenBucket(Config.HUBSPOT_SEARCH_RATE_PER_SECOND)
+_daily_quota = DailyQuota(Config.HUBSPOT_DAILY_LIMIT)
+_circuit = CircuitBreaker(
+    failure_threshold=Config.HUBSPOT_CIRCUIT_FAILURES,
+    reset_timeout=Config.HUBSPOT_CIRCUIT_RESET_SECONDS
+)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+SUBMISSION_KEY_PATTERN = re.compile(r'Submission Key: (\w+)')
+
+
+def _submission_key_from(description):
+    match = SUBMISSION_KEY_PATTERN.search(description or '')
+    return match.group(1) if match else None
+
+
+class HubSpotUnavailable(Exception):
+    pass
+
+def get_session():
+    # One keep-alive connection pool per process, shared by every client and
+    # thread, so concurrent contact searches reuse TLS connections.
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=Config.HUBSPOT_POOL_SIZE,
+                pool_maxsize=Config.HUBSPOT_POOL_SIZE
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def _endpoint_label(method, url, base_url):
+    # Collapse ids so each endpoint is one metric series.
+    path = url[len(base_url):] if url.startswith(base_url) else url
+    return f"{method} " + re.sub(r'/\d+(?=/|$)', '/{id}', path.split('?')[0])
+
 
 class HubSpotClient:
     def __init__(self):
         self.api_key = Config.HUBSPOT_API_KEY
-        self.base_url = "https://api.hubapi.com"
+        self.base_url = Config.HUBSPOT_BASE_URL.rstrip('/')
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        self.session = get_session()
     
     def is_configured(self):
         return bool(self.api_key)
     
+    def _request(self, method, url, timeout=10, **kwargs):
+        """Send a request through the shared rate limiter, with retries.
+        
+        429s honour Retry-After and pause the shared bucket so every thread
+        backs off together; 5xx responses and connection errors are retried
+        with jittered exponential backoff and feed the circuit breaker.
+        Returns the final response, or raises HubSpotUnavailable when the
+        circuit is open or the daily quota is spent.
+        """
+        limiter = _search_rate_limiter if url.endswith('/search') else _rate_limiter
+        attempts = Config.HUBSPOT_MAX_RETRIES + 1
+        endpoint = _endpoint_label(method, url, self.base_url)
+        
+        for attempt in range(attempts):
+            if not _circuit.allow():
+                HUBSPOT_ERRORS.inc(endpoint=endpoint, reason='circuit_open')
+                raise HubSpotUnavailable("HubSpot circuit breaker is open")
+            if not _daily_quota.consume():
+                HUBSPOT_ERRORS.inc(endpoint=endpoint, reason='daily_quota')
+                raise HubSpotUnavailable("HubSpot daily API limit reached")
+            limiter.acquire()
+            
+            last_attempt = attempt == attempts - 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, url,
+                    timeout=(Config.HUBSPOT_CONNECT_TIMEOUT, timeout),
+                    **kwargs
+                )
+            except requests.RequestException:
+                HUBSPOT_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status='error')
+                HUBSPOT_ERRORS.inc(endpoint=endpoint, reason='connection')
+                _circuit.record_failure()
+                if last_attempt:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            HUBSPOT_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status=response.status_code)
+            if response.status_code >= 400:
+                HUBSPOT_ERRORS.inc(endpoint=endpoint, reason=str(response.status_code))
+            
+            if response.status_code == 429:
+                _circuit.record_success()
+                delay = self._retry_after(response) or self._backoff(attempt)
+                limiter.pause(delay)
+                if last_attempt:
+                    return response
+                time.sleep(delay)
+                continue
+            
+            if response.status_code in RETRYABLE_STATUSES:
+                _circuit.record_failure()
+                if last_attempt:
+                    return response
+                time.sleep(self._backoff(attempt))
+                continue
+            
+            _circuit.record_success()
+            return response
+    
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying threads from re-synchronising.
+        ceiling = min(Config.HUBSPOT_BACKOFF_MAX_SECONDS, Config.HUBSPOT_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return random.uniform(0, ceiling)
+    
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return None
+    
     def search_contacts(self, name, zip_code=None):
         if not self.is_configured():
             return []
         
+        key = _search_cache_key(name, zip_code)
+        found, cached = _search_cache.get(key)
+        if found:
+            return [dict(match) for match in cached]
+        
+        matches = self._search_contacts_uncached(name, zip_code)
+        if matches is None:
+            return []
+        
+        _search_cache.set(key, matches)
+        return [dict(match) for match in matches]
+    
+    def invalidate_search(self, name, zip_code=None):
+        _search_cache.invalidate(_search_cache_key(name, zip_code))
+    
+    def _search_contacts_uncached(self, name, zip_code):
+        # Returns None on failure so errors are never cached as "no match".
         try:
             name_parts = name.split() if name else []
             firstname = name_parts[0] if name_parts else ""
@@ -37,7 +199,8 @@ class HubSpotClient:
                 "limit": 20
             }
             
-            response = requests.post(
+            response = self._request(
+                'POST',
                 f"{self.base_url}/crm/v3/objects/contacts/search",
                 headers=self.headers,
                 json=search_payload,
@@ -49,60 +212,45 @@ class HubSpotClient:
                 return self._score_matches(results, name, zip_code)
             else:
                 print(f"HubSpot search error: {response.status_code} - {response.text}")
-                return []
+                return None
                 
         except Exception as e:
             print(f"HubSpot API error: {e}")
-            return []
+            return None
     
     def _score_matches(self, contacts, search_name, search_zip):
-        scored_contacts = []
+        candidates = [contact_from_hubspot(contact) for contact in contacts]
+        query = {'name': search_name, 'zip_code': search_zip}
+        return bulk_match([query], candidates, top_k=len(candidates))[0]
+    
+    def _deal_properties(self, check_data, appeal_code):
+        amount = float(check_data.get('amount', 0))
+        name = check_data.get('name', 'Unknown')
         
-        for contact in contacts:
-            props = contact.get('properties', {})
-            
-            contact_name = f"{props.get('firstname', '')} {props.get('lastname', '')}".strip()
-            
-            name_score = fuzz.ratio(search_name.lower(), contact_name.lower()) / 100.0 if search_name and contact_name else 0
-            
-            zip_score = 1.0 if search_zip and props.get('zip') == search_zip else 0.5
-            
-            combined_score = (name_score * 0.7) + (zip_score * 0.3)
-            
-            scored_contacts.append({
-                'id': contact.get('id'),
-                'name': contact_name,
-                'email': props.get('email', ''),
-                'address': props.get('address', ''),
-                'city': props.get('city', ''),
-                'state': props.get('state', ''),
-                'zip': props.get('zip', ''),
-                'confidence': round(combined_score, 2)
-            })
-        
-        scored_contacts.sort(key=lambda x: x['confidence'], reverse=True)
-        return scored_contacts
+        description = f"Appeal Code: {appeal_code}\nCheck #: {check_data.get('check_number', 'N/A')}"
+        if check_data.get('submission_key'):
+            description += f"\nSubmission Key: {check_data['submission_key']}"
+        
+        return {
+            "dealname": f"Donation - ${amount:.2f} - {name}",
+            "amount": str(amount),
+            "dealstage": "closedwon",
+            "pipeline": "default",
+            "closedate": check_data.get('check_date', ''),
+            "description": description
+        }
     
     def create_deal(self, check_data, contact_id, appeal_code):
         if not self.is_configured():
             return None
         
         try:
-            amount = float(check_data.get('amount', 0))
-            name = check_data.get('name', 'Unknown')
-            
             deal_payload = {
-                "properties": {
-                    "dealname": f"Donation - ${amount:.2f} - {name}",
-                    "amount": str(amount),
-                    "dealstage": "closedwon",
-                    "pipeline": "default",
-                    "closedate": check_data.get('check_date', ''),
-                    "description": f"Appeal Code: {appeal_code}\nCheck #: {check_data.get('check_number', 'N/A')}"
-                }
+                "properties": self._deal_properties(check_data, appeal_code)
             }
             
-            response = requests.post(
+            response = self._request(
+                'POST',
                 f"{self.base_url}/crm/v3/objects/deals",
                 headers=self.headers,
                 json=deal_payload,
@@ -127,7 +275,8 @@ class HubSpotClient:
     
     def _associate_deal_to_contact(self, deal_id, contact_id):
         try:
-            response = requests.put(
+            response = self._request(
+                'PUT',
                 f"{self.base_url}/crm/v3/objects/deals/{deal_id}/associations/contacts/{contact_id}/deal_to_contact",
                 headers=self.headers,
                 timeout=10
@@ -137,12 +286,281 @@ class HubSpotClient:
             print(f"Association error: {e}")
             return False
     
+    def create_deals_batch(self, items, appeal_code):
+        """Create deals through HubSpot's batch endpoints.
+        
+        ``items`` is a list of ``(key, check_data, contact_id)`` tuples; the
+        result maps each key to ``{'deal_id': ..., 'error': ..., 'associated': ...}``
+        where ``associated`` is None when there was no contact to associate.
+        """
+        results = {}
+        if not self.is_configured():
+            for key, _, _ in items:
+                results[key] = {'deal_id': None, 'error': 'HubSpot not configured'}
+            return results
+        
+        chunk_size = Config.HUBSPOT_BATCH_SIZE
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            created = self._batch_create_deals(chunk, appeal_code)
+            results.update(created)
+            
+            associations = []
+            for key, _, contact_id in chunk:
+                deal_id = created[key]['deal_id']
+                created[key].setdefault('associated', None)
+                if deal_id and contact_id:
+                    associations.append((key, deal_id, contact_id))
+            
+            if associations:
+                failed = set(self._batch_associate_deals(associations))
+                for key, _, _ in associations:
+                    results[key]['associated'] = key not in failed
+                    if key in failed:
+                        results[key]['error'] = 'Deal created but contact association failed'
+        
+        return results
+    
+    def associate_deals(self, associations):
+        """Associate existing deals to contacts; ``associations`` is a list of
+        ``(key, deal_id, contact_id)`` and the keys that failed are returned."""
+        if not self.is_configured():
+            return [key for key, _, _ in associations]
+        failed = []
+        chunk_size = Config.HUBSPOT_BATCH_SIZE
+        for start in range(0, len(associations), chunk_size):
+            failed += self._batch_associate_deals(associations[start:start + chunk_size])
+        return failed
+    
+    def _batch_create_deals(self, chunk, appeal_code):
+        results = {}
+        inputs = []
+        for key, check_data, _ in chunk:
+            try:
+                properties = self._deal_properties(check_data, appeal_code)
+            except (TypeError, ValueError) as e:
+                results[key] = {'deal_id': None, 'error': f'Invalid deal data: {e}'}
+                continue
+            inputs.append({"properties": properties, "objectWriteTraceId": str(key)})
+        
+        if not inputs:
+            return results
+        
+        trace_ids = [item['objectWriteTraceId'] for item in inputs]
+        keys_by_trace = {str(key): key for key, _, _ in chunk}
+        
+        try:
+            response = self._request(
+                'POST',
+                f"{self.base_url}/crm/v3/objects/deals/batch/create",
+                headers=self.headers,
+                json={"inputs": inputs},
+                timeout=30
+            )
+        except Exception as e:
+            print(f"Batch deal creation error: {e}")
+            for trace_id in trace_ids:
+                results[keys_by_trace[trace_id]] = {'deal_id': None, 'error': str(e)}
+            return results
+        
+        if response.status_code not in (200, 201, 207):
+            print(f"Batch deal creation error: {response.status_code} - {response.text}")
+            for trace_id in trace_ids:
+                results[keys_by_trace[trace_id]] = {
+                    'deal_id': None,
+                    'error': f'HubSpot returned {response.status_code}'
+                }
+            return results
+        
+        body = response.json()
+        
+        failed = {}
+        for error in body.get('errors', []):
+            context = error.get('context') or {}
+            for trace_id in context.get('objectWriteTraceId', []):
+                failed[trace_id] = error.get('message', 'Failed to create deal')
+        
+        # HubSpot does not promise results in input order, so each result is
+        # tied to its input by the echoed objectWriteTraceId or, failing that,
+        # by the submission key written into the description. A deal that
+        # can't be tied to its check is left unknown: the next run finds it
+        # by submission key rather than guessing here.
+        traces_by_submission_key = {}
+        for key, check_data, _ in chunk:
+            if check_data.get('submission_key') and str(key) in trace_ids:
+                traces_by_submission_key[check_data['submission_key']] = str(key)
+        unmatched = 0
+        for deal in body.get('results', []):
+            trace_id = deal.get('objectWriteTraceId')
+            if trace_id not in keys_by_trace:
+                trace_id = traces_by_submission_key.get(
+                    _submission_key_from((deal.get('properties') or {}).get('description')))
+            if trace_id in keys_by_trace and keys_by_trace[trace_id] not in results:
+                results[keys_by_trace[trace_id]] = {'deal_id': deal.get('id'), 'error': None}
+            else:
+                unmatched += 1
+        
+        for trace_id in trace_ids:
+            key = keys_by_trace[trace_id]
+            if key in results:
+                continue
+            if trace_id in failed:
+                results[key] = {'deal_id': None, 'error': failed[trace_id]}
+            elif unmatched:
+                results[key] = {'deal_id': None, 'unknown': True,
+                                'error': 'HubSpot created a deal that could not be matched to this check; '
+                                         'submit again to confirm it'}
+            else:
+                results[key] = {'deal_id': None, 'error': 'Failed to create deal'}
+        
+        return results
+    
+    def _batch_associate_deals(self, associations):
+        """Associate deals to contacts in one call; returns the keys that failed."""
+        inputs = [
+            {"from": {"id": str(deal_id)}, "to": {"id": str(contact_id)}}
+            for _, deal_id, contact_id in associations
+        ]
+        all_keys = [key for key, _, _ in associations]
+        
+        try:
+            response = self._request(
+                'POST',
+                f"{self.base_url}/crm/v4/associations/deals/contacts/batch/associate/default",
+                headers=self.headers,
+                json={"inputs": inputs},
+                timeout=30
+            )
+        except Exception as e:
+            print(f"Batch association error: {e}")
+            return all_keys
+        
+        if response.status_code in (200, 201):
+            return []
+        
+        if response.status_code != 207:
+            print(f"Batch association error: {response.status_code} - {response.text}")
+            return all_keys
+        
+        keys_by_deal = {str(deal_id): key for key, deal_id, _ in associations}
+        failed = []
+        for error in response.json().get('errors', []):
+            context = error.get('context') or {}
+            for deal_id in context.get('fromObjectId', []) or context.get('ids', []):
+                if str(deal_id) in keys_by_deal:
+                    failed.append(keys_by_deal[str(deal_id)])
+        return failed
+    
+    def find_deal_by_submission_key(self, submission_key):
+        """Deal id carrying this submission key, or None if HubSpot has none.
+        
+        Raises when the search itself fails, so a deal that may exist is never
+        mistaken for one that doesn't.
+        """
+        if not self.is_configured() or not submission_key:
+            return None
+        
+        response = self._request(
+            'POST',
+            f"{self.base_url}/crm/v3/objects/deals/search",
+            headers=self.headers,
+            json={
+                "filterGroups": [{"filters": [{
+                    "propertyName": "description",
+                    "operator": "CONTAINS_TOKEN",
+                    "value": submission_key
+                }]}],
+                "properties": ["dealname", "description"],
+                "limit": 1
+            },
+            timeout=10
+        )
+        response.raise_for_status()
+        results = response.json().get('results', [])
+        return results[0].get('id') if results else None
+    
+    def iter_contacts(self, modified_since=None):
+        """Yield raw contact records, optionally only those modified since a datetime.
+        
+        Raises on HTTP errors so a failed sync is not mistaken for an empty one.
+        """
+        properties = ["firstname", "lastname", "address", "city", "state", "zip", "email", "lastmodifieddate"]
+        
+        if modified_since is None:
+            after = None
+            while True:
+                params = {"limit": 100, "properties": ",".join(properties)}
+                if after:
+                    params["after"] = after
+                response = self._request(
+                    'GET',
+                    f"{self.base_url}/crm/v3/objects/contacts",
+                    headers=self.headers,
+                    params=params,
+                    timeout=30
+                )
+                response.raise_for_status()
+                body = response.json()
+                yield from body.get('results', [])
+                after = (body.get('paging') or {}).get('next', {}).get('after')
+                if not after:
+                    return
+        
+        # The search API stops paging at 10,000 results, so restart the query
+        # from the newest modification time seen whenever a window fills up.
+        if modified_since.tzinfo is None:
+            modified_since = modified_since.replace(tzinfo=timezone.utc)
+        since_ms = int(modified_since.timestamp() * 1000)
+        seen = set()
+        while True:
+            after = None
+            window_count = 0
+            newest_ms = since_ms
+            while True:
+                payload = {
+                    "filterGroups": [{"filters": [{
+                        "propertyName": "lastmodifieddate",
+                        "operator": "GTE",
+                        "value": str(since_ms)
+                    }]}],
+                    "sorts": [{"propertyName": "lastmodifieddate", "direction": "ASCENDING"}],
+                    "properties": properties,
+                    "limit": 100
+                }
+                if after:
+                    payload["after"] = after
+                response = self._request(
+                    'POST',
+                    f"{self.base_url}/crm/v3/objects/contacts/search",
+                    headers=self.headers,
+                    json=payload,
+                    timeout=30
+                )
+                response.raise_for_status()
+                body = response.json()
+                for contact in body.get('results', []):
+                    window_count += 1
+                    modified = (contact.get('properties') or {}).get('lastmodifieddate')
+                    if modified:
+                        modified_ms = int(datetime.fromisoformat(modified.replace('Z', '+00:00')).timestamp() * 1000)
+                        newest_ms = max(newest_ms, modified_ms)
+                    if contact.get('id') not in seen:
+                        seen.add(contact.get('id'))
+                        yield contact
+                after = (body.get('paging') or {}).get('next', {}).get('after')
+                if not after:
+                    break
+            if window_count < 10000 or newest_ms == since_ms:
+                return
+            since_ms = newest_ms
+    
     def get_contact(self, contact_id):
         if not self.is_configured():
             return None
         
         try:
-            response = requests.get(
+            response = self._request(
+                'GET',
                 f"{self.base_url}/crm/v3/objects/contacts/{contact_id}",
                 headers=self.headers,
                 params={"properties": "firstname,lastname,email,address,city,state,zip"},
@@ -0,0 +1,167 @@
+import hashlib
+import io
+import os
+import time
+from collections import namedtuple
+
+from PIL import Image, ImageChops
+
+from app.images import FORMATS, VARIANTS, derivative_key, prerender_derivatives
+from config import Config
+
+# Page images live under store/<aa>/<sha256>.png in blob storage; those keys
+# are what Check.check_image_path / buckslip_image_path hold.
+STORE_DIR = 'store'
+
+StoredImage = namedtuple('StoredImage', ['path', 'created', 'image'])
+
+
+def is_store_path(path):
+    return bool(path) and path.startswith(STORE_DIR + '/')
+
+
+def compact_image(image, grayscale=False):
+    """Smallest lossless mode for a page: 1-bit if it is pure black and white,
+    grayscale if it has no colour (or ``grayscale`` is set), RGB otherwise."""
+    if image.mode not in ('1', 'L', 'RGB'):
+        image = image.convert('RGB')
+    if image.mode == 'RGB':
+        if grayscale:
+            image = image.convert('L')
+        else:
+            red, green, blue = image.split()
+            if (ImageChops.difference(red, green).getbbox() is None
+                    and ImageChops.difference(green, blue).getbbox() is None):
+                image = red
+    if image.mode == 'L':
+        colors = image.getcolors(2)
+        if colors is not None and all(value in (0, 255) for _, value in colors):
+            image = image.convert('1', dither=Image.Dither.NONE)
+    return image
+
+
+def pixel_digest(image):
+    digest = hashlib.sha256(f'{image.mode}:{image.width}x{image.height}:'.encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ImageStore:
+    """Content-addressed page images with reference counting through checks.
+
+    A page is written once no matter how many batches contain it (re-uploads
+    of the same PDF reuse every image). Files are only deleted once no check
+    row points at them and they have not been touched for
+    IMAGE_STORE_GRACE_HOURS, so a batch still being processed never loses a
+    page another batch is releasing.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def key(self, digest):
+        return f'{STORE_DIR}/{digest[:2]}/{digest}.png'
+
+    def put(self, image):
+        """Store ``image`` and return a StoredImage (key, newly written, compacted image)."""
+        compact = compact_image(image, Config.IMAGE_STORE_GRAYSCALE)
+        key = self.key(pixel_digest(compact))
+
+        modified = self.storage.modified(key)
+        if modified is not None:
+            # The grace period only has to outlast the commit of the new
+            # reference; restart it (a copy on S3) only once half has passed.
+            if modified < time.time() - Config.IMAGE_STORE_GRACE_HOURS * 1800:
+                self.storage.touch(key)
+            return StoredImage(key, False, compact)
+
+        buffer = io.BytesIO()
+        compact.save(buffer, 'PNG')
+        buffer.seek(0)
+        self.storage.write(key, buffer)
+        return StoredImage(key, True, compact)
+
+    def local_path(self, key):
+        """Context manager yielding a filesystem path for OCR engines."""
+        return self.storage.local_path(key)
+
+    def prerender(self, stored):
+        prerender_derivatives(self.storage, stored.path, stored.image)
+
+    def discard(self, key):
+        """Delete a page this caller just wrote and decided not to keep."""
+        return self._remove(key)
+
+    def release(self, paths, grace_hours=None):
+        """Delete the given store paths that no check references any more; returns ``(files, bytes)``."""
+        candidates = {path for path in paths if is_store_path(path)}
+        if not candidates:
+            return 0, 0
+        referenced = self._referenced(candidates)
+        cutoff = self._cutoff(grace_hours)
+        files = 0
+        reclaimed = 0
+        for key in candidates - referenced:
+            modified = self.storage.modified(key)
+            if modified is None or modified > cutoff:
+                continue
+            removed, size = self._remove(key)
+            files += removed
+            reclaimed += size
+        return files, reclaimed
+
+    def sweep(self, grace_hours=None):
+        """Delete every stored page no check references (pages orphaned by crashes or deletes)."""
+        cutoff = self._cutoff(grace_hours)
+        # Listed before the references are read, so pages stored in between are never candidates.
+        stored = {key for key, _, modified in self.storage.iter_keys(STORE_DIR)
+                  if key.endswith('.png') and modified <= cutoff}
+        if not stored:
+            return 0, 0
+        files = 0
+        reclaimed = 0
+        for key in stored - self._referenced():
+            removed, size = self._remove(key)
+            files += removed
+            reclaimed += size
+        return files, reclaimed
+
+    def _referenced(self, candidates=None):
+        from app import db
+        from app.models import Check
+
+        referenced = set()
+        candidates = list(candidates) if candidates is not None else None
+        for column in (Check.check_image_path, Check.buckslip_image_path):
+            if candidates is None:
+                rows = db.session.query(column).filter(column.like(f'{STORE_DIR}/%')).distinct()
+                referenced.update(path for path, in rows)
+                continue
+            for start in range(0, len(candidates), 500):
+                rows = db.session.query(column).filter(column.in_(candidates[start:start + 500])).distinct()
+                referenced.update(path for path, in rows)
+        return referenced
+
+    def _cutoff(self, grace_hours):
+        grace_hours = Config.IMAGE_STORE_GRACE_HOURS if grace_hours is None else grace_hours
+        return time.time() - grace_hours * 3600
+
+    def _remove(self, key):
+        targets = [key] + [derivative_key(variant, key, fmt) for variant in VARIANTS for fmt in FORMATS]
+        files = 0
+        reclaimed = 0
+        for target in targets:
+            size = self.storage.delete(target)
+            if size:
+                files += 1
+                reclaimed += size
+        return files, reclaimed
+
+
+def check_image_name(check, path):
+    """Path under /images/ for a check's stored image (older rows kept per-batch files)."""
+    if not path:
+        return None
+    if is_store_path(path):
+        return path
+    return f'batch_{check.batch_id}/{os.path.basename(path)}'
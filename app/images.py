@@ -0,0 +1,81 @@
+import io
+import os
+from contextlib import closing
+
+from PIL import Image
+
+from app.storage import StorageError, normalize_key
+
+# Longest edge in pixels for each derivative; 'full' is the original page.
+VARIANTS = {
+    'thumb': 480,
+    'medium': 1400,
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DERIVATIVE_DIR = '_derivatives'
+
+
+def pick_format(accept_header):
+    return 'webp' if 'image/webp' in (accept_header or '') else 'jpeg'
+
+
+def derivative_key(variant, source_key, fmt):
+    base, _ = os.path.splitext(normalize_key(source_key))
+    return f'{DERIVATIVE_DIR}/{variant}/{base}.{fmt}'
+
+
+def get_derivative(storage, variant, source_key, fmt):
+    """Return the storage key of a cached derivative, rendering it if missing or stale.
+
+    Store images are named by their content hash and never change, so any
+    derivative of one is current; others are re-rendered when the source is
+    newer. Returns None when the source image does not exist.
+    """
+    from app.image_store import is_store_path
+
+    try:
+        target = derivative_key(variant, source_key, fmt)
+        if is_store_path(normalize_key(source_key)) and storage.exists(target):
+            return target
+        source_modified = storage.modified(source_key)
+    except StorageError:
+        return None
+    if source_modified is None:
+        return None
+
+    target_modified = storage.modified(target)
+    if target_modified is not None and target_modified >= source_modified:
+        return target
+
+    with closing(storage.open(source_key)) as source, Image.open(source) as image:
+        render_derivative(image, VARIANTS[variant], fmt, storage, target)
+    return target
+
+
+def render_derivative(image, max_edge, fmt, storage, target):
+    pil_format, options = FORMATS[fmt]
+
+    # Bilevel pages would be downscaled nearest-neighbour; resample them as grayscale.
+    image = image.convert('L') if image.mode == '1' else image.copy()
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=2.0)
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB' if 'A' in image.mode or image.mode == 'P' else 'L')
+
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    buffer.seek(0)
+    storage.write(target, buffer)
+
+
+def prerender_derivatives(storage, source_key, image):
+    """Render the default (WebP) derivatives right after a page image is written."""
+    try:
+        for variant, max_edge in VARIANTS.items():
+            render_derivative(image, max_edge, 'webp', storage, derivative_key(variant, source_key, 'webp'))
+    except Exception as e:
+        print(f"Derivative rendering failed for {source_key}: {e}")
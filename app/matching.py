@@ -0,0 +1,158 @@
+import importlib.util
+import re
+
+# numpy/rapidfuzz (and the fuzzywuzzy fallback) are imported inside the
+# matchers, on the first match rather than at app start-up.
+RAPIDFUZZ_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('numpy', 'rapidfuzz'))
+
+# Original blend, used when the check has no street address/city to compare.
+NAME_WEIGHT = 0.7
+ZIP_WEIGHT = 0.3
+
+# Blend used when both the check and the contact have an address and city.
+FULL_WEIGHTS = {
+    'name': 0.55,
+    'zip': 0.2,
+    'address': 0.15,
+    'city': 0.1,
+}
+
+ZIP_MISMATCH_SCORE = 0.5
+
+# Query rows scored per cdist call; bounds memory to
+# QUERY_CHUNK x len(candidates) floats per component.
+QUERY_CHUNK = 64
+
+
+NAME_NOISE = {'mr', 'mrs', 'ms', 'miss', 'dr', 'rev', 'jr', 'sr', 'ii', 'iii', 'iv', 'and', '&'}
+
+
+def normalize_name(name):
+    tokens = re.sub(r"[^a-z\s]", ' ', (name or '').lower()).split()
+    return ' '.join(t for t in tokens if t not in NAME_NOISE)
+
+
+def zip5(zip_code):
+    digits = re.sub(r'\D', '', zip_code or '')
+    return digits[:5] if len(digits) >= 5 else None
+
+
+def contact_from_hubspot(contact):
+    props = contact.get('properties', {})
+    return {
+        'id': contact.get('id'),
+        'name': f"{props.get('firstname', '') or ''} {props.get('lastname', '') or ''}".strip(),
+        'email': props.get('email', '') or '',
+        'address': props.get('address', '') or '',
+        'city': props.get('city', '') or '',
+        'state': props.get('state', '') or '',
+        'zip': props.get('zip', '') or '',
+    }
+
+
+def _clean(value):
+    return (value or '').lower().strip()
+
+
+def bulk_match(queries, candidates, top_k=5):
+    """Score every query against every candidate and return the top matches.
+
+    ``queries`` are dicts with ``name`` and optionally ``zip_code``,
+    ``address_line1`` and ``city`` (i.e. check fields); ``candidates`` are
+    contact dicts as returned by ``contact_from_hubspot``. Returns one list
+    per query of candidate dicts with a ``confidence`` key, best first.
+    """
+    if not queries:
+        return []
+    if not candidates:
+        return [[] for _ in queries]
+
+    if not RAPIDFUZZ_AVAILABLE:
+        return [_match_one_slow(query, candidates, top_k) for query in queries]
+
+    import numpy as np
+    from rapidfuzz import fuzz as rapid_fuzz
+    from rapidfuzz.process import cdist
+
+    cand_names = [_clean(c['name']) for c in candidates]
+    cand_addresses = [_clean(c['address']) for c in candidates]
+    cand_cities = [_clean(c['city']) for c in candidates]
+    cand_zips = np.array([(c['zip'] or '').strip() for c in candidates], dtype=object)
+    cand_has_name = np.array([bool(n) for n in cand_names])
+    cand_has_location = np.array([bool(a and c) for a, c in zip(cand_addresses, cand_cities)])
+
+    results = []
+    for start in range(0, len(queries), QUERY_CHUNK):
+        chunk = queries[start:start + QUERY_CHUNK]
+
+        q_names = [_clean(q.get('name')) for q in chunk]
+        q_addresses = [_clean(q.get('address_line1')) for q in chunk]
+        q_cities = [_clean(q.get('city')) for q in chunk]
+        q_zips = np.array([(q.get('zip_code') or '').strip() for q in chunk], dtype=object)
+
+        name_scores = cdist(q_names, cand_names, scorer=rapid_fuzz.ratio, dtype=np.float32, workers=-1) / 100.0
+        name_scores *= cand_has_name[None, :]
+        name_scores *= np.array([bool(n) for n in q_names])[:, None]
+
+        zip_scores = np.where(
+            (q_zips[:, None] == cand_zips[None, :]) & (q_zips[:, None] != ''),
+            1.0, ZIP_MISMATCH_SCORE
+        ).astype(np.float32)
+
+        scores = NAME_WEIGHT * name_scores + ZIP_WEIGHT * zip_scores
+
+        q_has_location = np.array([bool(a and c) for a, c in zip(q_addresses, q_cities)])
+        if q_has_location.any():
+            address_scores = cdist(q_addresses, cand_addresses, scorer=rapid_fuzz.ratio, dtype=np.float32, workers=-1) / 100.0
+            city_scores = cdist(q_cities, cand_cities, scorer=rapid_fuzz.ratio, dtype=np.float32, workers=-1) / 100.0
+            full_scores = (
+                FULL_WEIGHTS['name'] * name_scores
+                + FULL_WEIGHTS['zip'] * zip_scores
+                + FULL_WEIGHTS['address'] * address_scores
+                + FULL_WEIGHTS['city'] * city_scores
+            )
+            use_full = q_has_location[:, None] & cand_has_location[None, :]
+            scores = np.where(use_full, full_scores, scores)
+
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, indices in enumerate(top):
+            ordered = indices[np.argsort(-scores[row, indices], kind='stable')]
+            results.append([
+                dict(candidates[i], confidence=round(float(scores[row, i]), 2))
+                for i in ordered
+            ])
+
+    return results
+
+
+def _match_one_slow(query, candidates, top_k):
+    from fuzzywuzzy import fuzz
+
+    name = _clean(query.get('name'))
+    zip_code = (query.get('zip_code') or '').strip()
+    address = _clean(query.get('address_line1'))
+    city = _clean(query.get('city'))
+
+    scored = []
+    for candidate in candidates:
+        cand_name = _clean(candidate['name'])
+        name_score = fuzz.ratio(name, cand_name) / 100.0 if name and cand_name else 0
+        zip_score = 1.0 if zip_code and (candidate['zip'] or '').strip() == zip_code else ZIP_MISMATCH_SCORE
+
+        cand_address = _clean(candidate['address'])
+        cand_city = _clean(candidate['city'])
+        if address and city and cand_address and cand_city:
+            score = (
+                FULL_WEIGHTS['name'] * name_score
+                + FULL_WEIGHTS['zip'] * zip_score
+                + FULL_WEIGHTS['address'] * fuzz.ratio(address, cand_address) / 100.0
+                + FULL_WEIGHTS['city'] * fuzz.ratio(city, cand_city) / 100.0
+            )
+        else:
+            score = NAME_WEIGHT * name_score + ZIP_WEIGHT * zip_score
+
+        scored.append(dict(candidate, confidence=round(score, 2)))
+
+    scored.sort(key=lambda x: x['confidence'], reverse=True)
+    return scored[:top_k]
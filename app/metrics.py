@@ -0,0 +1,301 @@
+import bisect
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A settable value, or one read from ``callback`` at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Metric {self.name} callback failed: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, key if isinstance(key, tuple) else (key,), None, value)
+                for key, value in values.items()]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key, {'le': repr(float(bound))}, cumulative))
+            samples.append((f'{self.name}_bucket', key, {'le': '+Inf'}, count))
+            samples.append((f'{self.name}_sum', key, None, total))
+            samples.append((f'{self.name}_count', key, None, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, key, extra, value in metric.samples():
+                lines.append(f'{name}{_format_labels(metric.labelnames, key, extra)} {float(value):g}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+PAGES = registry.register(Counter(
+    'checky_pages_processed_total', 'Pages processed', ['appeal_code']))
+BATCHES = registry.register(Counter(
+    'checky_batches_processed_total', 'Batches finished processing', ['status']))
+STAGE_SECONDS = registry.register(Histogram(
+    'checky_stage_seconds', 'Time spent per pipeline stage (per page or per check)', ['stage']))
+OCR_OUTCOMES = registry.register(Counter(
+    'checky_ocr_engine_total', 'Which OCR result was used for a page', ['outcome']))
+HUBSPOT_SECONDS = registry.register(Histogram(
+    'checky_hubspot_request_seconds', 'HubSpot API latency per attempt', ['endpoint', 'status']))
+HUBSPOT_ERRORS = registry.register(Counter(
+    'checky_hubspot_errors_total', 'HubSpot failures by kind', ['endpoint', 'reason']))
+
+
+def _search_cache_stats():
+    from app.hubspot import search_cache_stats
+    stats = search_cache_stats()
+    return {(name,): stats[name] for name in ('hits', 'misses', 'size', 'hit_rate')}
+
+
+def _scheduler_depth():
+    from app import scheduler
+    current = scheduler._scheduler
+    if current is None:
+        return {('waiting',): 0, ('active',): 0, ('page_queue',): 0}
+    with current._cond:
+        return {
+            ('waiting',): len(current._waiting),
+            ('active',): len(current._active),
+            ('page_queue',): sum(len(q) for q in current._page_queues.values()),
+        }
+
+
+registry.register(Gauge(
+    'checky_contact_search_cache', 'HubSpot contact search cache counters', ['stat'],
+    callback=_search_cache_stats))
+registry.register(Gauge(
+    'checky_queue_depth', 'Batches waiting/active and pages queued on the scheduler', ['queue'],
+    callback=_scheduler_depth))
+
+
+# Per-batch stage totals, summarized onto Batch.stage_timings when the batch finishes.
+_local = threading.local()
+_batch_timings = {}
+_batch_lock = threading.Lock()
+
+
+@contextmanager
+def batch_context(batch_id):
+    """Attribute stage timings recorded on this thread to ``batch_id``."""
+    previous = getattr(_local, 'batch_id', None)
+    _local.batch_id = batch_id
+    try:
+        yield
+    finally:
+        _local.batch_id = previous
+
+
+def record_stage(stage, seconds, batch_id=None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    batch_id = batch_id if batch_id is not None else getattr(_local, 'batch_id', None)
+    if batch_id is None:
+        return
+    with _batch_lock:
+        totals = _batch_timings.setdefault(batch_id, {}).setdefault(stage, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def pop_batch_timings(batch_id):
+    """Return and forget ``{stage: {count, total_s, mean_ms, max_ms}}`` for a batch."""
+    with _batch_lock:
+        totals = _batch_timings.pop(batch_id, {})
+    return {
+        stage: {
+            'count': count,
+            'total_s': round(total, 3),
+            'mean_ms': round(total / count * 1000, 1) if count else 0,
+            'max_ms': round(longest * 1000, 1),
+        }
+        for stage, (count, total, longest) in sorted(totals.items())
+    }
+
+
+def summarize_batch(batch, batch_id):
+    batch.stage_timings = json.dumps(pop_batch_timings(batch_id))
+
+
+# Opt-in profiling. Only one profiler may be active per process (Python 3.12+
+# refuses a second), so it runs on the batch's coordinating thread and only
+# one batch at a time is profiled; a batch started while another is being
+# profiled is skipped. Before 3.12 the profile covers just that thread, from
+# 3.12 it also sees the page work on the scheduler's worker threads.
+_profiles = {}
+_profiles_lock = threading.Lock()
+_profiler_slot = threading.Lock()
+
+
+def should_profile(batch_id):
+    setting = (Config.PROFILE_BATCHES or '').strip()
+    if not setting:
+        return False
+    if setting == 'all':
+        return True
+    return str(batch_id) in {part.strip() for part in setting.split(',')}
+
+
+@contextmanager
+def profiled(batch_id):
+    if not should_profile(batch_id):
+        yield
+        return
+    if not _profiler_slot.acquire(blocking=False):
+        print(f"Not profiling batch {batch_id}: another batch is being profiled")
+        yield
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # another profiler or debugger is active
+            print(f"Not profiling batch {batch_id}: {e}")
+            profiler = None
+        if profiler is None:
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with _profiles_lock:
+                _profiles[batch_id] = profiler
+    finally:
+        _profiler_slot.release()
+
+
+def write_profile(batch_id, upload_folder):
+    """Write the batch's profile to ``uploads/profiles/batch_<id>.prof``."""
+    with _profiles_lock:
+        profiler = _profiles.pop(batch_id, None)
+    if profiler is None:
+        return None
+    directory = os.path.join(upload_folder, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'batch_{batch_id}.prof')
+    pstats.Stats(profiler).dump_stats(path)
+    print(f"Wrote profile for batch {batch_id} to {path}")
+    return path
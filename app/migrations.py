@@ -0,0 +1,150 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+from app import db
+
+# Applied versions are recorded here; each migration runs once, in order, in
+# its own transaction. Run them at deploy time with `flask db-upgrade`.
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# Arbitrary key for pg_advisory_lock so concurrent deploys migrate one at a time.
+MIGRATION_LOCK_ID = 72_410_046
+
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless it exists (SQLite has no ADD COLUMN IF NOT EXISTS)."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def create_index(conn, name, table, columns):
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+
+
+def _baseline(conn):
+    # Fresh databases get the full current schema here; the steps below are
+    # no-ops for them and only fill in databases created by older releases.
+    from app import models  # noqa: F401  (registers the tables)
+    db.metadata.create_all(conn)
+
+
+def _ocr_text_columns(conn):
+    add_column(conn, 'checks', 'check_ocr_text', 'TEXT')
+    add_column(conn, 'checks', 'buckslip_ocr_text', 'TEXT')
+
+
+def _submission_tracking(conn):
+    add_column(conn, 'checks', 'submission_key', 'VARCHAR(64)')
+    add_column(conn, 'batches', 'submission_report', 'TEXT')
+
+
+def _check_version(conn):
+    add_column(conn, 'checks', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+def _source_digest(conn):
+    add_column(conn, 'batches', 'source_digest', 'VARCHAR(64)')
+    create_index(conn, 'ix_batches_source_digest', 'batches', 'source_digest')
+
+
+def _stage_timings(conn):
+    add_column(conn, 'batches', 'stage_timings', 'TEXT')
+
+
+def _retention_columns(conn):
+    add_column(conn, 'batches', 'pdf_path', 'VARCHAR(500)')
+    add_column(conn, 'batches', 'purged_date', 'TIMESTAMP')
+
+
+def _image_path_indexes(conn):
+    create_index(conn, 'ix_checks_check_image_path', 'checks', 'check_image_path')
+    create_index(conn, 'ix_checks_buckslip_image_path', 'checks', 'buckslip_image_path')
+
+
+def _check_fingerprints(conn):
+    from app.models import CheckFingerprint
+    add_column(conn, 'checks', 'duplicate_of_id', 'INTEGER REFERENCES checks (id) ON DELETE SET NULL')
+    create_index(conn, 'ix_checks_duplicate_of_id', 'checks', 'duplicate_of_id')
+    CheckFingerprint.__table__.create(conn, checkfirst=True)
+
+
+def _check_search(conn):
+    from app.search import PG_SEARCH_VECTOR, SQLITE_FTS_DDL
+    if conn.dialect.name == 'postgresql':
+        add_column(conn, 'checks', 'search_vector', f'tsvector GENERATED ALWAYS AS ({PG_SEARCH_VECTOR}) STORED')
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_checks_search_vector ON checks USING GIN (search_vector)'))
+    elif conn.dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            conn.execute(text(statement))
+
+
+def _deal_associations(conn):
+    add_column(conn, 'checks', 'hubspot_associated', 'BOOLEAN')
+
+
+def _submission_heartbeat(conn):
+    add_column(conn, 'batches', 'submission_heartbeat', 'TIMESTAMP')
+
+
+MIGRATIONS = [
+    (1, 'baseline schema', _baseline),
+    (2, 'separate check and buckslip OCR text', _ocr_text_columns),
+    (3, 'submission keys and reports', _submission_tracking),
+    (4, 'check version for optimistic locking', _check_version),
+    (5, 'batch source digest', _source_digest),
+    (6, 'batch stage timings', _stage_timings),
+    (7, 'batch PDF path and purge date', _retention_columns),
+    (8, 'check image path indexes', _image_path_indexes),
+    (9, 'duplicate check fingerprints', _check_fingerprints),
+    (10, 'full-text search over checks', _check_search),
+    (11, 'deal contact association state', _deal_associations),
+    (12, 'batch submission heartbeat', _submission_heartbeat),
+]
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version: row.applied_at for row in conn.execute(select(schema_migrations))}
+
+
+def upgrade(target=None):
+    """Apply pending migrations up to ``target`` (default: all); returns the versions applied."""
+    applied = []
+    with db.engine.connect() as conn:
+        postgres = conn.dialect.name == 'postgresql'
+        if postgres:
+            conn.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+        try:
+            done = applied_versions(conn)
+            conn.commit()
+            for version, name, migrate in MIGRATIONS:
+                if version in done or (target is not None and version > target):
+                    continue
+                with conn.begin():
+                    migrate(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()))
+                print(f"Applied migration {version:03d}: {name}")
+                applied.append(version)
+        finally:
+            if postgres:
+                conn.rollback()
+                conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+                conn.commit()
+    return applied
+
+
+def migration_status():
+    """``[(version, name, applied_at or None)]`` for every known migration."""
+    with db.engine.connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+    return [(version, name, done.get(version)) for version, name, _ in MIGRATIONS]
@@ -1,5 +1,8 @@
+import json
 from datetime import datetime
+from sqlalchemy.dialects.postgresql import JSONB
 from app import db
+from app.image_store import check_image_name
 
 class Batch(db.Model):
     __tablename__ = 'batches'
@@ -12,9 +15,23 @@ class Batch(db.Model):
     total_checks = db.Column(db.Integer, default=0)
     expected_amount = db.Column(db.Numeric(12, 2), nullable=True)
     submitted_date = db.Column(db.DateTime, nullable=True)
+    submission_report = db.Column(db.Text, nullable=True)  # JSON summary of the last submission run
+    source_digest = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the uploaded PDF
+    stage_timings = db.Column(db.Text, nullable=True)  # JSON per-stage timing summary from processing
+    pdf_path = db.Column(db.String(500), nullable=True)  # Uploaded PDF on disk, cleared once purged
+    purged_date = db.Column(db.DateTime, nullable=True)  # Images, PDF and OCR text removed by retention
+    submission_heartbeat = db.Column(db.DateTime, nullable=True)  # Last progress from the job holding status 'submitting'
     
     checks = db.relationship('Check', backref='batch', lazy=True, cascade='all, delete-orphan')
     
+    @property
+    def submission_stalled(self):
+        """'submitting' with no recent heartbeat: the job died and can be resumed."""
+        from app.submission import STALE_AFTER
+        if self.status != 'submitting':
+            return False
+        return not self.submission_heartbeat or datetime.utcnow() - self.submission_heartbeat >= STALE_AFTER
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -24,7 +41,9 @@ class Batch(db.Model):
             'status': self.status,
             'total_checks': self.total_checks,
             'expected_amount': float(self.expected_amount) if self.expected_amount else None,
-            'submitted_date': self.submitted_date.isoformat() if self.submitted_date else None
+            'submitted_date': self.submitted_date.isoformat() if self.submitted_date else None,
+            'stage_timings': json.loads(self.stage_timings) if self.stage_timings else None,
+            'purged_date': self.purged_date.isoformat() if self.purged_date else None
         }
 
 class Check(db.Model):
@@ -53,13 +72,31 @@ class Check(db.Model):
     needs_review = db.Column(db.Boolean, default=True)
 
     hubspot_deal_id = db.Column(db.String(50), nullable=True)
+    submission_key = db.Column(db.String(64), nullable=True)  # Idempotency key written into the deal
+    hubspot_associated = db.Column(db.Boolean, nullable=True)  # False: deal created, contact association still owed
 
     raw_ocr_text = db.Column(db.Text, nullable=True)
     check_ocr_text = db.Column(db.Text, nullable=True)  # Separate check OCR
     buckslip_ocr_text = db.Column(db.Text, nullable=True)  # Separate buckslip OCR
 
-    check_image_path = db.Column(db.String(500), nullable=True)
-    buckslip_image_path = db.Column(db.String(500), nullable=True)
+    # store/<aa>/<sha256>.png in the shared image store; indexed for reference counting
+    check_image_path = db.Column(db.String(500), nullable=True, index=True)
+    buckslip_image_path = db.Column(db.String(500), nullable=True, index=True)
+    
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every edit for optimistic locking
+    
+    # Earlier check that looks like the same physical check (set during processing, cleared by a reviewer)
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('checks.id', ondelete='SET NULL'), nullable=True, index=True)
+    duplicate_of = db.relationship('Check', remote_side=[id], foreign_keys=[duplicate_of_id])
+    fingerprint = db.relationship('CheckFingerprint', backref='check', uselist=False, cascade='all, delete-orphan')
+    
+    @property
+    def check_image_name(self):
+        return check_image_name(self, self.check_image_path)
+    
+    @property
+    def buckslip_image_name(self):
+        return check_image_name(self, self.buckslip_image_path)
     
     def to_dict(self):
         return {
@@ -81,6 +118,53 @@ class Check(db.Model):
             'is_money_order': self.is_money_order,
             'needs_review': self.needs_review,
             'hubspot_deal_id': self.hubspot_deal_id,
+            'hubspot_associated': self.hubspot_associated,
             'check_image_path': self.check_image_path,
-            'buckslip_image_path': self.buckslip_image_path
+            'buckslip_image_path': self.buckslip_image_path,
+            'duplicate_of_id': self.duplicate_of_id,
+            'version': self.version
         }
+
+
+class CheckFingerprint(db.Model):
+    """Duplicate-detection index for a check; kept after retention purges its images."""
+    __tablename__ = 'check_fingerprints'
+    
+    check_id = db.Column(db.Integer, db.ForeignKey('checks.id', ondelete='CASCADE'), primary_key=True)
+    image_hash = db.Column(db.String(16), nullable=True)  # 64-bit dHash of the check image, hex
+    # 16-bit slices of image_hash for near-neighbour lookup (see app.duplicates)
+    band0 = db.Column(db.Integer, nullable=True, index=True)
+    band1 = db.Column(db.Integer, nullable=True, index=True)
+    band2 = db.Column(db.Integer, nullable=True, index=True)
+    band3 = db.Column(db.Integer, nullable=True, index=True)
+    dup_key = db.Column(db.String(80), nullable=True, index=True)  # amount|check number|date
+
+
+class ProcessingStatus(db.Model):
+    __tablename__ = 'processing_status'
+
+    key = db.Column(db.String(100), primary_key=True)
+    data = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=False, default=dict)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class HubSpotContact(db.Model):
+    __tablename__ = 'hubspot_contacts'
+    
+    id = db.Column(db.String(50), primary_key=True)  # HubSpot contact id
+    firstname = db.Column(db.String(255), nullable=True)
+    lastname = db.Column(db.String(255), nullable=True)
+    email = db.Column(db.String(255), nullable=True)
+    address = db.Column(db.String(255), nullable=True)
+    city = db.Column(db.String(100), nullable=True)
+    state = db.Column(db.String(50), nullable=True)
+    zip = db.Column(db.String(20), nullable=True)
+    
+    # Match keys derived at sync time
+    name_key = db.Column(db.String(255), nullable=True)
+    first_soundex = db.Column(db.String(4), nullable=True, index=True)
+    last_soundex = db.Column(db.String(4), nullable=True, index=True)
+    zip5 = db.Column(db.String(5), nullable=True, index=True)
+    
+    hs_lastmodified = db.Column(db.DateTime, nullable=True, index=True)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,16 +1,14 @@
+import importlib.util
 import re
-import pytesseract
 from PIL import Image
 from datetime import datetime
 from dataclasses import dataclass, field
 from typing import Optional, Dict, Any, List
+from app.metrics import OCR_OUTCOMES, stage_timer
 
-try:
-    from onnxtr.io import DocumentFile
-    from onnxtr.models import ocr_predictor
-    ONNXTR_AVAILABLE = True
-except ImportError:
-    ONNXTR_AVAILABLE = False
+# pytesseract and onnxtr (which loads onnxruntime and its models) are imported
+# on first use so web processes that never run OCR do not pay for them.
+ONNXTR_AVAILABLE = importlib.util.find_spec('onnxtr') is not None
 
 @dataclass
 class OCRResult:
@@ -32,6 +30,7 @@ class OCREngine:
     def _get_predictor(self):
         if self._predictor is None and self._onnxtr_available:
             try:
+                from onnxtr.models import ocr_predictor
                 self._predictor = ocr_predictor(pretrained=True)
             except Exception as e:
                 print(f"Failed to initialize OnnxTR predictor: {e}")
@@ -43,16 +42,25 @@ class OCREngine:
         return result.text
     
     def extract_text_with_confidence(self, image_path) -> OCRResult:
-        tesseract_result = self._extract_with_tesseract(image_path)
+        with stage_timer('ocr'):
+            result, outcome = self._extract_best(image_path)
+        OCR_OUTCOMES.inc(outcome=outcome)
+        return result
+    
+    def _extract_best(self, image_path):
+        """Returns the OCR result to use and which path produced it."""
+        with stage_timer('ocr.tesseract'):
+            tesseract_result = self._extract_with_tesseract(image_path)
         
         if not self.use_dual_engine or not self._onnxtr_available:
-            return tesseract_result
+            return tesseract_result, 'tesseract_only'
         
         try:
-            onnxtr_result = self._extract_with_onnxtr(image_path)
+            with stage_timer('ocr.onnxtr'):
+                onnxtr_result = self._extract_with_onnxtr(image_path)
             
             if onnxtr_result.confidence >= self.CONFIDENCE_THRESHOLD:
-                return onnxtr_result
+                return onnxtr_result, 'onnxtr'
             
             # OnnxTR confidence below threshold - use Tesseract as fallback
             # But first compare results to flag disagreements for manual review
@@ -69,15 +77,15 @@ class OCREngine:
                         confidence=tesseract_result.confidence,
                         engine='dual',
                         needs_verification=True
-                    )
+                    ), 'dual_disagreement'
             
             # OnnxTR confidence < threshold, fall back to Tesseract
             tesseract_result.needs_verification = True  # Flag since we had to fallback
-            return tesseract_result
+            return tesseract_result, 'tesseract_fallback'
             
         except Exception as e:
             print(f"OnnxTR Error, using Tesseract result: {e}")
-            return tesseract_result
+            return tesseract_result, 'onnxtr_error'
     
     def _compare_results(self, result1: Dict, result2: Dict) -> List[str]:
         disagreements = []
@@ -105,6 +113,7 @@ class OCREngine:
         if predictor is None:
             raise Exception("OnnxTR predictor not available")
         
+        from onnxtr.io import DocumentFile
         doc = DocumentFile.from_images(image_path)
         result = predictor(doc)
         
@@ -132,6 +141,7 @@ class OCREngine:
     
     def _extract_with_tesseract(self, image_path) -> OCRResult:
         try:
+            import pytesseract
             image = Image.open(image_path)
             text = pytesseract.image_to_string(image)
             
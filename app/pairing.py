@@ -0,0 +1,59 @@
+class PagePairer:
+    """Pair bank-batch check pages with their buck slips as pages are classified.
+
+    Pages may arrive in any order (page workers finish out of order); they are
+    held only until the pages before them have arrived, then consumed in page
+    order. A check pairs with the first buck slip after it, provided no other
+    check comes first; blank backs, report headers and unreadable pages in
+    between are skipped. A check followed by another check, or by the end of
+    the batch, is emitted on its own. A buck slip with no check waiting for it
+    is an orphan and is only recorded by page number.
+
+    Each page is looked at once and dropped as soon as its pair is emitted, so
+    work is linear in the page count and memory is bounded by how far workers
+    run ahead of the slowest page.
+    """
+
+    def __init__(self, first_page=1):
+        self._next_page = first_page
+        self._arrived = {}
+        self._check = None
+        self.orphan_buckslips = []
+
+    @property
+    def pending(self):
+        """Pages held back waiting for an earlier page (plus a check awaiting its buck slip)."""
+        return len(self._arrived) + (self._check is not None)
+
+    def add(self, page_info):
+        """Consume one classified page; returns the ``(check_page, buckslip_page or None)`` pairs it completes."""
+        self._arrived[page_info['page_num']] = page_info
+        pairs = []
+        while self._next_page in self._arrived:
+            self._consume(self._arrived.pop(self._next_page), pairs)
+            self._next_page += 1
+        return pairs
+
+    def finish(self):
+        """Flush what is left once every page has been added (or some never will be)."""
+        pairs = []
+        for page_num in sorted(self._arrived):
+            self._consume(self._arrived[page_num], pairs)
+        self._arrived.clear()
+        if self._check is not None:
+            pairs.append((self._check, None))
+            self._check = None
+        return pairs
+
+    def _consume(self, page_info, pairs):
+        page_type = page_info['type']
+        if page_type == 'check':
+            if self._check is not None:
+                pairs.append((self._check, None))
+            self._check = page_info
+        elif page_type == 'buckslip':
+            if self._check is None:
+                self.orphan_buckslips.append(page_info['page_num'])
+            else:
+                pairs.append((self._check, page_info))
+                self._check = None
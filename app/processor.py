@@ -1,24 +1,78 @@
-import os
 import threading
-from pdf2image import convert_from_path
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from app import db
 from app.models import Batch, Check
 from app.ocr import OCREngine
 from app.hubspot import HubSpotClient
+from app.contacts import get_contact_searcher
+from app.scheduler import get_scheduler
+from app.image_store import ImageStore
+from app.duplicates import flag_duplicate, image_hash
+from app.pairing import PagePairer
+from app.storage import StorageError, get_storage
+from app.metrics import (BATCHES, PAGES, batch_context, pop_batch_timings, profiled, record_stage,
+                         stage_timer, summarize_batch, write_profile)
+from app.status_store import update_status, get_status
+from config import Config
 
-processing_status = {}
-status_lock = threading.Lock()
+_match_executor = None
+_match_executor_lock = threading.Lock()
 
-def update_status(batch_id, updates):
-    with status_lock:
-        if batch_id not in processing_status:
-            processing_status[batch_id] = {}
-        processing_status[batch_id].update(updates)
+def _get_match_executor():
+    global _match_executor
+    with _match_executor_lock:
+        if _match_executor is None:
+            _match_executor = ThreadPoolExecutor(
+                max_workers=Config.HUBSPOT_MATCH_WORKERS,
+                thread_name_prefix='hubspot-match'
+            )
+        return _match_executor
 
-def get_status(batch_id):
-    with status_lock:
-        return dict(processing_status.get(batch_id, {'status': 'unknown'}))
+class ContactMatchQueue:
+    """Starts a HubSpot contact search for each check as soon as it is saved,
+    so network round-trips overlap with OCR of the remaining pages."""
+    
+    def __init__(self, searcher):
+        self.searcher = searcher
+        self.enabled = searcher.is_configured()
+        # Local searchers score the whole batch in one vectorized pass at the end
+        self.bulk = hasattr(searcher, 'match_bulk')
+        self._pending = {}
+    
+    def submit(self, check):
+        if not self.enabled or not check.name:
+            return
+        if self.bulk:
+            self._pending[check.id] = {
+                'name': check.name,
+                'zip_code': check.zip_code,
+                'address_line1': check.address_line1,
+                'city': check.city
+            }
+            return
+        self._pending[check.id] = _get_match_executor().submit(
+            self.searcher.search_contacts, check.name, check.zip_code
+        )
+    
+    def __len__(self):
+        return len(self._pending)
+    
+    def results(self):
+        if self.bulk:
+            check_ids = list(self._pending)
+            matches = self.searcher.match_bulk([self._pending[i] for i in check_ids])
+            yield from zip(check_ids, matches)
+            return
+        for check_id, future in self._pending.items():
+            yield check_id, future.result()
+    
+    def cancel(self):
+        if not self.bulk:
+            for future in self._pending.values():
+                future.cancel()
+        self._pending = {}
 
 class CheckProcessor:
     def __init__(self, app):
@@ -26,46 +80,119 @@ class CheckProcessor:
         self.ocr = OCREngine()
         self.hubspot = HubSpotClient()
     
-    def process_batch(self, batch_id, pdf_path, appeal_code):
-        thread = threading.Thread(
-            target=self._process_in_background,
-            args=(batch_id, pdf_path, appeal_code)
+    @property
+    def storage(self):
+        return get_storage()
+    
+    @property
+    def image_store(self):
+        return ImageStore(self.storage)
+    
+    def process_batch(self, batch_id, pdf_path, appeal_code, page_count=None):
+        if not page_count:
+            with self.storage.local_path(pdf_path) as local_pdf:
+                page_count = self._count_pages(local_pdf)
+        update_status(batch_id, {
+            'status': 'queued',
+            'current_page': 0,
+            'total_pages': page_count or 0,
+            'checks_found': 0,
+            'message': 'Waiting for a processing slot...'
+        })
+        get_scheduler().submit_batch(
+            batch_id,
+            appeal_code,
+            page_count,
+            lambda: self._process_in_background(batch_id, pdf_path, appeal_code, page_count)
         )
-        thread.daemon = True
-        thread.start()
     
-    def _process_in_background(self, batch_id, pdf_path, appeal_code):
+    def _count_pages(self, pdf_path):
+        from pdf2image import pdfinfo_from_path
+        try:
+            return int(pdfinfo_from_path(pdf_path)['Pages'])
+        except Exception as e:
+            print(f"Could not read page count for {pdf_path}: {e}")
+            return None
+    
+    def _rasterize_page(self, pdf_path, page_num):
+        from pdf2image import convert_from_path
+        with stage_timer('rasterize'):
+            images = convert_from_path(pdf_path, dpi=300, first_page=page_num, last_page=page_num)
+        return images[0]
+    
+    def _parse(self, text, is_buckslip=False):
+        with stage_timer('parse'):
+            return self.ocr.parse_check_data(text, is_buckslip=is_buckslip)
+    
+    def _save_check(self, check):
+        with stage_timer('persist'):
+            db.session.add(check)
+            db.session.commit()
+    
+    def _process_in_background(self, batch_id, pdf_path, appeal_code, total_pages=None):
+        started = time.perf_counter()
+        with batch_context(batch_id), profiled(batch_id):
+            try:
+                # Workers may not share a filesystem with the web tier; fetch the PDF locally.
+                with self.storage.local_path(pdf_path) as local_pdf:
+                    self._process(batch_id, local_pdf, appeal_code, total_pages)
+            except StorageError as e:
+                self._fail(batch_id, f'Could not fetch the uploaded PDF: {e}')
+        self._record_batch_metrics(batch_id, appeal_code, time.perf_counter() - started)
+    
+    def _record_batch_metrics(self, batch_id, appeal_code, elapsed):
+        status = get_status(batch_id)
+        BATCHES.inc(status=status.get('status', 'unknown'))
+        PAGES.inc(status.get('total_pages') or 0, appeal_code=appeal_code)
+        record_stage('batch', elapsed, batch_id=batch_id)
+        
         with self.app.app_context():
             try:
+                batch = db.session.get(Batch, batch_id)
+                if batch:
+                    summarize_batch(batch, batch_id)
+                    db.session.commit()
+                else:
+                    pop_batch_timings(batch_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Could not save stage timings for batch {batch_id}: {e}")
+        write_profile(batch_id, self.app.config['UPLOAD_FOLDER'])
+    
+    def _process(self, batch_id, pdf_path, appeal_code, total_pages=None):
+        with self.app.app_context():
+            try:
+                if not total_pages:
+                    total_pages = self._count_pages(pdf_path)
+                if not total_pages:
+                    raise ValueError('Could not determine the number of pages in the PDF')
+                
                 update_status(batch_id, {
-                    'status': 'converting',
+                    'status': 'processing',
                     'current_page': 0,
-                    'total_pages': 0,
-                    'checks_found': 0,
+                    'total_pages': total_pages,
+                    'queue_position': 0,
                     'message': 'Converting PDF to images...'
                 })
                 
-                images = convert_from_path(pdf_path, dpi=300)
-                total_pages = len(images)
-                
-                update_status(batch_id, {'total_pages': total_pages, 'status': 'processing'})
-                
                 batch = db.session.get(Batch, batch_id)
                 if not batch:
                     update_status(batch_id, {'status': 'error', 'message': 'Batch not found'})
                     return
                 
-                image_dir = os.path.join(self.app.config['UPLOAD_FOLDER'], f'batch_{batch_id}')
-                os.makedirs(image_dir, exist_ok=True)
-                
                 is_bank_batch = (appeal_code == '035')
+                match_queue = ContactMatchQueue(get_contact_searcher(self.app))
                 
-                if is_bank_batch:
-                    self._process_bank_batch(batch_id, images, image_dir)
-                else:
-                    self._process_mail_batch(batch_id, images, image_dir)
-                
-                self._match_hubspot_contacts(batch_id)
+                try:
+                    if is_bank_batch:
+                        self._process_bank_batch(batch_id, pdf_path, total_pages, match_queue)
+                    else:
+                        self._process_mail_batch(batch_id, pdf_path, total_pages, match_queue)
+                    
+                    self._match_hubspot_contacts(batch_id, match_queue)
+                except Exception:
+                    match_queue.cancel()
+                    raise
                 
                 batch = db.session.get(Batch, batch_id)
                 if batch:
@@ -89,141 +216,195 @@ class CheckProcessor:
                 
             except Exception as e:
                 print(f"Processing error: {e}")
-                update_status(batch_id, {
-                    'status': 'error',
-                    'message': str(e)
-                })
-                
-                batch = db.session.get(Batch, batch_id)
-                if batch:
-                    batch.status = 'error'
-                    db.session.commit()
+                db.session.rollback()
+                self._fail(batch_id, str(e))
     
-    def _process_bank_batch(self, batch_id, images, image_dir):
+    def _fail(self, batch_id, message):
         update_status(batch_id, {
-            'message': 'Classifying pages...'
+            'status': 'error',
+            'message': message
         })
         
-        classified_pages = []
-        for page_num, image in enumerate(images):
-            update_status(batch_id, {
-                'current_page': page_num + 1,
-                'message': f'Classifying page {page_num + 1} of {len(images)}...'
-            })
-            
-            temp_path = os.path.join(image_dir, f'page_{page_num + 1}_temp.png')
-            image.save(temp_path, 'PNG')
-            ocr_result = self.ocr.extract_text_with_confidence(temp_path)
-            
-            image_type = self.ocr.detect_image_type(ocr_result.text)
-            
-            classified_pages.append({
-                'page_num': page_num + 1,
-                'type': image_type,
-                'image': image,
-                'temp_path': temp_path,
-                'raw_text': ocr_result.text,
-                'ocr_result': ocr_result
-            })
+        with self.app.app_context():
+            batch = db.session.get(Batch, batch_id)
+            if batch:
+                batch.status = 'error'
+                db.session.commit()
+    
+    def _map_pages(self, batch_id, fn, total_pages):
+        def run_page(page_num):
+            with batch_context(batch_id):
+                return fn(page_num)
+        return get_scheduler().map_pages(batch_id, run_page, range(1, total_pages + 1))
+    
+    def _store_page(self, image):
+        with stage_timer('store'):
+            stored = self.image_store.put(image)
+        if stored.image is not image:  # compact_image may hand back the page itself
+            image.close()
+        return stored
+    
+    def _ocr_page(self, key):
+        with self.image_store.local_path(key) as image_file:
+            return self.ocr.extract_text_with_confidence(image_file)
+    
+    def _image_hash(self, stored):
+        with stage_timer('fingerprint'):
+            return image_hash(stored.image)
+    
+    def _prerender(self, stored):
+        if Config.PRERENDER_IMAGE_DERIVATIVES and stored.created:
+            self.image_store.prerender(stored)
+    
+    def _classify_page(self, pdf_path, page_num):
+        # Runs on a scheduler page worker: CPU work only, no database access.
+        stored = self._store_page(self._rasterize_page(pdf_path, page_num))
         
+        ocr_result = self._ocr_page(stored.path)
+        page_type = self.ocr.detect_image_type(ocr_result.text)
+        image_path = stored.path
+        page_hash = self._image_hash(stored) if page_type == 'check' else None
+        if page_type in ('check', 'buckslip'):
+            self._prerender(stored)
+        elif stored.created:
+            # Report headers and blank backs are never shown; don't keep them.
+            self.image_store.discard(stored.path)
+            image_path = None
+        stored.image.close()
+        
+        return {
+            'page_num': page_num,
+            'type': page_type,
+            'image_path': image_path,
+            'image_hash': page_hash,
+            'raw_text': ocr_result.text,
+            'ocr_result': ocr_result
+        }
+    
+    def _process_bank_batch(self, batch_id, pdf_path, total_pages, match_queue):
         update_status(batch_id, {
-            'message': 'Pairing checks with buck slips...'
+            'message': 'Classifying pages...'
         })
         
+        # Pages are paired and saved as they come off the workers, so checks
+        # show up in review while later pages are still being read.
+        pairer = PagePairer()
         check_count = 0
-        i = 0
-        while i < len(classified_pages):
-            page_info = classified_pages[i]
-            
-            if page_info['type'] == 'check':
-                check_page = page_info
-                buckslip_page = None
-                
-                for j in range(i + 1, len(classified_pages)):
-                    if classified_pages[j]['type'] == 'buckslip':
-                        buckslip_page = classified_pages[j]
-                        i = j
-                        break
-                
-                check_path = os.path.join(image_dir, f'page_{check_page["page_num"]}_check.png')
-                os.rename(check_page['temp_path'], check_path)
-                check_text = check_page['raw_text']
-                check_data = self.ocr.parse_check_data(check_text, is_buckslip=False)
-                
-                buckslip_path = None
-                buckslip_text = ""
-                buckslip_data = {}
-                
-                if buckslip_page:
-                    buckslip_path = os.path.join(image_dir, f'page_{buckslip_page["page_num"]}_buckslip.png')
-                    os.rename(buckslip_page['temp_path'], buckslip_path)
-                    buckslip_text = buckslip_page['raw_text']
-                    buckslip_data = self.ocr.parse_check_data(buckslip_text, is_buckslip=True)
-                
-                check_ocr_result = check_page.get('ocr_result')
-                buckslip_ocr_result = buckslip_page.get('ocr_result') if buckslip_page else None
-                
-                needs_review = True
-                if check_ocr_result:
-                    needs_review = check_ocr_result.needs_verification
-                if buckslip_ocr_result and buckslip_ocr_result.needs_verification:
-                    needs_review = True
-                if not check_data.get('amount') or not check_data.get('check_number'):
-                    needs_review = True
-                
-                check = Check()
-                check.batch_id = batch_id
-                check.page_number = check_page['page_num']
-                check.amount = check_data.get('amount')
-                check.check_date = check_data.get('check_date')
-                # Check number: prefer check data, but use buckslip as fallback
-                # This helps if check OCR incorrectly picks up metadata
-                check.check_number = check_data.get('check_number') or (buckslip_data.get('check_number') if buckslip_data else None)
-                # Name and address: prefer buckslip data (donor info), fall back to check
-                check.name = buckslip_data.get('name') if buckslip_data else check_data.get('name')
-                check.address_line1 = buckslip_data.get('address_line1') if buckslip_data else check_data.get('address_line1')
-                check.address_line2 = buckslip_data.get('address_line2') if buckslip_data else check_data.get('address_line2')
-                check.city = buckslip_data.get('city') if buckslip_data else check_data.get('city')
-                check.state = buckslip_data.get('state') if buckslip_data else check_data.get('state')
-                check.zip_code = buckslip_data.get('zip_code') if buckslip_data else check_data.get('zip_code')
-                check.is_money_order = check_data.get('is_money_order', False)
-                check.needs_review = needs_review
-                check.raw_ocr_text = f"CHECK (page {check_page['page_num']}):\n{check_text}\n\nBUCKSLIP (page {buckslip_page['page_num'] if buckslip_page else 'N/A'}):\n{buckslip_text}"
-                check.check_ocr_text = check_text  # Store separate check OCR
-                check.buckslip_ocr_text = buckslip_text  # Store separate buckslip OCR
-                check.check_image_path = check_path
-                check.buckslip_image_path = buckslip_path
-                
-                db.session.add(check)
-                db.session.commit()
-                
+        pages_done = 0
+        pages = self._map_pages(
+            batch_id,
+            lambda page_num: self._classify_page(pdf_path, page_num),
+            total_pages
+        )
+        for page_info in pages:
+            pages_done += 1
+            update_status(batch_id, {
+                'current_page': pages_done,
+                'message': f'Classified {pages_done} of {total_pages} pages...'
+            })
+            for check_page, buckslip_page in pairer.add(page_info):
+                self._save_pair(batch_id, check_page, buckslip_page, match_queue)
                 check_count += 1
                 update_status(batch_id, {'checks_found': check_count})
-            
-            i += 1
+        
+        for check_page, buckslip_page in pairer.finish():
+            self._save_pair(batch_id, check_page, buckslip_page, match_queue)
+            check_count += 1
+            update_status(batch_id, {'checks_found': check_count})
+        
+        if pairer.orphan_buckslips:
+            print(f"Batch {batch_id}: buck slips with no check before them on pages {pairer.orphan_buckslips}")
     
-    def _process_mail_batch(self, batch_id, images, image_dir):
+    def _save_pair(self, batch_id, check_page, buckslip_page, match_queue):
+        check_path = check_page['image_path']
+        check_text = check_page['raw_text']
+        check_data = self._parse(check_text, is_buckslip=False)
+        
+        buckslip_path = None
+        buckslip_text = ""
+        buckslip_data = {}
+        
+        if buckslip_page:
+            buckslip_path = buckslip_page['image_path']
+            buckslip_text = buckslip_page['raw_text']
+            buckslip_data = self._parse(buckslip_text, is_buckslip=True)
+        
+        check_ocr_result = check_page.get('ocr_result')
+        buckslip_ocr_result = buckslip_page.get('ocr_result') if buckslip_page else None
+        
+        needs_review = True
+        if check_ocr_result:
+            needs_review = check_ocr_result.needs_verification
+        if buckslip_ocr_result and buckslip_ocr_result.needs_verification:
+            needs_review = True
+        if not check_data.get('amount') or not check_data.get('check_number'):
+            needs_review = True
+        
+        check = Check()
+        check.batch_id = batch_id
+        check.page_number = check_page['page_num']
+        check.amount = check_data.get('amount')
+        check.check_date = check_data.get('check_date')
+        # Check number: prefer check data, but use buckslip as fallback
+        # This helps if check OCR incorrectly picks up metadata
+        check.check_number = check_data.get('check_number') or (buckslip_data.get('check_number') if buckslip_data else None)
+        # Name and address: prefer buckslip data (donor info), fall back to check
+        check.name = buckslip_data.get('name') if buckslip_data else check_data.get('name')
+        check.address_line1 = buckslip_data.get('address_line1') if buckslip_data else check_data.get('address_line1')
+        check.address_line2 = buckslip_data.get('address_line2') if buckslip_data else check_data.get('address_line2')
+        check.city = buckslip_data.get('city') if buckslip_data else check_data.get('city')
+        check.state = buckslip_data.get('state') if buckslip_data else check_data.get('state')
+        check.zip_code = buckslip_data.get('zip_code') if buckslip_data else check_data.get('zip_code')
+        check.is_money_order = check_data.get('is_money_order', False)
+        check.needs_review = needs_review
+        check.raw_ocr_text = f"CHECK (page {check_page['page_num']}):\n{check_text}\n\nBUCKSLIP (page {buckslip_page['page_num'] if buckslip_page else 'N/A'}):\n{buckslip_text}"
+        check.check_ocr_text = check_text  # Store separate check OCR
+        check.buckslip_ocr_text = buckslip_text  # Store separate buckslip OCR
+        check.check_image_path = check_path
+        check.buckslip_image_path = buckslip_path
+        flag_duplicate(check, check_page.get('image_hash'))
+        
+        self._save_check(check)
+        match_queue.submit(check)
+        
+        return check
+    
+    def _read_mail_page(self, pdf_path, page_num):
+        # Runs on a scheduler page worker: CPU work only, no database access.
+        stored = self._store_page(self._rasterize_page(pdf_path, page_num))
+        self._prerender(stored)
+        page_hash = self._image_hash(stored)
+        stored.image.close()
+        check_path = stored.path
+        
+        ocr_result = self._ocr_page(check_path)
+        check_data = self._parse(ocr_result.text, is_buckslip=False)
+        
+        return page_num, check_path, ocr_result, check_data, page_hash
+    
+    def _process_mail_batch(self, batch_id, pdf_path, total_pages, match_queue):
         check_count = 0
+        pages_done = 0
         
-        for page_num, image in enumerate(images):
+        pages = self._map_pages(
+            batch_id,
+            lambda page_num: self._read_mail_page(pdf_path, page_num),
+            total_pages
+        )
+        for page_num, check_path, ocr_result, check_data, page_hash in pages:
+            pages_done += 1
             update_status(batch_id, {
-                'current_page': page_num + 1,
-                'message': f'Processing page {page_num + 1} of {len(images)}...'
+                'current_page': pages_done,
+                'message': f'Processed {pages_done} of {total_pages} pages...'
             })
             
-            check_path = os.path.join(image_dir, f'page_{page_num + 1}_check.png')
-            image.save(check_path, 'PNG')
-            
-            ocr_result = self.ocr.extract_text_with_confidence(check_path)
-            check_data = self.ocr.parse_check_data(ocr_result.text, is_buckslip=False)
-            
             needs_review = ocr_result.needs_verification
             if not check_data.get('amount') or not check_data.get('check_number'):
                 needs_review = True
             
             check = Check()
             check.batch_id = batch_id
-            check.page_number = page_num + 1
+            check.page_number = page_num
             check.amount = check_data.get('amount')
             check.check_date = check_data.get('check_date')
             check.check_number = check_data.get('check_number')
@@ -240,33 +421,38 @@ class CheckProcessor:
             check.buckslip_ocr_text = None  # No buckslip for mail batches
             check.check_image_path = check_path
             check.buckslip_image_path = None
+            flag_duplicate(check, page_hash)
             
-            db.session.add(check)
-            db.session.commit()
+            self._save_check(check)
+            match_queue.submit(check)
             
             check_count += 1
             update_status(batch_id, {'checks_found': check_count})
     
-    def _match_hubspot_contacts(self, batch_id):
-        if not self.hubspot.is_configured():
+    def _match_hubspot_contacts(self, batch_id, match_queue):
+        if not len(match_queue):
             return
         
         update_status(batch_id, {'message': 'Matching HubSpot contacts...'})
         
-        checks = Check.query.filter_by(batch_id=batch_id).all()
+        with stage_timer('match'):
+            results = list(match_queue.results())
         
-        for check in checks:
-            if check.name:
-                matches = self.hubspot.search_contacts(check.name, check.zip_code)
-                
-                if matches:
-                    best_match = matches[0]
-                    check.hubspot_contact_id = best_match['id']
-                    check.hubspot_contact_name = best_match['name']
-                    check.match_confidence = best_match['confidence']
-                    
-                    if best_match['confidence'] >= 0.8:
-                        check.needs_review = False
+        for check_id, matches in results:
+            if not matches:
+                continue
+            
+            check = db.session.get(Check, check_id)
+            if not check:
+                continue
+            
+            best_match = matches[0]
+            check.hubspot_contact_id = best_match['id']
+            check.hubspot_contact_name = best_match['name']
+            check.match_confidence = best_match['confidence']
+            
+            if best_match['confidence'] >= 0.8 and not check.duplicate_of_id:
+                check.needs_review = False
         
         db.session.commit()
 
@@ -0,0 +1,250 @@
+import contextlib
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, update
+
+from app import db
+from app.image_store import ImageStore
+from app.images import DERIVATIVE_DIR, VARIANTS
+from app.models import Batch, Check
+from app.status_store import prune_statuses
+from app.storage import get_storage
+from config import Config
+
+# Arbitrary key for pg_try_advisory_lock so only one process purges at a time.
+RETENTION_LOCK_ID = 72_410_043
+
+
+def _tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def batch_file_paths(batch_id, pdf_path, upload_folder):
+    """Local files and directories from before blob storage: per-batch page
+    images, their derivatives and an absolute PDF path."""
+    paths = [os.path.join(upload_folder, f'batch_{batch_id}')]
+    paths += [os.path.join(upload_folder, DERIVATIVE_DIR, variant, f'batch_{batch_id}') for variant in VARIANTS]
+    if pdf_path and os.path.isabs(pdf_path):
+        paths.append(pdf_path)
+    return paths
+
+
+def batch_bytes(batch_id, pdf_path, image_paths, upload_folder):
+    """Upper bound on what purging a batch frees (pages shared with other batches are kept)."""
+    storage = get_storage()
+    total = sum(_tree_size(path) for path in batch_file_paths(batch_id, pdf_path, upload_folder)
+                if os.path.exists(path))
+    keys = list(image_paths)
+    if pdf_path and not os.path.isabs(pdf_path):
+        keys.append(pdf_path)
+    return total + sum(storage.size(key) or 0 for key in keys)
+
+
+def batch_image_paths(batch_ids):
+    """Store paths referenced by the checks of these batches."""
+    rows = (
+        db.session.query(Check.check_image_path, Check.buckslip_image_path)
+        .filter(Check.batch_id.in_(batch_ids))
+        .all()
+    )
+    return {path for row in rows for path in row if path}
+
+
+def remove_batch_files(batch_id, pdf_path, upload_folder, image_paths=()):
+    """Delete a batch's source PDF, legacy per-batch images and any of
+    ``image_paths`` no other check still uses; returns ``(files, bytes)``.
+
+    Call after the batch's check rows are deleted or cleared, so its own
+    references no longer count."""
+    upload_root = os.path.realpath(upload_folder)
+    files = 0
+    reclaimed = 0
+    for path in batch_file_paths(batch_id, pdf_path, upload_folder):
+        if not os.path.realpath(path).startswith(upload_root + os.sep) or not os.path.exists(path):
+            continue
+        reclaimed += _tree_size(path)
+        try:
+            if os.path.isdir(path):
+                files += sum(len(names) for _, _, names in os.walk(path))
+                shutil.rmtree(path)
+            else:
+                files += 1
+                os.remove(path)
+        except OSError as e:
+            print(f"Could not remove {path}: {e}")
+
+    storage = get_storage()
+    if pdf_path and not os.path.isabs(pdf_path):
+        size = storage.delete(pdf_path)
+        if size:
+            files += 1
+            reclaimed += size
+
+    released, released_bytes = ImageStore(storage).release(image_paths)
+    return files + released, reclaimed + released_bytes
+
+
+class RetentionJanitor:
+    """Purges submitted batches once they are older than DATA_RETENTION_HOURS.
+
+    Deals are already in HubSpot by then, so the page images, the source
+    PDF and the OCR text are dropped while the check rows (amounts, donors,
+    deal ids) are kept for exports. Work is done ``chunk_size`` batches per
+    short transaction with a pause in between, so processing and review
+    traffic never wait on a long-running purge.
+    """
+
+    def __init__(self, app, retention_hours=None, chunk_size=None, pause_seconds=None):
+        self.app = app
+        self.retention_hours = Config.DATA_RETENTION_HOURS if retention_hours is None else retention_hours
+        self.chunk_size = chunk_size or Config.RETENTION_CHUNK_SIZE
+        self.pause_seconds = Config.RETENTION_CHUNK_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+
+    def expired_batch_ids(self, cutoff, limit, after_id=0):
+        rows = (
+            db.session.query(Batch.id, Batch.pdf_path)
+            .filter(Batch.status == 'submitted')
+            .filter(Batch.submitted_date < cutoff)
+            .filter(Batch.purged_date.is_(None))
+            .filter(Batch.id > after_id)
+            .order_by(Batch.id)
+            .limit(limit)
+            .all()
+        )
+        return [(row.id, row.pdf_path) for row in rows]
+
+    def run_once(self, dry_run=False):
+        """Purge one pass; ``report['skipped']`` is set if another process is already purging."""
+        report = {'batches': 0, 'files': 0, 'bytes': 0, 'checks_pruned': 0, 'statuses_pruned': 0}
+        with self.app.app_context():
+            if dry_run:
+                return self._run(report, dry_run)
+            with _purge_lock() as acquired:
+                if not acquired:
+                    report['skipped'] = True
+                    return report
+                return self._run(report, dry_run)
+
+    def _run(self, report, dry_run):
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        after_id = 0
+        while True:
+            chunk = self.expired_batch_ids(cutoff, self.chunk_size, after_id)
+            db.session.rollback()  # end the read transaction before touching files
+            if not chunk:
+                break
+            after_id = chunk[-1][0]
+
+            if dry_run:
+                for batch_id, pdf_path in chunk:
+                    report['bytes'] += batch_bytes(batch_id, pdf_path, batch_image_paths([batch_id]), upload_folder)
+                db.session.rollback()
+                report['batches'] += len(chunk)
+                continue
+
+            batch_ids = [batch_id for batch_id, _ in chunk]
+            image_paths = batch_image_paths(batch_ids)
+            result = db.session.execute(
+                update(Check)
+                .where(Check.batch_id.in_(batch_ids))
+                .values(raw_ocr_text=None, check_ocr_text=None, buckslip_ocr_text=None,
+                        check_image_path=None, buckslip_image_path=None)
+            )
+            report['checks_pruned'] += result.rowcount or 0
+            db.session.execute(
+                update(Batch)
+                .where(Batch.id.in_(batch_ids))
+                .values(purged_date=datetime.utcnow(), pdf_path=None)
+            )
+            db.session.commit()
+            report['batches'] += len(chunk)
+
+            for batch_id, pdf_path in chunk:
+                files, reclaimed = remove_batch_files(batch_id, pdf_path, upload_folder)
+                report['files'] += files
+                report['bytes'] += reclaimed
+            files, reclaimed = ImageStore(get_storage()).release(image_paths)
+            db.session.rollback()
+            report['files'] += files
+            report['bytes'] += reclaimed
+
+            if len(chunk) < self.chunk_size:
+                break
+            time.sleep(self.pause_seconds)
+
+        if not dry_run:
+            files, reclaimed = ImageStore(get_storage()).sweep()
+            db.session.rollback()
+            report['files'] += files
+            report['bytes'] += reclaimed
+            report['statuses_pruned'] = prune_statuses(self.retention_hours) or 0
+            from app.uploads import get_upload_manager
+            get_upload_manager(self.app).prune(Config.UPLOAD_SESSION_TTL_HOURS)
+
+        return report
+
+
+@contextlib.contextmanager
+def _purge_lock():
+    """Yields whether this process may purge; on PostgreSQL only one janitor
+    (web worker or `flask purge-expired`) holds the lock at a time."""
+    if db.engine.dialect.name != 'postgresql':
+        yield True
+        return
+    with db.engine.connect() as conn:
+        acquired = conn.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': RETENTION_LOCK_ID}).scalar()
+        conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': RETENTION_LOCK_ID})
+                conn.commit()
+
+
+def format_report(report):
+    return (f"Purged {report['batches']} batches: {report['files']} files, "
+            f"{report['bytes'] / (1024 * 1024):.1f} MB reclaimed, {report['checks_pruned']} checks pruned, "
+            f"{report['statuses_pruned']} status entries removed")
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_retention_worker(app):
+    """Run the janitor every RETENTION_INTERVAL_MINUTES on a daemon thread."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            return _worker
+
+        janitor = RetentionJanitor(app)
+
+        def loop():
+            while True:
+                time.sleep(Config.RETENTION_INTERVAL_MINUTES * 60)
+                try:
+                    report = janitor.run_once()
+                    if report['batches'] or report['statuses_pruned']:
+                        print(f"Retention: {format_report(report)}")
+                except Exception as e:
+                    print(f"Retention run failed: {e}")
+
+        _worker = threading.Thread(target=loop, name='retention-janitor', daemon=True)
+        _worker.start()
+        return _worker
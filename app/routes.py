@@ -1,12 +1,23 @@
 import os
 import json
+import math
 from datetime import datetime
-from flask import Blueprint, render_template, request, jsonify, Response, current_app, send_from_directory
+from flask import Blueprint, render_template, request, jsonify, Response, current_app, redirect, stream_with_context
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import Batch, Check
-from app.processor import CheckProcessor, get_processing_status
-from app.hubspot import HubSpotClient
+from app.processor import get_processing_status
+from app.hubspot import HubSpotClient, search_cache_stats
+from app.contacts import get_contact_searcher
+from app.duplicates import set_fingerprint
+from app.images import get_derivative, pick_format
+from app.metrics import registry
+from app.export import FORMATS as EXPORT_FORMATS, buffered, checks_query, export_filename, iter_export, iter_rows, parse_date_range
+from app.retention import batch_image_paths, remove_batch_files
+from app.search import search_checks
+from app.storage import StorageError, get_storage
+from app.uploads import UploadError, file_digest, get_upload_manager, start_batch
+from app.submission import BatchSubmitter, claim_submission, get_submission_status
 from config import Config
 
 main_bp = Blueprint('main', __name__)
@@ -14,6 +25,92 @@ main_bp = Blueprint('main', __name__)
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
+TEXT_CHECK_FIELDS = ['check_number', 'name', 'address_line1', 'address_line2',
+                     'city', 'state', 'zip_code', 'hubspot_contact_id', 'hubspot_contact_name']
+
+def parse_id(value):
+    """An integer id from JSON (ints or digit strings), else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+def invalid_check_fields(data):
+    """Why ``data`` can't be applied to a check, or None if it can."""
+    if not isinstance(data, dict):
+        return 'fields must be an object'
+    for field, value in data.items():
+        if value is None:
+            continue
+        if field == 'amount':
+            try:
+                amount = float(value) if value != '' else 0.0
+            except (TypeError, ValueError):
+                return 'amount must be a number'
+            if isinstance(value, bool) or not math.isfinite(amount):
+                return 'amount must be a number'
+        elif field == 'check_date':
+            if not isinstance(value, str):
+                return 'check_date must be a YYYY-MM-DD string'
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return 'check_date must be a YYYY-MM-DD string'
+        elif field in TEXT_CHECK_FIELDS:
+            if not isinstance(value, str):
+                return f'{field} must be a string'
+            max_length = Check.__table__.c[field].type.length
+            if max_length and len(value) > max_length:
+                return f'{field} must be at most {max_length} characters'
+        elif field == 'needs_review':
+            if not isinstance(value, bool):
+                return 'needs_review must be true or false'
+        elif field == 'duplicate_of_id':
+            if value:
+                return 'duplicate_of_id can only be cleared'
+    return None
+
+def apply_check_updates(check, data):
+    """Apply reviewer edits; callers validate them with ``invalid_check_fields`` first."""
+    if 'amount' in data:
+        try:
+            check.amount = float(data['amount']) if data['amount'] else None
+        except (TypeError, ValueError):
+            pass
+    
+    if 'check_date' in data:
+        try:
+            check.check_date = datetime.strptime(data['check_date'], '%Y-%m-%d').date() if data['check_date'] else None
+        except (TypeError, ValueError):
+            pass
+    
+    if 'hubspot_contact_id' in data and data['hubspot_contact_id'] != check.hubspot_contact_id:
+        # The reviewer overrode the suggested match, so the cached search
+        # results for this donor are no longer trustworthy.
+        HubSpotClient().invalidate_search(check.name, check.zip_code)
+    
+    for field in TEXT_CHECK_FIELDS:
+        if field in data:
+            setattr(check, field, data[field])
+    
+    if 'needs_review' in data:
+        check.needs_review = data['needs_review']
+    
+    if 'duplicate_of_id' in data and not data['duplicate_of_id']:
+        # Reviewer confirmed this is not a rescan of an earlier check
+        check.duplicate_of_id = None
+    
+    if db.session.is_modified(check):
+        check.version = (check.version or 0) + 1
+    
+    # After the version check: loading the relationship autoflushes the check
+    if {'amount', 'check_date', 'check_number'} & set(data) and check.fingerprint is not None:
+        set_fingerprint(check)
+
 @main_bp.route('/')
 def index():
     batches = Batch.query.order_by(Batch.upload_date.desc()).limit(10).all()
@@ -48,27 +145,80 @@ def upload():
     filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
     file.save(filepath)
     
-    batch = Batch()
-    batch.filename = filename
-    batch.appeal_code = appeal_code
-    batch.status = 'processing'
-    if expected_amount:
-        try:
-            batch.expected_amount = float(expected_amount)
-        except ValueError:
-            pass
-    db.session.add(batch)
-    db.session.commit()
+    batch = start_batch(
+        current_app._get_current_object(), filepath, filename, appeal_code,
+        expected_amount=expected_amount, source_digest=file_digest(filepath)
+    )
     
-    processor = CheckProcessor(current_app._get_current_object())
-    processor.process_batch(batch.id, filepath, appeal_code)
+    return jsonify({
+        'success': True,
+        'batch_id': batch.id,
+        'redirect': f'/processing/{batch.id}'
+    })
+
+@main_bp.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({'error': e.message, **e.extra}), e.status
+
+@main_bp.route('/api/uploads', methods=['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    upload = get_upload_manager(current_app).create(
+        data.get('filename'), data.get('size'),
+        appeal_code=data.get('appeal_code', '020'),
+        expected_amount=data.get('expected_amount')
+    )
+    upload['upload_url'] = f"/api/uploads/{upload['upload_id']}"
+    return jsonify(upload), 201
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def upload_progress(upload_id):
+    upload = get_upload_manager(current_app).describe(upload_id)
+    response = jsonify(upload)
+    response.headers['Upload-Offset'] = str(upload['offset'])
+    response.headers['Upload-Length'] = str(upload['size'])
+    return response
+
+@main_bp.route('/api/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def upload_chunk(upload_id):
+    offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    
+    # Read the raw body as it arrives rather than letting Werkzeug buffer it
+    new_offset = get_upload_manager(current_app).write_chunk(
+        upload_id, offset, request.stream, request.content_length
+    )
+    response = jsonify({'offset': new_offset})
+    response.headers['Upload-Offset'] = str(new_offset)
+    return response
+
+@main_bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    data = request.get_json(silent=True) or {}
+    path, meta = get_upload_manager(current_app).complete(upload_id, data.get('sha256'))
+    
+    batch = start_batch(
+        current_app._get_current_object(), path, meta['filename'], meta['appeal_code'],
+        expected_amount=meta.get('expected_amount'), source_digest=meta['sha256'],
+        page_count=meta['page_count']
+    )
     
     return jsonify({
         'success': True,
         'batch_id': batch.id,
+        'sha256': meta['sha256'],
+        'page_count': meta['page_count'],
         'redirect': f'/processing/{batch.id}'
     })
 
+@main_bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    get_upload_manager(current_app).abort(upload_id)
+    return jsonify({'success': True})
+
 @main_bp.route('/processing/<int:batch_id>')
 def processing(batch_id):
     batch = db.session.get(Batch, batch_id)
@@ -89,7 +239,7 @@ def get_status(batch_id):
             
             time.sleep(1)
     
-    return Response(generate(), mimetype='text/event-stream')
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 @main_bp.route('/review/<int:batch_id>')
 def review(batch_id):
@@ -119,31 +269,80 @@ def check_api(check_id):
     if request.method == 'GET':
         return jsonify(check.to_dict())
     
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    error = invalid_check_fields(data)
+    if error:
+        return jsonify({'error': error}), 400
     
-    if 'amount' in data:
-        try:
-            check.amount = float(data['amount']) if data['amount'] else None
-        except ValueError:
-            pass
-    
-    if 'check_date' in data:
-        try:
-            check.check_date = datetime.strptime(data['check_date'], '%Y-%m-%d').date() if data['check_date'] else None
-        except ValueError:
-            pass
-    
-    for field in ['check_number', 'name', 'address_line1', 'address_line2', 
-                  'city', 'state', 'zip_code', 'hubspot_contact_id']:
-        if field in data:
-            setattr(check, field, data[field])
-    
-    if 'needs_review' in data:
-        check.needs_review = data['needs_review']
+    apply_check_updates(check, data)
     
     db.session.commit()
     return jsonify(check.to_dict())
 
+@main_bp.route('/api/checks', methods=['PATCH'])
+def patch_checks():
+    """Apply many coalesced field edits across checks in one transaction.
+    
+    Body: {"edits": [{"id": 1, "version": 3, "fields": {"amount": "10.00"}}]}.
+    Every edit needs the check's current version. Edits whose version no
+    longer matches are skipped and returned under "conflicts" with the
+    current server state; malformed edits are returned under "errors"; the
+    rest are committed.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('edits'), list):
+        return jsonify({'error': 'Body must be a JSON object with an "edits" list'}), 400
+    
+    valid = []
+    errors = []
+    for index, edit in enumerate(data['edits']):
+        if not isinstance(edit, dict):
+            errors.append({'index': index, 'id': None, 'error': 'edit must be an object'})
+            continue
+        check_id = parse_id(edit.get('id'))
+        version = parse_id(edit.get('version'))
+        fields = edit.get('fields') or {}
+        if check_id is None:
+            error = 'id must be an integer'
+        elif version is None:
+            error = 'version is required'
+        else:
+            error = invalid_check_fields(fields)
+        if error:
+            errors.append({'index': index, 'id': edit.get('id'), 'error': error})
+            continue
+        valid.append((check_id, version, fields))
+    
+    ids = [check_id for check_id, _, _ in valid]
+    checks = {
+        c.id: c for c in Check.query.filter(Check.id.in_(ids)).with_for_update()
+    } if ids else {}
+    
+    updated = []
+    conflicts = []
+    missing = []
+    for check_id, version, fields in valid:
+        check = checks.get(check_id)
+        if check is None:
+            missing.append(check_id)
+            continue
+        
+        if version != check.version:
+            conflicts.append({'id': check.id, 'current': check.to_dict()})
+            continue
+        
+        apply_check_updates(check, fields)
+        updated.append(check)
+    
+    db.session.commit()
+    
+    return jsonify({
+        'updated': [{'id': c.id, 'version': c.version} for c in updated],
+        'conflicts': conflicts,
+        'missing': missing,
+        'errors': errors
+    })
+
 @main_bp.route('/api/search_contacts')
 def search_contacts():
     name = request.args.get('name', '')
@@ -153,9 +352,13 @@ def search_contacts():
     if not hubspot.is_configured():
         return jsonify({'error': 'HubSpot not configured'}), 400
     
-    contacts = hubspot.search_contacts(name, zip_code)
+    contacts = get_contact_searcher(current_app._get_current_object()).search_contacts(name, zip_code)
     return jsonify({'contacts': contacts})
 
+@main_bp.route('/api/search_contacts/stats')
+def search_contacts_stats():
+    return jsonify(search_cache_stats())
+
 @main_bp.route('/api/submit/<int:batch_id>', methods=['POST'])
 def submit_batch(batch_id):
     batch = db.session.get(Batch, batch_id)
@@ -181,55 +384,142 @@ def submit_batch(batch_id):
                     'requires_confirmation': True
                 }), 400
     
-    success_count = 0
-    errors = []
+    if not claim_submission(batch_id):
+        db.session.refresh(batch)
+        if batch.status == 'submitting':
+            return jsonify({'error': 'Submission already in progress', 'status_url': f'/api/submit/{batch_id}/status'}), 409
+        return jsonify({'error': f'Batch cannot be submitted while {batch.status}'}), 409
     
-    for check in checks:
-        if check.is_money_order:
-            continue
-        
-        if not check.amount:
-            errors.append(f"Check #{check.page_number}: Missing amount")
-            continue
-        
-        deal_id = hubspot.create_deal(
-            check.to_dict(),
-            check.hubspot_contact_id,
-            batch.appeal_code
-        )
-        
-        if deal_id:
-            check.hubspot_deal_id = deal_id
-            success_count += 1
-        else:
-            errors.append(f"Check #{check.page_number}: Failed to create deal")
-    
-    batch.status = 'submitted'
-    batch.submitted_date = datetime.utcnow()
-    db.session.commit()
+    submitter = BatchSubmitter(current_app._get_current_object())
+    submitter.submit(batch_id)
     
     return jsonify({
         'success': True,
-        'deals_created': success_count,
-        'errors': errors
-    })
+        'status_url': f'/api/submit/{batch_id}/status'
+    }), 202
+
+@main_bp.route('/api/submit/<int:batch_id>/status')
+def submit_status(batch_id):
+    def generate():
+        import time
+        while True:
+            status = get_submission_status(batch_id)
+            yield f"data: {json.dumps(status)}\n\n"
+            
+            if status.get('status') in ['complete', 'error', 'unknown']:
+                break
+            
+            time.sleep(1)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+def send_blob(key, mimetype=None):
+    """Serve a stored image: redirect to a presigned URL when the backend and
+    IMAGE_DELIVERY allow it, otherwise stream it through the app."""
+    storage = get_storage()
+    try:
+        if Config.IMAGE_DELIVERY == 'presigned':
+            url = storage.url(key, Config.PRESIGNED_URL_TTL)
+            if url:
+                return redirect(url)
+        return storage.send(key, mimetype=mimetype, max_age=Config.IMAGE_CACHE_MAX_AGE)
+    except StorageError:
+        return jsonify({'error': 'Image not found'}), 404
 
 @main_bp.route('/images/<path:filename>')
 def serve_image(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    return send_blob(filename)
+
+
+@main_bp.route('/images/<any(thumb, medium):variant>/<path:filename>')
+def serve_image_derivative(variant, filename):
+    fmt = pick_format(request.headers.get('Accept'))
+    key = get_derivative(get_storage(), variant, filename, fmt)
+    if key is None:
+        return jsonify({'error': 'Image not found'}), 404
+    
+    response = send_blob(key, mimetype=f'image/{fmt}')
+    response.vary.add('Accept')
+    return response
+
+@main_bp.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @main_bp.route('/api/batches')
 def list_batches():
     batches = Batch.query.order_by(Batch.upload_date.desc()).all()
     return jsonify([b.to_dict() for b in batches])
 
+def export_response(query, fmt, label):
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format '{fmt}'"}), 400
+    
+    chunks = buffered(iter_export(iter_rows(query), fmt))
+    response = Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(label, fmt)}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@main_bp.route('/api/batch/<int:batch_id>/export')
+def export_batch(batch_id):
+    batch = db.session.get(Batch, batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    fmt = request.args.get('format', 'csv')
+    return export_response(checks_query(batch_ids=[batch_id]), fmt, f'batch_{batch_id}')
+
+@main_bp.route('/api/export')
+def export_checks():
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        start_at, end_at = parse_date_range(start, end)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    fmt = request.args.get('format', 'csv')
+    label = f"{start or 'all'}_{end or 'now'}"
+    return export_response(checks_query(start=start_at, end=end_at), fmt, label)
+
+def search_args():
+    start_at, end_at = parse_date_range(request.args.get('start'), request.args.get('end'))
+    return {
+        'page': request.args.get('page', 1, type=int),
+        'per_page': request.args.get('per_page', 25, type=int),
+        'start': start_at,
+        'end': end_at,
+        'appeal_code': request.args.get('appeal_code') or None,
+    }
+
+@main_bp.route('/search')
+def search():
+    q = request.args.get('q', '').strip()
+    try:
+        results = search_checks(q, **search_args()) if q else None
+    except ValueError:
+        return "Dates must be YYYY-MM-DD", 400
+    return render_template('search.html', q=q, results=results, args=request.args.to_dict(),
+                           appeal_codes=Config.APPEAL_CODES)
+
+@main_bp.route('/api/search')
+def api_search():
+    try:
+        return jsonify(search_checks(request.args.get('q', '').strip(), **search_args()))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
 @main_bp.route('/api/batch/<int:batch_id>', methods=['DELETE'])
 def delete_batch(batch_id):
     batch = db.session.get(Batch, batch_id)
     if not batch:
         return jsonify({'error': 'Batch not found'}), 404
     
+    pdf_path = batch.pdf_path
+    image_paths = batch_image_paths([batch_id])
     db.session.delete(batch)
     db.session.commit()
     
-    return jsonify({'success': True})
+    files, reclaimed = remove_batch_files(batch_id, pdf_path, current_app.config['UPLOAD_FOLDER'], image_paths)
+    return jsonify({'success': True, 'files_removed': files, 'bytes_reclaimed': reclaimed})
@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from config import Config
+from app.status_store import update_status
+
+
+class BatchJob:
+    def __init__(self, batch_id, appeal_code, page_count, run, priority, seq):
+        self.batch_id = batch_id
+        self.appeal_code = appeal_code
+        self.page_count = page_count or 1
+        self.run = run
+        self.priority = priority
+        self.seq = seq
+        self.pages_done = 0
+
+    def sort_key(self):
+        return (self.priority, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+
+class BatchScheduler:
+    """Owns the process-wide CPU budget for OCR work.
+
+    Batches are admitted from a priority queue (lower ``APPEAL_PRIORITIES``
+    value first) up to ``max_active_batches`` at a time. Each admitted batch
+    hands its pages to ``map_pages``; a fixed pool of ``cpu_budget`` page
+    workers pulls from the active batches round-robin, so concurrent batches
+    share cores evenly instead of each starting its own unbounded thread.
+    """
+
+    def __init__(self, cpu_budget, max_active_batches, priorities=None, default_priority=100):
+        self.cpu_budget = max(1, cpu_budget)
+        self.max_active_batches = max(1, max_active_batches)
+        self.priorities = priorities or {}
+        self.default_priority = default_priority
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._active = {}
+        self._page_queues = {}
+        self._round_robin = deque()
+        self._seconds_per_page = 5.0
+
+        for i in range(self.cpu_budget):
+            worker = threading.Thread(target=self._page_worker, name=f'ocr-page-{i}')
+            worker.daemon = True
+            worker.start()
+
+    def submit_batch(self, batch_id, appeal_code, page_count, run):
+        priority = self.priorities.get(appeal_code, self.default_priority)
+        job = BatchJob(batch_id, appeal_code, page_count, run, priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, job)
+            self._dispatch()
+            snapshot = self._queue_snapshot()
+        self._publish_queue(snapshot)
+        return job
+
+    def queue_position(self, batch_id):
+        with self._cond:
+            for position, job in enumerate(sorted(self._waiting), start=1):
+                if job.batch_id == batch_id:
+                    return position
+        return 0
+
+    def map_pages(self, batch_id, fn, items):
+        """Run ``fn(item)`` for each item on the shared page workers.
+
+        Results are yielded in completion order. Pages not yet started are
+        dropped if the caller stops iterating early. A batch's pages share one
+        queue, so a batch may only have one ``map_pages`` in flight at a time;
+        a second call while the first is still being iterated raises
+        RuntimeError.
+        """
+        results = queue.Queue()
+        items = list(items)
+        with self._cond:
+            if batch_id in self._page_queues:
+                raise RuntimeError(f'Batch {batch_id} is already mapping pages')
+            self._page_queues[batch_id] = deque((fn, item, results) for item in items)
+            if items:
+                self._round_robin.append(batch_id)
+                self._cond.notify_all()
+
+        try:
+            for _ in items:
+                ok, value = results.get()
+                if not ok:
+                    raise value
+                yield value
+        finally:
+            with self._cond:
+                self._page_queues.pop(batch_id, None)
+                if batch_id in self._round_robin:
+                    self._round_robin.remove(batch_id)
+
+    def _dispatch(self):
+        while self._waiting and len(self._active) < self.max_active_batches:
+            job = heapq.heappop(self._waiting)
+            self._active[job.batch_id] = job
+            thread = threading.Thread(target=self._run_batch, args=(job,))
+            thread.daemon = True
+            thread.start()
+
+    def _run_batch(self, job):
+        try:
+            job.run()
+        except Exception as e:
+            print(f"Scheduled batch {job.batch_id} failed: {e}")
+        finally:
+            with self._cond:
+                self._active.pop(job.batch_id, None)
+                self._dispatch()
+                snapshot = self._queue_snapshot()
+            self._publish_queue(snapshot)
+
+    def _page_worker(self):
+        while True:
+            with self._cond:
+                while not self._round_robin:
+                    self._cond.wait()
+                batch_id = self._round_robin.popleft()
+                page_queue = self._page_queues[batch_id]
+                fn, item, results = page_queue.popleft()
+                if page_queue:
+                    self._round_robin.append(batch_id)
+
+            started = time.monotonic()
+            try:
+                results.put((True, fn(item)))
+            except Exception as e:
+                results.put((False, e))
+            elapsed = time.monotonic() - started
+
+            with self._cond:
+                self._seconds_per_page = 0.8 * self._seconds_per_page + 0.2 * elapsed
+                job = self._active.get(batch_id)
+                if job:
+                    job.pages_done += 1
+
+    def _queue_snapshot(self):
+        remaining_active = sum(
+            max(job.page_count - job.pages_done, 0) for job in self._active.values()
+        )
+        free_slots = self.max_active_batches - len(self._active)
+        return {
+            'waiting': sorted(self._waiting),
+            'remaining_active': remaining_active,
+            'free_slots': free_slots,
+            'seconds_per_page': self._seconds_per_page,
+        }
+
+    def _publish_queue(self, snapshot):
+        now = datetime.utcnow()
+        pages_ahead = snapshot['remaining_active']
+        for position, job in enumerate(snapshot['waiting'], start=1):
+            wait_seconds = pages_ahead * snapshot['seconds_per_page'] / self.cpu_budget
+            estimated_start = now + timedelta(seconds=wait_seconds)
+            update_status(job.batch_id, {
+                'status': 'queued',
+                'queue_position': position,
+                'estimated_start': estimated_start.isoformat() + 'Z',
+                'message': f'Waiting in queue (position {position})...'
+            })
+            pages_ahead += job.page_count
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            cpu_budget = Config.PROCESSING_CPU_BUDGET or os.cpu_count() or 1
+            if cpu_budget > 1:
+                # The budget is spent on page-level parallelism; keep Tesseract
+                # from fanning out its own OpenMP threads on top of it.
+                os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+            _scheduler = BatchScheduler(
+                cpu_budget=cpu_budget,
+                max_active_batches=Config.MAX_ACTIVE_BATCHES,
+                priorities=Config.APPEAL_PRIORITIES
+            )
+        return _scheduler
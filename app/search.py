@@ -0,0 +1,171 @@
+import math
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import column, func, inspect, literal_column, or_, table, text
+
+from app import db
+from app.models import Batch, Check
+
+# Donor fields are weighted above OCR text so a name hit outranks a stray
+# word on a scanned page. raw_ocr_text holds the check and buckslip text.
+DONOR_FIELDS = ('name', 'hubspot_contact_name')
+DETAIL_FIELDS = ('address_line1', 'address_line2', 'city', 'state', 'zip_code', 'check_number')
+TEXT_FIELDS = ('raw_ocr_text',)
+SEARCH_FIELDS = DONOR_FIELDS + DETAIL_FIELDS + TEXT_FIELDS
+
+MAX_TERMS = 12
+MAX_PER_PAGE = 100
+SNIPPET_CHARS = 160
+
+
+def _tsvector(fields, weight):
+    document = " || ' ' || ".join(f"coalesce({field}, '')" for field in fields)
+    return f"setweight(to_tsvector('simple', {document}), '{weight}')"
+
+
+# PostgreSQL: a stored generated column, so every insert and update keeps it
+# current, with a GIN index. 'simple' because names must not be stemmed.
+PG_SEARCH_VECTOR = ' || '.join([
+    _tsvector(DONOR_FIELDS, 'A'),
+    _tsvector(DETAIL_FIELDS, 'B'),
+    _tsvector(TEXT_FIELDS, 'D'),
+])
+
+# SQLite: an FTS5 index over the checks table kept in sync by triggers.
+_FTS_COLUMNS = ', '.join(SEARCH_FIELDS)
+_NEW_VALUES = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+_OLD_VALUES = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+SQLITE_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS checks_fts USING fts5({_FTS_COLUMNS}, "
+    f"content='checks', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS checks_fts_insert AFTER INSERT ON checks BEGIN "
+    f"INSERT INTO checks_fts(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_NEW_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS checks_fts_delete AFTER DELETE ON checks BEGIN "
+    f"INSERT INTO checks_fts(checks_fts, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.id, {_OLD_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS checks_fts_update AFTER UPDATE OF {_FTS_COLUMNS} ON checks BEGIN "
+    f"INSERT INTO checks_fts(checks_fts, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.id, {_OLD_VALUES}); "
+    f"INSERT INTO checks_fts(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_NEW_VALUES}); END",
+    "INSERT INTO checks_fts(checks_fts) VALUES ('rebuild')",
+]
+
+_backend = None
+
+
+def search_backend():
+    """'postgres', 'fts5', or 'like' when the search migration has not been applied."""
+    global _backend
+    if _backend is None:
+        inspector = inspect(db.engine)
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql' and 'search_vector' in {c['name'] for c in inspector.get_columns('checks')}:
+            _backend = 'postgres'
+        elif dialect == 'sqlite' and inspector.has_table('checks_fts'):
+            _backend = 'fts5'
+        else:
+            _backend = 'like'
+    return _backend
+
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _matching(query, terms):
+    """Filter ``query`` to checks containing every term (as a word prefix); returns (query, rank)."""
+    backend = search_backend()
+    if backend == 'postgres':
+        tsquery = func.to_tsquery('simple', ' & '.join(f"'{term}':*" for term in terms))
+        vector = literal_column('checks.search_vector')
+        return query.filter(vector.op('@@')(tsquery)), func.ts_rank(vector, tsquery).desc()
+    if backend == 'fts5':
+        fts = table('checks_fts', column('rowid'))
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25 weights follow SEARCH_FIELDS; lower scores are better matches
+        weights = [10.0] * len(DONOR_FIELDS) + [3.0] * len(DETAIL_FIELDS) + [1.0] * len(TEXT_FIELDS)
+        query = query.join(fts, fts.c.rowid == Check.id).filter(text('checks_fts MATCH :match').bindparams(match=match))
+        return query, func.bm25(literal_column('checks_fts'), *weights).asc()
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(or_(*(getattr(Check, field).ilike(pattern) for field in SEARCH_FIELDS)))
+    return query, Check.id.desc()
+
+
+def snippet(value, terms):
+    """HTML excerpt of ``value`` around the first hit with the terms in <mark>."""
+    value = ' '.join((value or '').split())
+    if not value or not terms:
+        return Markup('')
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+    first = pattern.search(value)
+    start = max(0, first.start() - SNIPPET_CHARS // 3) if first else 0
+    end = min(len(value), start + SNIPPET_CHARS)
+    fragment = value[start:end]
+
+    parts = [Markup('…')] if start else []
+    position = 0
+    for hit in pattern.finditer(fragment):
+        parts.append(escape(fragment[position:hit.start()]))
+        parts.append(Markup('<mark>%s</mark>') % hit.group())
+        position = hit.end()
+    parts.append(escape(fragment[position:]))
+    if end < len(value):
+        parts.append(Markup('…'))
+    return Markup('').join(parts)
+
+
+def search_checks(query_text, page=1, per_page=25, start=None, end=None, appeal_code=None):
+    """One page of checks matching every word of ``query_text``, best match first.
+
+    ``start``/``end`` bound the batch upload date (``end`` exclusive).
+    """
+    terms = search_terms(query_text)
+    page = max(1, page)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    results = {'query': query_text, 'page': page, 'per_page': per_page, 'total': 0, 'pages': 0, 'results': []}
+    if not terms:
+        return results
+
+    query = db.session.query(Check, Batch).join(Batch, Check.batch_id == Batch.id)
+    if start is not None:
+        query = query.filter(Batch.upload_date >= start)
+    if end is not None:
+        query = query.filter(Batch.upload_date < end)
+    if appeal_code:
+        query = query.filter(Batch.appeal_code == appeal_code)
+    query, rank = _matching(query, terms)
+
+    total = query.order_by(None).count()
+    rows = query.order_by(rank, Check.id.desc()).limit(per_page).offset((page - 1) * per_page).all()
+
+    results['total'] = total
+    results['pages'] = math.ceil(total / per_page)
+    results['results'] = [_result(check, batch, terms) for check, batch in rows]
+    return results
+
+
+def _result(check, batch, terms):
+    donor = ' '.join(filter(None, [check.name, check.address_line1, check.city, check.state, check.zip_code]))
+    return {
+        'id': check.id,
+        'batch_id': check.batch_id,
+        'page_number': check.page_number,
+        'amount': float(check.amount) if check.amount else None,
+        'check_date': check.check_date.isoformat() if check.check_date else None,
+        'check_number': check.check_number,
+        'name': check.name,
+        'city': check.city,
+        'state': check.state,
+        'zip_code': check.zip_code,
+        'hubspot_contact_name': check.hubspot_contact_name,
+        'hubspot_deal_id': check.hubspot_deal_id,
+        'thumbnail': f'/images/thumb/{check.check_image_name}' if check.check_image_path else None,
+        'batch': {
+            'filename': batch.filename,
+            'appeal_code': batch.appeal_code,
+            'upload_date': batch.upload_date.isoformat() if batch.upload_date else None,
+            'status': batch.status,
+        },
+        'donor_snippet': snippet(donor, terms),
+        'ocr_snippet': snippet(check.raw_ocr_text, terms),
+    }
@@ -3,7 +3,16 @@ let currentCheckId = null;
 document.addEventListener('DOMContentLoaded', function() {
     document.querySelectorAll('.editable-field').forEach(field => {
         field.addEventListener('change', handleFieldChange);
-        field.addEventListener('blur', handleFieldChange);
+    });
+
+    // Leaving a field doesn't flush: tabbing through a card should still
+    // produce one PATCH. Only leaving the page cuts the debounce short.
+    window.addEventListener('beforeunload', () => flushEdits({ keepalive: true }));
+    window.addEventListener('pagehide', () => flushEdits({ keepalive: true }));
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'hidden') {
+            flushEdits({ keepalive: true });
+        }
     });
 
     document.querySelectorAll('.search-contact-btn').forEach(btn => {
@@ -13,7 +22,19 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    document.querySelectorAll('.not-duplicate-btn').forEach(btn => {
+        btn.addEventListener('click', function() {
+            clearDuplicate(this);
+        });
+    });
+
     document.getElementById('submitBtn').addEventListener('click', submitBatch);
+    if (submissionRunning) {
+        const submitBtn = document.getElementById('submitBtn');
+        submitBtn.disabled = true;
+        submitBtn.textContent = 'Submitting...';
+        followSubmission(`/api/submit/${batchId}/status`);
+    }
 
     updateTotalAmount();
 
@@ -21,38 +42,146 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeOCRClickToFill();
 });
 
-async function handleFieldChange(e) {
+// Edits are coalesced per check and field, then sent together in one
+// PATCH /api/checks once the reviewer pauses typing.
+const EDIT_DEBOUNCE_MS = 800;
+const pendingEdits = new Map();
+let flushTimer = null;
+let flushInFlight = null;
+
+function handleFieldChange(e) {
     const field = e.target;
     const checkCard = field.closest('.check-card');
     const checkId = checkCard.dataset.checkId;
     const fieldName = field.dataset.field;
-    const value = field.value;
 
     field.classList.add('modified');
+    queueEdit(checkId, { [fieldName]: field.value });
+
+    if (fieldName === 'amount') {
+        updateTotalAmount();
+    }
+}
 
+function queueEdit(checkId, fields) {
+    const pending = pendingEdits.get(checkId) || {};
+    Object.assign(pending, fields);
+    pendingEdits.set(checkId, pending);
+    scheduleFlush(EDIT_DEBOUNCE_MS);
+}
+
+function scheduleFlush(delay) {
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(() => flushEdits(), delay);
+}
+
+async function flushEdits(options = {}) {
+    clearTimeout(flushTimer);
+
+    // Keep one request in flight; anything queued meanwhile goes in the next one.
+    if (flushInFlight && !options.keepalive) {
+        await flushInFlight;
+    }
+    if (pendingEdits.size === 0) {
+        return;
+    }
+
+    const batch = Array.from(pendingEdits.entries());
+    pendingEdits.clear();
+
+    const edits = batch.map(([checkId, fields]) => {
+        const checkCard = document.querySelector(`.check-card[data-check-id="${checkId}"]`);
+        return {
+            id: parseInt(checkId, 10),
+            version: checkCard ? parseInt(checkCard.dataset.version, 10) : null,
+            fields: fields
+        };
+    });
+
+    flushInFlight = sendEdits(edits, batch, options.keepalive);
     try {
-        const response = await fetch(`/api/check/${checkId}`, {
-            method: 'PUT',
+        await flushInFlight;
+    } finally {
+        flushInFlight = null;
+    }
+
+    if (pendingEdits.size > 0) {
+        scheduleFlush(EDIT_DEBOUNCE_MS);
+    }
+}
+
+async function sendEdits(edits, batch, keepalive) {
+    try {
+        const response = await fetch('/api/checks', {
+            method: 'PATCH',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({
-                [fieldName]: value
-            })
+            body: JSON.stringify({ edits: edits }),
+            keepalive: Boolean(keepalive)
         });
 
-        if (response.ok) {
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+
+        const data = await response.json();
+
+        data.updated.forEach(item => {
+            const checkCard = document.querySelector(`.check-card[data-check-id="${item.id}"]`);
+            if (!checkCard) {
+                return;
+            }
+            checkCard.dataset.version = item.version;
+            const sentFields = Object.keys(edits.find(e => e.id === item.id).fields);
             setTimeout(() => {
-                field.classList.remove('modified');
+                sentFields.forEach(name => {
+                    const input = checkCard.querySelector(`[data-field="${name}"]`);
+                    if (input) {
+                        input.classList.remove('modified');
+                    }
+                });
             }, 1000);
+        });
 
-            if (fieldName === 'amount') {
-                updateTotalAmount();
-            }
+        data.conflicts.forEach(conflict => showConflict(conflict.current));
+        if (data.errors && data.errors.length > 0) {
+            alert('Some edits could not be saved:\n' +
+                  data.errors.map(e => `Check ${e.id != null ? e.id : '#' + (e.index + 1)}: ${e.error}`).join('\n'));
         }
     } catch (error) {
         console.error('Failed to save:', error);
+        // Put the edits back (without overwriting newer ones) and retry later.
+        batch.forEach(([checkId, fields]) => {
+            const newer = pendingEdits.get(checkId) || {};
+            pendingEdits.set(checkId, Object.assign({}, fields, newer));
+        });
+        if (!keepalive) {
+            scheduleFlush(EDIT_DEBOUNCE_MS * 4);
+        }
+    }
+}
+
+function showConflict(current) {
+    const checkCard = document.querySelector(`.check-card[data-check-id="${current.id}"]`);
+    if (!checkCard) {
+        return;
     }
+
+    checkCard.dataset.version = current.version;
+    checkCard.querySelectorAll('.editable-field').forEach(input => {
+        const value = current[input.dataset.field];
+        if (input.dataset.field === 'amount') {
+            input.value = value != null ? Number(value).toFixed(2) : '';
+        } else {
+            input.value = value != null ? value : '';
+        }
+        input.classList.remove('modified');
+    });
+    checkCard.querySelector('.contact-name').textContent = current.hubspot_contact_name || 'Not matched';
+    updateTotalAmount();
+
+    alert(`Check #${current.page_number} was changed by someone else. It has been reloaded; please re-apply your edit.`);
 }
 
 function updateTotalAmount() {
@@ -83,7 +212,7 @@ function updateTotalAmount() {
 function openLightbox(img) {
     const lightbox = document.getElementById('lightbox');
     const lightboxImg = document.getElementById('lightboxImage');
-    lightboxImg.src = img.src;
+    lightboxImg.src = img.dataset.full || img.src;
     lightbox.style.display = 'flex';
 }
 
@@ -147,34 +276,36 @@ async function searchContacts() {
 }
 
 async function selectContact(contactId, contactName) {
-    try {
-        await fetch(`/api/check/${currentCheckId}`, {
-            method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                hubspot_contact_id: contactId,
-                needs_review: false
-            })
-        });
-
-        const checkCard = document.querySelector(`[data-check-id="${currentCheckId}"]`);
-        checkCard.querySelector('.contact-name').textContent = contactName;
-        
-        checkCard.classList.remove('check-needs-review');
-        checkCard.classList.add('check-matched');
-        
-        const badge = checkCard.querySelector('.badge');
-        if (badge) {
-            badge.className = 'badge badge-success';
-            badge.textContent = 'Matched (Manual)';
-        }
+    const checkId = currentCheckId;
+    queueEdit(checkId, {
+        hubspot_contact_id: contactId,
+        hubspot_contact_name: contactName,
+        needs_review: false
+    });
+    flushEdits();
 
-        closeContactModal();
-    } catch (error) {
-        console.error('Failed to select contact:', error);
+    const checkCard = document.querySelector(`[data-check-id="${checkId}"]`);
+    checkCard.querySelector('.contact-name').textContent = contactName;
+    
+    checkCard.classList.remove('check-needs-review');
+    checkCard.classList.add('check-matched');
+    
+    const badge = checkCard.querySelector('.badge');
+    if (badge) {
+        badge.className = 'badge badge-success';
+        badge.textContent = 'Matched (Manual)';
     }
+
+    closeContactModal();
+}
+
+function clearDuplicate(button) {
+    queueEdit(button.dataset.checkId, { duplicate_of_id: null });
+    flushEdits();
+
+    const header = button.closest('.check-header');
+    header.querySelector('.duplicate-badge').remove();
+    button.remove();
 }
 
 async function submitBatch(forceSubmit = false) {
@@ -198,6 +329,8 @@ async function submitBatch(forceSubmit = false) {
     submitBtn.disabled = true;
     submitBtn.textContent = 'Submitting...';
 
+    await flushEdits();
+
     try {
         const response = await fetch(`/api/submit/${batchId}`, {
             method: 'POST',
@@ -207,24 +340,69 @@ async function submitBatch(forceSubmit = false) {
 
         const data = await response.json();
 
-        if (data.success) {
-            alert(`Successfully created ${data.deals_created} deals in HubSpot!`);
-            if (data.errors && data.errors.length > 0) {
-                alert('Some errors occurred:\n' + data.errors.join('\n'));
-            }
-            window.location.href = '/';
+        if (data.success || (response.status === 409 && data.status_url)) {
+            // 409 with a status URL: another tab or reviewer already started it
+            followSubmission(data.status_url);
         } else {
             alert('Submission failed: ' + (data.error || 'Unknown error'));
-            submitBtn.disabled = false;
-            submitBtn.textContent = 'Submit to HubSpot';
+            resetSubmitButton();
         }
     } catch (error) {
         alert('Network error. Please try again.');
-        submitBtn.disabled = false;
-        submitBtn.textContent = 'Submit to HubSpot';
+        resetSubmitButton();
     }
 }
 
+function followSubmission(statusUrl) {
+    const submitBtn = document.getElementById('submitBtn');
+    const eventSource = new EventSource(statusUrl);
+
+    eventSource.onmessage = function(event) {
+        const data = JSON.parse(event.data);
+
+        if (data.status === 'running') {
+            submitBtn.textContent = data.total
+                ? `Submitting ${data.processed || 0} / ${data.total}...`
+                : 'Submitting...';
+            return;
+        }
+
+        eventSource.close();
+
+        if (data.status === 'unknown') {
+            // Running in another server process; its progress isn't visible from here
+            submitBtn.textContent = 'Submitting in the background...';
+            return;
+        }
+
+        if (data.status === 'complete') {
+            alert(`Successfully created ${data.deals_created} deals in HubSpot!`);
+            if (data.errors && data.errors.length > 0) {
+                alert('Some errors occurred:\n' + data.errors.join('\n') +
+                      '\n\nFix these checks and submit again; deals already created will not be duplicated.');
+                resetSubmitButton();
+                return;
+            }
+            window.location.href = '/';
+        } else {
+            alert('Submission failed: ' + (data.message || 'Unknown error'));
+            resetSubmitButton();
+        }
+    };
+
+    eventSource.onerror = function() {
+        eventSource.close();
+        alert('Lost connection while submitting. Submit again to resume; deals already created will not be duplicated.');
+        resetSubmitButton();
+    };
+}
+
+function resetSubmitButton() {
+    const submitBtn = document.getElementById('submitBtn');
+    submitBtn.disabled = false;
+    submitBtn.textContent = 'Submit to HubSpot';
+}
+
 document.addEventListener('keydown', function(e) {
     if (e.key === 'Escape') {
         closeLightbox();
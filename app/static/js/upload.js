@@ -38,34 +38,124 @@ document.addEventListener('DOMContentLoaded', function() {
         btnLoading.style.display = 'inline';
         uploadBtn.disabled = true;
 
-        const formData = new FormData(form);
+        const file = fileInput.files[0];
 
         try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData
-            });
-
-            const data = await response.json();
+            const data = await uploadInChunks(file);
 
             if (data.success) {
+                forgetUpload(file);
                 window.location.href = data.redirect;
             } else {
                 showError(data.error || 'Upload failed');
                 resetButton();
             }
         } catch (error) {
-            showError('Network error. Please try again.');
+            showError(error.message || 'Network error. Please try again.');
             resetButton();
         }
     });
 
+    const MAX_RETRIES = 8;
+
+    function uploadKey(file) {
+        return `upload:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function forgetUpload(file) {
+        localStorage.removeItem(uploadKey(file));
+    }
+
+    async function jsonOrThrow(response) {
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(data.error || `Upload failed (${response.status})`);
+            error.status = response.status;
+            error.data = data;
+            throw error;
+        }
+        return data;
+    }
+
+    async function openSession(file) {
+        // Resume a session left by an earlier attempt at the same file
+        const savedId = localStorage.getItem(uploadKey(file));
+        if (savedId) {
+            const response = await fetch(`/api/uploads/${savedId}`);
+            if (response.ok) {
+                return await response.json();
+            }
+            forgetUpload(file);
+        }
+
+        const session = await jsonOrThrow(await fetch('/api/uploads', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                filename: file.name,
+                size: file.size,
+                appeal_code: form.appeal_code.value,
+                expected_amount: form.expected_amount.value || null
+            })
+        }));
+        localStorage.setItem(uploadKey(file), session.upload_id);
+        return session;
+    }
+
+    async function uploadInChunks(file) {
+        const session = await openSession(file);
+        const url = `/api/uploads/${session.upload_id}`;
+        let offset = session.offset;
+        let failures = 0;
+
+        while (offset < file.size) {
+            showProgress(offset, file.size);
+            const end = Math.min(offset + session.chunk_size, file.size);
+            try {
+                const response = await fetch(url, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Upload-Offset': String(offset)
+                    },
+                    body: file.slice(offset, end)
+                });
+                if (response.status === 409) {
+                    // Server has a different offset (e.g. part of a chunk landed before a drop)
+                    const data = await response.json().catch(() => ({}));
+                    if (data.offset === undefined) throw new Error(data.error || 'Upload conflict');
+                    offset = data.offset;
+                    continue;
+                }
+                offset = (await jsonOrThrow(response)).offset;
+                failures = 0;
+            } catch (error) {
+                if (error.status && error.status !== 409 && error.status < 500) throw error;
+                failures += 1;
+                if (failures > MAX_RETRIES) throw new Error('Upload interrupted. Select the file again to resume.');
+                await new Promise(resolve => setTimeout(resolve, Math.min(30000, 500 * 2 ** failures)));
+                const probe = await fetch(url, {method: 'HEAD'}).catch(() => null);
+                if (probe && probe.ok) offset = parseInt(probe.headers.get('Upload-Offset'), 10);
+            }
+        }
+
+        btnLoading.textContent = 'Validating...';
+        const response = await fetch(`${url}/complete`, {method: 'POST'});
+        if (!response.ok && response.status !== 409) forgetUpload(file);
+        return await jsonOrThrow(response);
+    }
+
+    function showProgress(sent, total) {
+        btnLoading.textContent = `Uploading... ${Math.floor(sent / total * 100)}%`;
+    }
+
     function showError(message) {
         errorDiv.textContent = message;
         errorDiv.style.display = 'block';
     }
 
     function resetButton() {
+        btnLoading.textContent = 'Processing...';
         btnText.style.display = 'inline';
         btnLoading.style.display = 'none';
         uploadBtn.disabled = false;
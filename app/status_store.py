@@ -0,0 +1,150 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+
+
+class MemoryStatusStore:
+    """Per-process status store; only suitable for a single web worker."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def update(self, key, updates):
+        with self._lock:
+            entry = self._data.setdefault(str(key), {})
+            entry.update(updates)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(str(key))
+            return dict(entry) if entry is not None else None
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(str(key), None)
+
+    def prune(self, older_than):
+        # Entries carry no timestamps in memory; they go away with the process.
+        return 0
+
+
+class DatabaseStatusStore:
+    """Status store shared by every process connected to the same database.
+
+    Writes use their own short transaction on the engine, so status updates
+    never flush or commit the caller's ``db.session``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._engine = None
+        self._table = None
+        self._merge_lock = threading.Lock()
+
+    def _get_engine(self):
+        if self._engine is None:
+            from app import db
+            from app.models import ProcessingStatus
+            with self.app.app_context():
+                self._engine = db.engine
+            self._table = ProcessingStatus.__table__
+        return self._engine
+
+    def update(self, key, updates):
+        engine = self._get_engine()
+        table = self._table
+        now = datetime.utcnow()
+
+        if engine.dialect.name == 'postgresql':
+            # Single-statement atomic merge: jsonb || jsonb keeps concurrent
+            # writers from clobbering each other's keys.
+            from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table).values(key=str(key), data=updates, updated_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={
+                    'data': table.c.data.op('||')(stmt.excluded.data),
+                    'updated_at': now,
+                }
+            )
+            with engine.begin() as conn:
+                conn.execute(stmt)
+            return
+
+        # Elsewhere (SQLite) the merge is a read then a write; serialise it so
+        # this process's threads don't drop each other's keys.
+        with self._merge_lock, engine.begin() as conn:
+            row = conn.execute(
+                select(table.c.data).where(table.c.key == str(key))
+            ).first()
+            if row is None:
+                conn.execute(table.insert().values(key=str(key), data=updates, updated_at=now))
+            else:
+                data = dict(row.data or {})
+                data.update(updates)
+                conn.execute(
+                    table.update().where(table.c.key == str(key)).values(data=data, updated_at=now)
+                )
+
+    def get(self, key):
+        engine = self._get_engine()
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(self._table.c.data).where(self._table.c.key == str(key))
+            ).first()
+        if row is None:
+            return None
+        data = row.data
+        if isinstance(data, str):
+            data = json.loads(data)
+        return dict(data or {})
+
+    def delete(self, key):
+        engine = self._get_engine()
+        with engine.begin() as conn:
+            conn.execute(delete(self._table).where(self._table.c.key == str(key)))
+
+    def prune(self, older_than):
+        engine = self._get_engine()
+        cutoff = datetime.utcnow() - older_than
+        with engine.begin() as conn:
+            result = conn.execute(delete(self._table).where(self._table.c.updated_at < cutoff))
+        return result.rowcount
+
+
+STATUS_STORES = {
+    'memory': MemoryStatusStore,
+    'database': DatabaseStatusStore,
+}
+
+_store = MemoryStatusStore()
+
+
+def init_status_store(app):
+    global _store
+    backend = app.config.get('STATUS_STORE', 'memory')
+    if backend not in STATUS_STORES:
+        raise ValueError(f"Unknown STATUS_STORE backend: {backend}")
+    store_cls = STATUS_STORES[backend]
+    _store = store_cls(app) if store_cls is DatabaseStatusStore else store_cls()
+    return _store
+
+
+def get_status_store():
+    return _store
+
+
+def update_status(key, updates):
+    _store.update(key, updates)
+
+
+def get_status(key):
+    status = _store.get(key)
+    return status if status is not None else {'status': 'unknown'}
+
+
+def prune_statuses(max_age_hours):
+    return _store.prune(timedelta(hours=max_age_hours))
@@ -0,0 +1,344 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import Response, request, send_file
+from werkzeug.http import http_date, parse_date
+from werkzeug.security import safe_join
+
+# boto3 takes ~100ms to import; only S3Storage pulls it in.
+BOTO3_AVAILABLE = importlib.util.find_spec('boto3') is not None
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+def normalize_key(key):
+    """Keys are '/'-separated paths relative to the storage root."""
+    key = (key or '').replace('\\', '/').lstrip('/')
+    parts = key.split('/')
+    if not key or any(part in ('', '.', '..') for part in parts):
+        raise StorageError(f'Invalid storage key: {key!r}')
+    return key
+
+
+class LocalStorage:
+    """Blobs as files under UPLOAD_FOLDER (single machine, or a shared mount)."""
+
+    name = 'local'
+
+    def __init__(self, app):
+        self.app = app
+
+    @property
+    def root(self):
+        return self.app.config['UPLOAD_FOLDER']
+
+    def path(self, key):
+        path = safe_join(self.root, normalize_key(key))
+        if path is None:
+            raise StorageError(f'Invalid storage key: {key!r}')
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def modified(self, key):
+        try:
+            return os.path.getmtime(self.path(key))
+        except OSError:
+            return None
+
+    def touch(self, key):
+        os.utime(self.path(key), None)
+
+    def open(self, key):
+        try:
+            return open(self.path(key), 'rb')
+        except FileNotFoundError:
+            raise StorageError(f'No such blob: {key}')
+
+    def write(self, key, stream):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see a partial file.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                shutil.copyfileobj(stream, handle, STREAM_CHUNK_SIZE)
+            os.replace(temp_path, target)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def put_file(self, key, path, move=False):
+        target = self.path(key)
+        if os.path.abspath(path) == os.path.abspath(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if move:
+            os.replace(path, target)
+        else:
+            with open(path, 'rb') as f:
+                self.write(key, f)
+
+    @contextmanager
+    def local_path(self, key):
+        # Batches queued before keys were introduced stored absolute paths.
+        yield key if os.path.isabs(key) else self.path(key)
+
+    def delete(self, key):
+        path = self.path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def iter_keys(self, prefix):
+        """Yield ``(key, size, modified)`` for every blob under ``prefix``."""
+        base = self.path(prefix)
+        for root, _, files in os.walk(base):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, stat.st_size, stat.st_mtime
+
+    def url(self, key, expires):
+        return None
+
+    def send(self, key, mimetype=None, max_age=None):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            raise StorageError(f'No such blob: {key}')
+        return send_file(path, mimetype=mimetype, conditional=True, max_age=max_age)
+
+
+class S3Storage:
+    """Blobs in an S3 bucket or any S3-compatible service (MinIO, LocalStack, R2).
+
+    Credentials come from the usual AWS environment variables / instance role.
+    ``S3_ENDPOINT_URL`` points at a non-AWS service and switches to path-style
+    addressing, which is what local stand-ins expect.
+    """
+
+    name = 's3'
+
+    def __init__(self, app):
+        if not BOTO3_AVAILABLE:
+            raise RuntimeError("STORAGE_BACKEND='s3' requires boto3 (pip install boto3)")
+        import boto3
+        from botocore.config import Config as BotoConfig
+        from botocore.exceptions import ClientError
+        self.ClientError = ClientError
+        config = app.config
+        self.bucket = config.get('S3_BUCKET')
+        if not self.bucket:
+            raise RuntimeError("STORAGE_BACKEND='s3' requires S3_BUCKET")
+        self.prefix = (config.get('S3_PREFIX') or '').strip('/')
+        endpoint_url = config.get('S3_ENDPOINT_URL') or None
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=config.get('S3_REGION') or None,
+            config=BotoConfig(
+                s3={'addressing_style': 'path' if endpoint_url else 'auto'},
+                retries={'max_attempts': 5, 'mode': 'standard'},
+                max_pool_connections=32,
+            ),
+        )
+
+    def _key(self, key):
+        key = normalize_key(key)
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise StorageError(str(e))
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        return head['ContentLength'] if head else None
+
+    def modified(self, key):
+        head = self._head(key)
+        return head['LastModified'].timestamp() if head else None
+
+    def touch(self, key):
+        # S3 has no utime; copying an object onto itself resets LastModified.
+        head = self._head(key)
+        if head is None:
+            return
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self._key(key),
+            CopySource={'Bucket': self.bucket, 'Key': self._key(key)},
+            MetadataDirective='REPLACE', ContentType=head.get('ContentType', 'binary/octet-stream'),
+            Metadata={'touched': datetime.utcnow().isoformat()},
+        )
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self.ClientError as e:
+            raise StorageError(f'No such blob: {key} ({e})')
+
+    def write(self, key, stream):
+        # upload_fileobj streams in multipart chunks rather than buffering the whole object
+        self.client.upload_fileobj(stream, self.bucket, self._key(key),
+                                   ExtraArgs={'ContentType': _content_type(key)})
+
+    def put_file(self, key, path, move=False):
+        self.client.upload_file(path, self.bucket, self._key(key),
+                                ExtraArgs={'ContentType': _content_type(key)})
+        if move:
+            os.remove(path)
+
+    @contextmanager
+    def local_path(self, key):
+        """Download to a temp file for tools that need a real path (pdf2image, tesseract)."""
+        if os.path.isabs(key):
+            yield key
+            return
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                self.client.download_fileobj(self.bucket, self._key(key), handle)
+        except self.ClientError as e:
+            os.remove(temp_path)
+            raise StorageError(f'Could not download {key}: {e}')
+        try:
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+    def delete(self, key):
+        size = self.size(key)
+        if size is None:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return size
+
+    def iter_keys(self, prefix):
+        full_prefix = self._key(prefix).rstrip('/') + '/'
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=full_prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][strip:], item['Size'], item['LastModified'].timestamp()
+
+    def url(self, key, expires):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(key)}, ExpiresIn=expires
+        )
+
+    def send(self, key, mimetype=None, max_age=None):
+        """Proxy an object through the app, honouring If-None-Match / If-Modified-Since
+        and single byte ranges (with If-Range), like ``send_file(conditional=True)``."""
+        head = self._head(key)
+        if head is None:
+            raise StorageError(f'No such blob: {key}')
+        etag = head['ETag'].strip('"')
+        last_modified = head['LastModified']
+        length = head['ContentLength']
+
+        response = Response(mimetype=mimetype or head.get('ContentType'))
+        response.set_etag(etag)
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.cache_control.max_age = max_age
+
+        since = parse_date(request.headers.get('If-Modified-Since'))
+        if etag in request.if_none_match or (since and last_modified.replace(microsecond=0) <= since):
+            response.status_code = 304
+            return response
+
+        byte_range = self._requested_range(etag, last_modified, length)
+        if byte_range == 'unsatisfiable':
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{length}'
+            return response
+
+        options = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if byte_range:
+            start, stop = byte_range
+            options['Range'] = f'bytes={start}-{stop - 1}'
+            response.status_code = 206
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{length}'
+            length = stop - start
+
+        body = self.client.get_object(**options)['Body']
+        response.response = body.iter_chunks(STREAM_CHUNK_SIZE)
+        response.call_on_close(body.close)
+        response.headers['Content-Length'] = str(length)
+        response.direct_passthrough = True
+        return response
+
+    def _requested_range(self, etag, last_modified, length):
+        # ``(start, stop)``, 'unsatisfiable', or None to send the whole object.
+        # Multi-range requests get the whole object, which RFC 9110 allows.
+        if request.range is None or len(request.range.ranges) != 1:
+            return None
+        if_range = request.if_range
+        if if_range.etag is not None and if_range.etag != etag:
+            return None
+        if if_range.date is not None and last_modified.replace(microsecond=0) > if_range.date:
+            return None
+        byte_range = request.range.range_for_length(length)
+        return byte_range if byte_range else 'unsatisfiable'
+
+
+def _content_type(key):
+    return {
+        '.pdf': 'application/pdf',
+        '.png': 'image/png',
+        '.webp': 'image/webp',
+        '.jpeg': 'image/jpeg',
+    }.get(os.path.splitext(key)[1].lower(), 'application/octet-stream')
+
+
+STORAGE_BACKENDS = {
+    'local': LocalStorage,
+    's3': S3Storage,
+}
+
+_storage = None
+
+
+def init_storage(app):
+    global _storage
+    backend = app.config.get('STORAGE_BACKEND', 'local')
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    _storage = STORAGE_BACKENDS[backend](app)
+    return _storage
+
+
+def get_storage():
+    return _storage
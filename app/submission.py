@@ -0,0 +1,264 @@
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+
+from app import db
+from app.models import Batch, Check
+from app.hubspot import HubSpotClient
+from app.status_store import update_status, get_status
+from config import Config
+
+# A job whose heartbeat is older than this is assumed to have died with its
+# process and may be resumed by a new submission.
+STALE_AFTER = timedelta(minutes=Config.SUBMISSION_STALE_MINUTES)
+
+# Statuses a submission may start from ('submitted' re-runs are no-ops)
+SUBMITTABLE = ('ready', 'submit_incomplete', 'submitted')
+
+
+def submission_status_key(batch_id):
+    return f'submit_{batch_id}'
+
+
+def get_submission_status(batch_id):
+    return get_status(submission_status_key(batch_id))
+
+
+def claim_submission(batch_id):
+    """Move the batch to 'submitting' if nothing else holds it; True if this caller won.
+
+    One conditional UPDATE, so concurrent requests in any number of processes
+    cannot both start a job. A 'submitting' batch whose heartbeat went stale
+    is claimed again (its job died).
+    """
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(Batch)
+        .where(Batch.id == batch_id)
+        .where(or_(
+            Batch.status.in_(SUBMITTABLE),
+            and_(Batch.status == 'submitting',
+                 or_(Batch.submission_heartbeat.is_(None), Batch.submission_heartbeat < now - STALE_AFTER)),
+        ))
+        .values(status='submitting', submission_heartbeat=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+class BatchSubmitter:
+    """Creates HubSpot deals for a batch in a background thread.
+
+    Safe to run repeatedly: checks that already have a ``hubspot_deal_id`` are
+    skipped, and every check gets a ``submission_key`` that is committed
+    before its deal is sent and written into the deal description. If a
+    previous run died after HubSpot created a deal but before we stored its
+    id, the deal is found again by that key instead of being duplicated.
+    Deals whose contact association failed (``hubspot_associated`` False)
+    are associated again on the next run; the batch is not 'submitted'
+    until they are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.hubspot = HubSpotClient()
+
+    def submit(self, batch_id):
+        """Start the job for a batch already claimed with ``claim_submission``."""
+        update_status(submission_status_key(batch_id), {
+            'status': 'running',
+            'heartbeat': datetime.utcnow().isoformat(),
+            'total': 0,
+            'processed': 0,
+            'deals_created': 0,
+            'errors': [],
+            'message': 'Starting submission...'
+        })
+        thread = threading.Thread(target=self._submit_in_background, args=(batch_id,))
+        thread.daemon = True
+        thread.start()
+
+    def _progress(self, batch_id, updates):
+        now = datetime.utcnow()
+        updates['heartbeat'] = now.isoformat()
+        update_status(submission_status_key(batch_id), updates)
+        db.session.execute(
+            update(Batch).where(Batch.id == batch_id, Batch.status == 'submitting')
+            .values(submission_heartbeat=now).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def _submit_in_background(self, batch_id):
+        with self.app.app_context():
+            try:
+                self._run(batch_id)
+            except Exception as e:
+                print(f"Submission error: {e}")
+                db.session.rollback()
+                db.session.execute(
+                    update(Batch).where(Batch.id == batch_id).values(status='submit_incomplete')
+                )
+                db.session.commit()
+                self._progress(batch_id, {'status': 'error', 'message': str(e)})
+
+    def _run(self, batch_id):
+        batch = db.session.get(Batch, batch_id)
+        if not batch:
+            self._progress(batch_id, {'status': 'error', 'message': 'Batch not found'})
+            return
+
+        checks = Check.query.filter_by(batch_id=batch_id).order_by(Check.page_number).all()
+
+        errors = []
+        already_submitted = 0
+        pending = []
+        unassociated = []
+        for check in checks:
+            if check.is_money_order:
+                continue
+            if check.hubspot_deal_id:
+                if check.hubspot_associated is False:
+                    unassociated.append(check)
+                already_submitted += 1
+                continue
+            if not check.amount:
+                errors.append(f"Check #{check.page_number}: Missing amount")
+                continue
+            if check.duplicate_of_id:
+                errors.append(f"Check #{check.page_number}: Possible duplicate of check {check.duplicate_of_id}; "
+                              f"clear the flag or delete it before submitting")
+                continue
+            pending.append(check)
+
+        recovered, unresolved = self._recover_in_doubt(pending)
+        already_submitted += recovered
+        for check in pending:
+            if check.id in unresolved:
+                errors.append(f"Check #{check.page_number}: Could not confirm whether its deal was already created "
+                              f"({unresolved[check.id]}); submit again to retry")
+        unassociated += [c for c in pending if c.hubspot_deal_id and c.hubspot_associated is False]
+        pending = [c for c in pending if not c.hubspot_deal_id and c.id not in unresolved]
+        errors += self._associate_outstanding(unassociated)
+
+        self._progress(batch_id, {
+            'total': len(pending),
+            'already_submitted': already_submitted,
+            'errors': errors,
+            'message': f'Submitting {len(pending)} deals...'
+        })
+
+        deals_created = 0
+        sent = 0
+        chunk_size = Config.HUBSPOT_BATCH_SIZE
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+
+            for check in chunk:
+                if not check.submission_key:
+                    check.submission_key = uuid.uuid4().hex
+            db.session.commit()
+
+            items = []
+            for check in chunk:
+                check_data = check.to_dict()
+                check_data['submission_key'] = check.submission_key
+                items.append((check.id, check_data, check.hubspot_contact_id))
+
+            results = self.hubspot.create_deals_batch(items, batch.appeal_code)
+
+            for check in chunk:
+                result = results.get(check.id, {'deal_id': None, 'error': 'No response for check'})
+                if result['deal_id']:
+                    check.hubspot_deal_id = result['deal_id']
+                    check.hubspot_associated = result.get('associated')
+                    deals_created += 1
+                if result['error']:
+                    errors.append(f"Check #{check.page_number}: {result['error']}")
+            db.session.commit()
+
+            sent += len(chunk)
+            self._progress(batch_id, {
+                'processed': sent,
+                'deals_created': deals_created,
+                'errors': errors,
+                'message': f'Submitted {sent} of {len(pending)} deals...'
+            })
+
+        report = {
+            'deals_created': deals_created,
+            'already_submitted': already_submitted,
+            'errors': errors,
+            'finished': datetime.utcnow().isoformat()
+        }
+
+        batch = db.session.get(Batch, batch_id)
+        batch.submission_report = json.dumps(report)
+        if errors:
+            batch.status = 'submit_incomplete'
+            message = f'Created {deals_created} deals with {len(errors)} errors. Fix them and submit again to resume.'
+        else:
+            batch.status = 'submitted'
+            batch.submitted_date = datetime.utcnow()
+            message = f'Created {deals_created} deals.'
+        db.session.commit()
+
+        self._progress(batch_id, {
+            'status': 'complete',
+            'deals_created': deals_created,
+            'errors': errors,
+            'report': report,
+            'batch_status': batch.status,
+            'message': message
+        })
+
+    def _recover_in_doubt(self, checks):
+        # A key without a deal id means a previous run sent the deal but may
+        # not have recorded the answer. Returns the number recovered and, for
+        # checks whose search failed, the error: those stay in doubt and are
+        # not resent, or HubSpot could end up with the deal twice.
+        recovered = 0
+        unresolved = {}
+        for check in checks:
+            if not check.submission_key:
+                continue
+            try:
+                deal_id = self.hubspot.find_deal_by_submission_key(check.submission_key)
+            except Exception as e:
+                print(f"Deal search error for check {check.id}: {e}")
+                unresolved[check.id] = str(e)
+                continue
+            if deal_id:
+                check.hubspot_deal_id = deal_id
+                # The run that created it may have died before associating it
+                check.hubspot_associated = False if check.hubspot_contact_id else None
+                recovered += 1
+        if recovered:
+            db.session.commit()
+        return recovered, unresolved
+
+    def _associate_outstanding(self, checks):
+        # Deals created by an earlier run whose contact association failed
+        if not checks:
+            return []
+        by_id = {}
+        for check in checks:
+            if check.hubspot_contact_id:
+                by_id[check.id] = check
+            else:
+                check.hubspot_associated = None  # contact cleared since; nothing owed
+        failed = set(self.hubspot.associate_deals(
+            [(check.id, check.hubspot_deal_id, check.hubspot_contact_id) for check in by_id.values()]
+        )) if by_id else set()
+        errors = []
+        for check_id, check in by_id.items():
+            if check_id in failed:
+                errors.append(f"Check #{check.page_number}: Deal {check.hubspot_deal_id} still has no contact "
+                              f"association; submit again to retry")
+            else:
+                check.hubspot_associated = True
+        db.session.commit()
+        return errors
@@ -0,0 +1,373 @@
+import base64
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.models import Batch
+from app.storage import get_storage
+from config import Config
+
+INCOMING_DIR = '_incoming'
+PDF_DIR = 'pdfs'
+READ_SIZE = 64 * 1024
+
+# Page objects in uncompressed PDFs; only a progress hint, since pages kept in
+# object streams are invisible to it. pdfinfo gives the real count at the end.
+PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+PAGE_PATTERN_OVERLAP = 32
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Progress:
+    """Page-count state for the bytes received so far.
+
+    Small enough to live in the upload's sidecar, so any worker can pick up
+    the next chunk without re-reading the part file.
+    """
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.offset = state.get('offset', 0)
+        self.head = base64.b64decode(state.get('head', ''))
+        self.tail = base64.b64decode(state.get('tail', ''))
+        self._pages = state.get('pages', 0)
+
+    @property
+    def pages_seen(self):
+        return self._pages + len(PAGE_PATTERN.findall(self.tail))
+
+    def state(self):
+        return {
+            'offset': self.offset,
+            'head': base64.b64encode(self.head).decode(),
+            'tail': base64.b64encode(self.tail).decode(),
+            'pages': self._pages,
+        }
+
+    def feed(self, data):
+        if len(self.head) < 5:
+            self.head += data[:5 - len(self.head)]
+        # Markers can be split across reads, so the end of each window is
+        # carried over and only counted once it can no longer grow.
+        window = self.tail + data
+        self.tail = window[-PAGE_PATTERN_OVERLAP:]
+        self._pages += len(PAGE_PATTERN.findall(window)) - len(PAGE_PATTERN.findall(self.tail))
+        self.offset += len(data)
+
+
+class _Hasher:
+    """SHA-256 of a part file's first ``offset`` bytes."""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.offset = 0
+
+    def update(self, data):
+        self.sha256.update(data)
+        self.offset += len(data)
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(1024 * 1024, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+class UploadManager:
+    """Resumable chunked uploads streamed straight to disk.
+
+    Each upload is a ``<id>.part`` file plus a ``<id>.json`` sidecar under
+    ``UPLOAD_FOLDER/_incoming``. The part file's size is the resume offset,
+    so an interrupted client (or a restarted server) continues where it left
+    off, and any web worker may receive any chunk: writers take an exclusive
+    ``flock`` on the part file, and the page scan state is kept in the
+    sidecar. hashlib state can't be saved, so each process keeps its own
+    running hash and only reads the bytes other workers appended since it
+    last saw the file; every byte is hashed at most once per process.
+    """
+
+    def __init__(self, upload_folder):
+        self.directory = os.path.join(upload_folder, INCOMING_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self._hashers = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            raise UploadError('Upload not found', 404)
+        base = os.path.join(self.directory, upload_id)
+        return base + '.part', base + '.json'
+
+    @contextlib.contextmanager
+    def _locked(self, upload_id, blocking=True):
+        """Hold an exclusive lock on the part file; yields it open for appending."""
+        part_path, _ = self._paths(upload_id)
+        try:
+            fd = os.open(part_path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            raise UploadError('Upload not found', 404)
+        with os.fdopen(fd, 'ab') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                raise UploadError('Another chunk is being written', 409)
+            yield f
+
+    def _load(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Upload not found', 404)
+        meta['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return meta
+
+    def _save(self, upload_id, meta):
+        _, meta_path = self._paths(upload_id)
+        temp_path = meta_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+    def create(self, filename, size, appeal_code='020', expected_amount=None):
+        filename = secure_filename(filename or '')
+        if not filename or not filename.lower().endswith('.pdf'):
+            raise UploadError('Only PDF files are allowed')
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadError('File size is required')
+        if size <= 0:
+            raise UploadError('File is empty')
+        if size > Config.MAX_UPLOAD_SIZE:
+            raise UploadError('File is too large', 413)
+
+        self.prune(Config.UPLOAD_SESSION_TTL_HOURS)
+
+        upload_id = uuid.uuid4().hex
+        meta = {
+            'id': upload_id,
+            'filename': filename,
+            'size': size,
+            'appeal_code': appeal_code or '020',
+            'expected_amount': expected_amount,
+            'created_at': datetime.utcnow().isoformat(),
+            'pages_seen': 0,
+        }
+        part_path, _ = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        self._save(upload_id, meta)
+        return self.describe(upload_id)
+
+    def describe(self, upload_id):
+        meta = self._load(upload_id)
+        return {
+            'upload_id': upload_id,
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': meta['offset'],
+            'pages_seen': meta['pages_seen'],
+            'chunk_size': Config.UPLOAD_CHUNK_SIZE,
+        }
+
+    def _progress(self, meta, part_path):
+        # Call with the part file locked. The sidecar can trail the part file
+        # if a worker died mid-chunk; scan just the bytes it missed.
+        progress = _Progress(meta.get('scan'))
+        if progress.offset > meta['offset']:
+            progress = _Progress()
+        for block in _read_range(part_path, progress.offset, meta['offset']):
+            progress.feed(block)
+        return progress
+
+    def _hasher(self, upload_id, part_path, offset):
+        # Call with the part file locked; catches up on bytes written elsewhere.
+        with self._lock:
+            hasher = self._hashers.get(upload_id)
+            if hasher is None or hasher.offset > offset:
+                hasher = self._hashers[upload_id] = _Hasher()
+        for block in _read_range(part_path, hasher.offset, offset):
+            hasher.update(block)
+        return hasher
+
+    def write_chunk(self, upload_id, offset, stream, length=None):
+        """Append a chunk read from ``stream`` at ``offset``; returns the new offset."""
+        with self._locked(upload_id, blocking=False) as f:
+            meta = self._load(upload_id)
+            part_path, _ = self._paths(upload_id)
+            if offset != meta['offset']:
+                raise UploadError('Offset mismatch', 409, offset=meta['offset'])
+
+            remaining = meta['size'] - meta['offset']
+            if length is not None and length > remaining:
+                raise UploadError('Chunk runs past the declared file size', 413, offset=meta['offset'])
+
+            progress = self._progress(meta, part_path)
+            hasher = self._hasher(upload_id, part_path, meta['offset'])
+            while True:
+                data = stream.read(min(READ_SIZE, remaining + 1))
+                if not data:
+                    break
+                if len(data) > remaining:
+                    f.truncate(progress.offset)
+                    raise UploadError('Chunk runs past the declared file size', 413, offset=progress.offset)
+                if progress.offset < 5 and not self._header_ok(progress, data):
+                    f.truncate(progress.offset)
+                    raise UploadError('Invalid PDF file format')
+                f.write(data)
+                progress.feed(data)
+                hasher.update(data)
+                remaining -= len(data)
+
+            meta['scan'] = progress.state()
+            meta['pages_seen'] = progress.pages_seen
+            self._save(upload_id, meta)
+            return progress.offset
+
+    def _header_ok(self, progress, data):
+        head = progress.head + data[:5 - len(progress.head)]
+        return b'%PDF-'.startswith(head)
+
+    def complete(self, upload_id, expected_sha256=None):
+        """Validate the finished file and move it into the upload folder.
+
+        Returns ``(path, meta)`` where meta gains ``sha256`` and ``page_count``.
+        """
+        with self._locked(upload_id):
+            meta = self._load(upload_id)
+            part_path, meta_path = self._paths(upload_id)
+            if meta['offset'] != meta['size']:
+                raise UploadError('Upload is incomplete', 409, offset=meta['offset'])
+
+            sha256 = self._hasher(upload_id, part_path, meta['offset']).sha256.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                raise UploadError('Checksum mismatch', 422)
+
+            with open(part_path, 'rb') as f:
+                f.seek(max(0, meta['size'] - 1024))
+                if b'%%EOF' not in f.read():
+                    raise UploadError('PDF is truncated (no %%EOF marker)', 422)
+            from pdf2image import pdfinfo_from_path
+            from pdf2image.exceptions import PDFInfoNotInstalledError
+            try:
+                page_count = int(pdfinfo_from_path(part_path)['Pages'])
+            except PDFInfoNotInstalledError as e:
+                # Can't validate here; the processor will report a bad file.
+                print(f"Skipping PDF validation for upload {upload_id}: {e}")
+                page_count = None
+            except Exception as e:
+                raise UploadError(f'Could not read PDF structure: {e}', 422)
+            if page_count is not None and page_count < 1:
+                raise UploadError('PDF has no pages', 422)
+
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            upload_folder = os.path.dirname(self.directory)
+            path = os.path.join(upload_folder, f"{timestamp}_{meta['filename']}")
+            os.replace(part_path, path)
+            os.remove(meta_path)
+            self._forget(upload_id)
+
+        meta.pop('scan', None)
+        meta.update({'sha256': sha256, 'page_count': page_count})
+        return path, meta
+
+    def abort(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with self._locked(upload_id):
+                for path in (part_path, meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+        except UploadError:
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+        self._forget(upload_id)
+
+    def _forget(self, upload_id):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+
+    def prune(self, max_age_hours):
+        """Remove sessions untouched for ``max_age_hours``."""
+        cutoff = time.time() - max_age_hours * 3600
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    self._forget(name.split('.')[0])
+            except OSError:
+                pass
+
+
+def start_batch(app, path, filename, appeal_code, expected_amount=None, source_digest=None, page_count=None):
+    """Move an uploaded PDF into blob storage, create its batch row and queue it for processing."""
+    from app.processor import CheckProcessor
+
+    processor = CheckProcessor(app)
+    if not page_count:
+        page_count = processor._count_pages(path)
+
+    key = f"{PDF_DIR}/{os.path.basename(path)}"
+    get_storage().put_file(key, path, move=True)
+
+    batch = Batch()
+    batch.filename = filename
+    batch.appeal_code = appeal_code
+    batch.status = 'processing'
+    batch.source_digest = source_digest
+    batch.pdf_path = key
+    if expected_amount:
+        try:
+            batch.expected_amount = float(expected_amount)
+        except (TypeError, ValueError):
+            pass
+    db.session.add(batch)
+    db.session.commit()
+
+    processor.process_batch(batch.id, key, appeal_code, page_count=page_count)
+    return batch
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_upload_manager(app):
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = UploadManager(app.config['UPLOAD_FOLDER'])
+        return _manager
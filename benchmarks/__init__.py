@@ -0,0 +1 @@
+"""Benchmark and load-test tooling. Not imported by the app."""
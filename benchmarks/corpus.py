@@ -0,0 +1,223 @@
+"""Synthetic deposit PDFs with known ground truth.
+
+Bank deposits (appeal 035) look like the lockbox scans we receive: a bank
+report header page, then each check followed by its buck slip, with the
+occasional blank check back. General mail deposits (020) are check and
+money-order fronts only.
+
+    python -m benchmarks.corpus --out /tmp/corpus --deposits 5 --checks 20
+"""
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_SIZE = (2550, 1100)  # 8.5in x ~3.7in at 300 dpi, roughly a scanned check
+DPI = 300
+
+FIRST_NAMES = ['John', 'Mary', 'Robert', 'Linda', 'Michael', 'Barbara', 'William', 'Susan',
+               'James', 'Karen', 'David', 'Nancy', 'Thomas', 'Betty', 'Charles', 'Helen']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Miller', 'Davis', 'Wilson',
+              'Taylor', 'Anderson', 'Thomas', 'Moore', 'Martin', 'Jackson', 'Thompson', 'White']
+STREETS = ['Main Street', 'Oak Ave', 'Maple Drive', 'Cedar Lane', 'Elm Court', 'Pine Road',
+           'Lakeview Blvd', 'Hillside Way']
+CITIES = [('Springfield', 'IL', '62701'), ('Denver', 'CO', '80202'), ('Fresno', 'CA', '93721'),
+          ('Albany', 'NY', '12207'), ('Austin', 'TX', '78701'), ('Salem', 'OR', '97301'),
+          ('Dayton', 'OH', '45402'), ('Macon', 'GA', '31201')]
+
+WORDS = ['Zero', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten',
+         'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen',
+         'Eighteen', 'Nineteen']
+TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+
+
+def _font(size):
+    for name in ('DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def amount_in_words(amount):
+    dollars = int(amount)
+    cents = round((amount - dollars) * 100)
+
+    def words(n):
+        if n < 20:
+            return WORDS[n]
+        if n < 100:
+            return TENS[n // 10] + ('-' + WORDS[n % 10] if n % 10 else '')
+        if n < 1000:
+            return WORDS[n // 100] + ' Hundred' + (' ' + words(n % 100) if n % 100 else '')
+        return words(n // 1000) + ' Thousand' + (' ' + words(n % 1000) if n % 1000 else '')
+
+    return f"{words(dollars)} and {cents:02d}/100 Dollars"
+
+
+def random_donor(rng):
+    city, state, zip_code = rng.choice(CITIES)
+    return {
+        'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        'address_line1': f"{rng.randint(10, 9999)} {rng.choice(STREETS)}",
+        'city': city,
+        'state': state,
+        'zip_code': zip_code,
+    }
+
+
+def random_check(rng, money_order=False):
+    donor = random_donor(rng)
+    amount = rng.choice([10, 20, 25, 50, 100, 250]) if rng.random() < 0.6 else round(rng.uniform(5, 2000), 2)
+    return dict(
+        donor,
+        kind='money_order' if money_order else 'check',
+        amount=f"{amount:.2f}",
+        check_number=str(rng.randint(100, 9999)),
+        check_date=(date(2024, 1, 1) + timedelta(days=rng.randint(0, 365))).isoformat(),
+        is_money_order=money_order,
+    )
+
+
+class PageRenderer:
+    def __init__(self, rng, noise=0.0):
+        self.rng = rng
+        self.noise = noise
+        self.large = _font(54)
+        self.medium = _font(40)
+        self.small = _font(30)
+
+    def _page(self):
+        return Image.new('L', PAGE_SIZE, 255)
+
+    def _finish(self, image):
+        if self.noise:
+            # Speckle like a dusty scanner glass
+            draw = ImageDraw.Draw(image)
+            for _ in range(int(self.noise * 4000)):
+                x, y = self.rng.randrange(PAGE_SIZE[0]), self.rng.randrange(PAGE_SIZE[1])
+                draw.point((x, y), fill=self.rng.randint(0, 120))
+            image = image.rotate(self.rng.uniform(-self.noise, self.noise) * 2, fillcolor=255)
+        return image
+
+    def check(self, truth, banner=True):
+        image = self._page()
+        draw = ImageDraw.Draw(image)
+        month, day, year = truth['check_date'][5:7], truth['check_date'][8:10], truth['check_date'][:4]
+        if banner:
+            draw.text((60, 30), 'Front Image - Check', font=self.small, fill=0)
+        draw.text((120, 110), truth['name'], font=self.medium, fill=0)
+        draw.text((120, 160), truth['address_line1'], font=self.medium, fill=0)
+        draw.text((120, 210), f"{truth['city']}, {truth['state']} {truth['zip_code']}", font=self.medium, fill=0)
+        if truth['is_money_order']:
+            draw.text((1300, 110), 'POSTAL MONEY ORDER', font=self.large, fill=0)
+        draw.text((2150, 110), truth['check_number'], font=self.medium, fill=0)
+        draw.text((1800, 260), f"Date {month}/{day}/{year}", font=self.medium, fill=0)
+        draw.text((120, 400), 'PAY TO THE ORDER OF  Family Radio', font=self.medium, fill=0)
+        draw.rectangle((1950, 390, 2400, 460), outline=0, width=3)
+        draw.text((1980, 400), f"${truth['amount']}", font=self.medium, fill=0)
+        draw.text((120, 520), amount_in_words(float(truth['amount'])), font=self.medium, fill=0)
+        draw.line((120, 850, 1100, 850), fill=0, width=2)
+        draw.text((120, 870), 'MEMO', font=self.small, fill=0)
+        draw.text((200, 980), f"a{self.rng.randint(10**8, 10**9 - 1)}a {self.rng.randint(10**9, 10**10 - 1)}c "
+                              f"{truth['check_number']}", font=self.medium, fill=0)
+        return self._finish(image)
+
+    def buckslip(self, truth, appeal_code):
+        image = self._page()
+        draw = ImageDraw.Draw(image)
+        draw.text((60, 30), 'Front Image - Document', font=self.small, fill=0)
+        draw.text((120, 200), truth['name'], font=self.large, fill=0)
+        draw.text((120, 270), truth['address_line1'], font=self.large, fill=0)
+        draw.text((120, 340), f"{truth['city']}, {truth['state']} {truth['zip_code']}", font=self.large, fill=0)
+        draw.text((1500, 200), 'Thank you for your gift!', font=self.medium, fill=0)
+        draw.text((1500, 600), f"Appeal {appeal_code}", font=self.small, fill=0)
+        return self._finish(image)
+
+    def blank_back(self):
+        image = self._page()
+        draw = ImageDraw.Draw(image)
+        draw.text((60, 30), 'Back Image', font=self.small, fill=0)
+        draw.text((800, 500), 'FOR DEPOSIT ONLY', font=self.medium, fill=0)
+        return self._finish(image)
+
+    def report_header(self, deposit_date, count, total):
+        image = self._page()
+        draw = ImageDraw.Draw(image)
+        draw.text((120, 100), 'Lockbox Batch Detail Report', font=self.large, fill=0)
+        draw.text((120, 220), f"Deposit Date {deposit_date}    Site Code 4471    Page 1 of 1", font=self.medium, fill=0)
+        draw.text((120, 300), f"Transaction Count {count}    Batch Total {total:.2f}", font=self.medium, fill=0)
+        return self._finish(image)
+
+
+def make_deposit(rng, renderer, appeal_code, check_count):
+    """Return ``(images, ground_truth_pages)`` for one deposit."""
+    images = []
+    pages = []
+    checks = [random_check(rng, money_order=appeal_code == '020' and rng.random() < 0.1)
+              for _ in range(check_count)]
+
+    if appeal_code == '035':
+        total = sum(float(c['amount']) for c in checks)
+        images.append(renderer.report_header(date(2024, 6, 3).isoformat(), check_count, total))
+        pages.append({'kind': 'report_header'})
+
+    for index, truth in enumerate(checks):
+        images.append(renderer.check(truth, banner=appeal_code == '035'))
+        pages.append(dict(truth, check_index=index))
+        if appeal_code == '035':
+            if rng.random() < 0.15:
+                images.append(renderer.blank_back())
+                pages.append({'kind': 'blank_back', 'check_index': index})
+            images.append(renderer.buckslip(truth, appeal_code))
+            pages.append({'kind': 'buckslip', 'check_index': index, 'name': truth['name'],
+                          'zip_code': truth['zip_code']})
+
+    return images, pages
+
+
+def generate_corpus(out_dir, deposits=4, checks=10, seed=1234, noise=0.0, appeal_codes=('035', '020')):
+    """Write deposit PDFs plus a ``manifest.json`` of ground truth; returns the manifest."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    renderer = PageRenderer(rng, noise=noise)
+
+    manifest = {'seed': seed, 'noise': noise, 'dpi': DPI, 'deposits': []}
+    for number in range(deposits):
+        appeal_code = appeal_codes[number % len(appeal_codes)]
+        images, pages = make_deposit(rng, renderer, appeal_code, checks)
+        filename = f"deposit_{number:03d}_{appeal_code}.pdf"
+        images[0].save(os.path.join(out_dir, filename), 'PDF', resolution=DPI,
+                       save_all=True, append_images=images[1:])
+        for image in images:
+            image.close()
+        manifest['deposits'].append({'filename': filename, 'appeal_code': appeal_code, 'pages': pages})
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--deposits', type=int, default=4)
+    parser.add_argument('--checks', type=int, default=10, help='Checks per deposit')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--noise', type=float, default=0.0, help='0 = clean, 1 = heavy speckle and skew')
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.out, args.deposits, args.checks, args.seed, args.noise)
+    pages = sum(len(d['pages']) for d in manifest['deposits'])
+    print(f"Wrote {len(manifest['deposits'])} deposits ({pages} pages) to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""Local stand-in for the HubSpot CRM endpoints the app calls.
+
+Serves contact list/search/get, deal search, batch deal create, single deal
+create and associations from memory, with configurable latency and rate
+limiting so retry/back-off behavior can be exercised. Point the app at it with
+``HUBSPOT_BASE_URL=http://127.0.0.1:<port>`` and any ``HUBSPOT_API_KEY``.
+
+    python -m benchmarks.hubspot_stub --port 8999 --latency-ms 80 --rate-limit 10
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.corpus import CITIES, FIRST_NAMES, LAST_NAMES, STREETS
+
+
+def make_contacts(count, seed=1, donors=()):
+    """``count`` random contacts, plus one contact for each donor dict given."""
+    rng = random.Random(seed)
+    modified = datetime(2024, 1, 1, tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z')
+    contacts = []
+    for donor in donors:
+        first, _, last = donor['name'].partition(' ')
+        contacts.append({
+            'firstname': first, 'lastname': last, 'address': donor.get('address_line1', ''),
+            'city': donor.get('city', ''), 'state': donor.get('state', ''), 'zip': donor.get('zip_code', ''),
+        })
+    for _ in range(count):
+        city, state, zip_code = rng.choice(CITIES)
+        contacts.append({
+            'firstname': rng.choice(FIRST_NAMES), 'lastname': rng.choice(LAST_NAMES),
+            'address': f"{rng.randint(10, 9999)} {rng.choice(STREETS)}",
+            'city': city, 'state': state, 'zip': zip_code,
+        })
+    return [
+        {'id': str(index), 'properties': dict(props, email='', lastmodifieddate=modified)}
+        for index, props in enumerate(contacts, start=1)
+    ]
+
+
+class _RateLimiter:
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self._window = int(time.time())
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if not self.per_second:
+            return True
+        with self._lock:
+            now = int(time.time())
+            if now != self._window:
+                self._window, self._count = now, 0
+            self._count += 1
+            return self._count <= self.per_second
+
+
+class HubSpotStub:
+    """Threaded fake HubSpot server.
+
+    ``latency_ms``/``jitter_ms`` delay every response; ``rate_limit`` is
+    requests per second before answering 429 with ``Retry-After``;
+    ``error_rate`` answers a random fraction of requests with 429 regardless.
+    Batch create echoes ``objectWriteTraceId`` unless ``echo_trace_ids`` is
+    off, and ``shuffle_results`` returns its results out of input order (both
+    are allowed by HubSpot's API).
+    Counters of calls, 429s and created deals are kept for assertions.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, contacts=None, latency_ms=0, jitter_ms=0,
+                 rate_limit=0, error_rate=0.0, retry_after=1, seed=1, echo_trace_ids=True,
+                 shuffle_results=False):
+        self.contacts = contacts if contacts is not None else make_contacts(1000, seed=seed)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.echo_trace_ids = echo_trace_ids
+        self.shuffle_results = shuffle_results
+        self.limiter = _RateLimiter(rate_limit)
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.deals = {}
+        self.associations = []
+        self._deal_ids = itertools.count(100000)
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(_Handler):
+            pass
+        Handler.stub = stub
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'throttled': dict(self.throttled),
+                'deals_created': len(self.deals),
+                'associations': len(self.associations),
+            }
+
+    def search_contacts(self, body):
+        filters = [f for group in body.get('filterGroups', []) for f in group.get('filters', [])]
+        limit = body.get('limit', 20)
+        start = int(body.get('after') or 0)
+        matches = self.contacts
+        for f in filters:
+            name, op, value = f.get('propertyName'), f.get('operator'), str(f.get('value', ''))
+            if name == 'lastmodifieddate':
+                continue
+            if op == 'CONTAINS_TOKEN':
+                matches = [c for c in matches if value.lower() in (c['properties'].get(name) or '').lower().split()]
+            elif op == 'EQ':
+                matches = [c for c in matches if (c['properties'].get(name) or '') == value]
+        return _page(matches, start, limit)
+
+    def search_deals(self, body):
+        filters = [f for group in body.get('filterGroups', []) for f in group.get('filters', [])]
+        with self._lock:
+            deals = list(self.deals.values())
+        for f in filters:
+            deals = [d for d in deals if str(f.get('value', '')) in (d['properties'].get(f.get('propertyName')) or '')]
+        return {'total': len(deals), 'results': deals[:body.get('limit', 10)]}
+
+    def create_deal(self, properties):
+        with self._lock:
+            deal_id = str(next(self._deal_ids))
+            self.deals[deal_id] = {'id': deal_id, 'properties': properties}
+        return self.deals[deal_id]
+
+    def associate(self, deal_id, contact_id):
+        with self._lock:
+            self.associations.append((str(deal_id), str(contact_id)))
+
+
+def _page(items, start, limit):
+    body = {'total': len(items), 'results': items[start:start + limit]}
+    if start + limit < len(items):
+        body['paging'] = {'next': {'after': str(start + limit)}}
+    return body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    stub = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def _admit(self, route):
+        stub = self.stub
+        with stub._lock:
+            stub.calls[route] += 1
+        delay = stub.latency_ms + (stub.rng.uniform(0, stub.jitter_ms) if stub.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000.0)
+        if not stub.limiter.allow() or (stub.error_rate and stub.rng.random() < stub.error_rate):
+            with stub._lock:
+                stub.throttled[route] += 1
+            self._send(429, {'status': 'error', 'category': 'RATE_LIMITS',
+                             'message': 'You have reached your secondly limit.'},
+                       {'Retry-After': str(stub.retry_after)})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+
+        if url.path == '/crm/v3/objects/contacts':
+            if self._admit('contacts.list'):
+                limit = int(query.get('limit', ['100'])[0])
+                start = int(query.get('after', ['0'])[0])
+                self._send(200, _page(self.stub.contacts, start, limit))
+        elif parts[:4] == ['crm', 'v3', 'objects', 'contacts'] and len(parts) == 5:
+            if self._admit('contacts.get'):
+                found = next((c for c in self.stub.contacts if c['id'] == parts[4]), None)
+                self._send(200 if found else 404, found or {'message': 'Not found'})
+        else:
+            self._send(404, {'message': f'Unknown path {url.path}'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._json_body()
+
+        if path == '/crm/v3/objects/contacts/search':
+            if self._admit('contacts.search'):
+                self._send(200, self.stub.search_contacts(body))
+        elif path == '/crm/v3/objects/deals/search':
+            if self._admit('deals.search'):
+                self._send(200, self.stub.search_deals(body))
+        elif path == '/crm/v3/objects/deals':
+            if self._admit('deals.create'):
+                self._send(201, self.stub.create_deal(body.get('properties', {})))
+        elif path == '/crm/v3/objects/deals/batch/create':
+            if self._admit('deals.batch_create'):
+                results = []
+                for item in body.get('inputs', []):
+                    deal = dict(self.stub.create_deal(item.get('properties', {})))
+                    if item.get('objectWriteTraceId') and self.stub.echo_trace_ids:
+                        deal['objectWriteTraceId'] = item['objectWriteTraceId']
+                    results.append(deal)
+                if self.stub.shuffle_results:
+                    with self.stub._lock:
+                        self.stub.rng.shuffle(results)
+                self._send(201, {'status': 'COMPLETE', 'results': results, 'errors': []})
+        elif path == '/crm/v4/associations/deals/contacts/batch/associate/default':
+            if self._admit('associations.batch'):
+                for item in body.get('inputs', []):
+                    self.stub.associate(item['from']['id'], item['to']['id'])
+                self._send(200, {'status': 'COMPLETE', 'results': []})
+        else:
+            self._send(404, {'message': f'Unknown path {path}'})
+
+    def do_PUT(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        # /crm/v3/objects/deals/<deal>/associations/contacts/<contact>/<type>
+        if parts[:4] == ['crm', 'v3', 'objects', 'deals'] and 'associations' in parts:
+            if self._admit('associations.single'):
+                self.stub.associate(parts[4], parts[7])
+                self._send(200, {})
+        else:
+            self._send(404, {'message': 'Unknown path'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake HubSpot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8999)
+    parser.add_argument('--contacts', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--rate-limit', type=int, default=0, help='Requests per second before 429 (0 = unlimited)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of random 429s')
+    parser.add_argument('--no-trace-ids', action='store_true', help='Omit objectWriteTraceId from batch create results')
+    parser.add_argument('--shuffle-results', action='store_true', help='Return batch create results out of order')
+    args = parser.parse_args()
+
+    stub = HubSpotStub(args.host, args.port, contacts=make_contacts(args.contacts),
+                       latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                       rate_limit=args.rate_limit, error_rate=args.error_rate,
+                       echo_trace_ids=not args.no_trace_ids, shuffle_results=args.shuffle_results)
+    print(f"Fake HubSpot listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+"""Load-test the web app end to end with simulated reviewers.
+
+Starts the Flask app on a local threaded server and a fake HubSpot API with
+configurable latency and 429s, then runs concurrent users through the month-end
+flow: upload a deposit PDF (chunked or form), hold the SSE progress stream open
+(plus extra watchers), open the review page and its thumbnails, search, send
+coalesced check edits, submit the batch and follow the submission stream.
+Reports throughput, p50/p95/p99 latency and error rate per endpoint and writes
+the results as JSON next to the pipeline benchmarks.
+
+    python -m benchmarks.loadtest --users 8 --iterations 2
+    python -m benchmarks.loadtest --users 20 --watchers 2 --hubspot-rate-limit 10 --ocr real
+
+``--ocr fake`` (the default) replaces rasterization and OCR with text read
+from the corpus ground truth, so the run measures the web tier, the database
+and HubSpot rather than Tesseract.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import requests
+
+from benchmarks.corpus import PageRenderer, amount_in_words, generate_corpus
+from benchmarks.hubspot_stub import HubSpotStub, make_contacts
+from benchmarks.run import git_revision, peak_rss_mb, percentile
+
+CHECK_ID = re.compile(r'class="check-card[^"]*" data-check-id="(\d+)" data-version="(\d+)"')
+THUMB = re.compile(r'/images/thumb/([^ "]+)')
+SSE_TIMEOUT = 600
+
+
+class Recorder:
+    """Latency samples and error counts per endpoint, shared by all users."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = Counter()
+        self.statuses = {}
+        self.counters = Counter()
+        self.open_streams = 0
+        self.peak_streams = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status=None, ok=True):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+            if status is not None:
+                self.statuses.setdefault(endpoint, Counter())[str(status)] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stream_opened(self):
+        with self._lock:
+            self.open_streams += 1
+            self.peak_streams = max(self.peak_streams, self.open_streams)
+
+    def stream_closed(self):
+        with self._lock:
+            self.open_streams -= 1
+
+    def summary(self, wall):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            errors = self.errors[endpoint]
+            endpoints[endpoint] = {
+                'count': len(samples),
+                'errors': errors,
+                'error_rate': round(errors / len(samples), 4),
+                'per_sec': round(len(samples) / wall, 2) if wall else None,
+                'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                'p95_ms': round(percentile(samples, 95) * 1000, 1),
+                'p99_ms': round(percentile(samples, 99) * 1000, 1),
+                'max_ms': round(max(samples) * 1000, 1),
+                'statuses': dict(self.statuses.get(endpoint, {})),
+            }
+        return endpoints
+
+
+class User:
+    def __init__(self, number, base_url, recorder, args):
+        self.number = number
+        self.base_url = base_url
+        self.recorder = recorder
+        self.args = args
+        self.rng = random.Random(args.seed + number)
+        self.session = requests.Session()
+
+    def call(self, endpoint, method, path, **kwargs):
+        """One timed request; failures are recorded and returned as None."""
+        kwargs.setdefault('timeout', self.args.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.record(endpoint, time.perf_counter() - start, type(e).__name__, ok=False)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status_code,
+                             ok=response.status_code < 400)
+        return response
+
+    def follow(self, endpoint, path, session=None):
+        """Read an SSE stream until a terminal status; the latency sample is time to first event."""
+        session = session or self.session
+        start = time.perf_counter()
+        last = None
+        self.recorder.stream_opened()
+        try:
+            with session.get(self.base_url + path, stream=True, timeout=(self.args.timeout, SSE_TIMEOUT)) as response:
+                if response.status_code >= 400:
+                    self.recorder.record(endpoint, time.perf_counter() - start, response.status_code, ok=False)
+                    return None
+                first = True
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data: '):
+                        continue
+                    if first:
+                        self.recorder.record(endpoint, time.perf_counter() - start, response.status_code)
+                        first = False
+                    last = json.loads(line[6:])
+                    if last.get('status') in ('complete', 'error', 'unknown'):
+                        break
+        except requests.RequestException as e:
+            self.recorder.record(endpoint, time.perf_counter() - start, type(e).__name__, ok=False)
+        finally:
+            self.recorder.stream_closed()
+        return last
+
+    def think(self):
+        if self.args.think_ms:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+
+    def upload(self, path, appeal_code):
+        filename = os.path.basename(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if self.args.upload == 'form' or (self.args.upload == 'mixed' and self.number % 2):
+            response = self.call('POST /upload', 'POST', '/upload', data={'appeal_code': appeal_code},
+                                 files={'pdf_file': (filename, data, 'application/pdf')})
+            return response.json().get('batch_id') if response is not None and response.ok else None
+
+        response = self.call('POST /api/uploads', 'POST', '/api/uploads',
+                             json={'filename': filename, 'size': len(data), 'appeal_code': appeal_code})
+        if response is None or not response.ok:
+            return None
+        upload = response.json()
+        upload_id = upload['upload_id']
+        chunk_size = upload.get('chunk_size') or len(data)
+        for offset in range(0, len(data), chunk_size):
+            response = self.call('PUT /api/uploads/<id>', 'PUT', f'/api/uploads/{upload_id}',
+                                 data=data[offset:offset + chunk_size],
+                                 headers={'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+            if response is None or not response.ok:
+                return None
+        response = self.call('POST /api/uploads/<id>/complete', 'POST', f'/api/uploads/{upload_id}/complete',
+                             json={'sha256': hashlib.sha256(data).hexdigest()})
+        return response.json().get('batch_id') if response is not None and response.ok else None
+
+    def watch(self, batch_id):
+        # Another reviewer with the processing page open; each stream holds a server thread.
+        with requests.Session() as session:
+            self.follow('GET /api/status/<id>', f'/api/status/{batch_id}', session)
+
+    def review(self, batch_id, deposit):
+        response = self.call('GET /review/<id>', 'GET', f'/review/{batch_id}')
+        if response is None or not response.ok:
+            return
+        cards = [(int(check_id), int(version)) for check_id, version in CHECK_ID.findall(response.text)]
+        self.recorder.count('checks_reviewed', len(cards))
+        for name in list(dict.fromkeys(THUMB.findall(response.text)))[:self.args.thumbnails]:
+            self.call('GET /images/thumb/<name>', 'GET', f'/images/thumb/{name}')
+
+        donors = [p for p in deposit['pages'] if p.get('kind') in ('check', 'money_order')]
+        if donors:
+            self.think()
+            self.call('GET /api/search', 'GET', '/api/search', params={'q': self.rng.choice(donors)['name']})
+
+        # Reviewers fix a few fields per check; the page coalesces them into one PATCH per burst.
+        for start in range(0, len(cards), self.args.edits_per_request):
+            self.think()
+            edits = []
+            for check_id, version in cards[start:start + self.args.edits_per_request]:
+                fields = {'needs_review': False, 'duplicate_of_id': None}
+                if self.rng.random() < 0.3:
+                    fields['address_line2'] = f'Apt {self.rng.randint(1, 40)}'
+                edits.append({'id': check_id, 'version': version, 'fields': fields})
+            response = self.call('PATCH /api/checks', 'PATCH', '/api/checks', json={'edits': edits})
+            if response is not None and response.ok:
+                self.recorder.count('edit_conflicts', len(response.json().get('conflicts', [])))
+
+    def submit(self, batch_id):
+        started = time.perf_counter()
+        response = self.call('POST /api/submit/<id>', 'POST', f'/api/submit/{batch_id}', json={'force_submit': True})
+        if response is None or response.status_code != 202:
+            return
+        status = self.follow('GET /api/submit/<id>/status', f'/api/submit/{batch_id}/status')
+        ok = bool(status) and status.get('status') == 'complete' and not status.get('errors')
+        self.recorder.record('flow: submission', time.perf_counter() - started, ok=ok)
+        if status:
+            self.recorder.count('deals_created', status.get('deals_created') or 0)
+            self.recorder.count('submission_errors', len(status.get('errors') or []))
+
+    def run(self, deposits, corpus_dir):
+        for deposit in deposits:
+            self.think()
+            started = time.perf_counter()
+            batch_id = self.upload(os.path.join(corpus_dir, deposit['filename']), deposit['appeal_code'])
+            if batch_id is None:
+                self.recorder.record('flow: processing', time.perf_counter() - started, ok=False)
+                continue
+
+            watchers = [threading.Thread(target=self.watch, args=(batch_id,), daemon=True)
+                        for _ in range(self.args.watchers)]
+            for watcher in watchers:
+                watcher.start()
+            status = self.follow('GET /api/status/<id>', f'/api/status/{batch_id}')
+            for watcher in watchers:
+                watcher.join()
+            ok = bool(status) and status.get('status') == 'complete'
+            self.recorder.record('flow: processing', time.perf_counter() - started, ok=ok)
+            if not ok:
+                continue
+
+            self.review(batch_id, deposit)
+            self.submit(batch_id)
+        self.session.close()
+
+
+def simulate_ocr(corpus_dir, manifest, ocr_ms):
+    """Serve rasterization and OCR from ground truth instead of Poppler and Tesseract.
+
+    The page image is redrawn from the truth (so the image store, fingerprints
+    and thumbnails do real work) and the OCR text is what Tesseract reads off
+    the synthetic pages, after ``--ocr-ms`` of simulated engine time.
+    """
+    from app.ocr import OCRResult
+    from app.processor import CheckProcessor
+
+    deposits = {}
+    for deposit in manifest['deposits']:
+        with open(os.path.join(corpus_dir, deposit['filename']), 'rb') as f:
+            deposits[hashlib.sha256(f.read()).hexdigest()] = deposit
+    digests = {}
+    local = threading.local()
+    ocr_seconds = ocr_ms / 1000
+
+    def deposit_for(pdf_path):
+        if pdf_path not in digests:
+            with open(pdf_path, 'rb') as f:
+                digests[pdf_path] = hashlib.sha256(f.read()).hexdigest()
+        return deposits[digests[pdf_path]]
+
+    def count_pages(self, pdf_path):
+        return len(deposit_for(pdf_path)['pages'])
+
+    def rasterize_page(self, pdf_path, page_num):
+        deposit = deposit_for(pdf_path)
+        truth = deposit['pages'][page_num - 1]
+        if not hasattr(local, 'renderer'):
+            local.renderer = PageRenderer(random.Random(page_num))
+        local.text = page_text(truth, deposit)
+        return render_page(local.renderer, truth, deposit)
+
+    def ocr_page(self, key):
+        time.sleep(ocr_seconds)
+        return OCRResult(text=getattr(local, 'text', ''), confidence=0.95, engine='simulated')
+
+    CheckProcessor._count_pages = count_pages
+    CheckProcessor._rasterize_page = rasterize_page
+    CheckProcessor._ocr_page = ocr_page
+
+
+def render_page(renderer, truth, deposit):
+    kind = truth.get('kind')
+    if kind in ('check', 'money_order'):
+        return renderer.check(truth, banner=deposit['appeal_code'] == '035')
+    if kind == 'buckslip':
+        donor = next(p for p in deposit['pages'] if p.get('check_index') == truth['check_index']
+                     and p.get('kind') in ('check', 'money_order'))
+        return renderer.buckslip(donor, deposit['appeal_code'])
+    if kind == 'blank_back':
+        return renderer.blank_back()
+    return renderer.report_header('2024-06-03', 0, 0.0)
+
+
+def page_text(truth, deposit):
+    kind = truth.get('kind')
+    if kind in ('check', 'money_order'):
+        year, month, day = truth['check_date'].split('-')
+        lines = ['Front Image - Check'] if deposit['appeal_code'] == '035' else []
+        lines += [truth['name'], truth['address_line1'], f"{truth['city']}, {truth['state']} {truth['zip_code']}"]
+        if truth.get('is_money_order'):
+            lines.append('POSTAL MONEY ORDER')
+        lines += [truth['check_number'], f'Date {month}/{day}/{year}',
+                  f"PAY TO THE ORDER OF Family Radio ${truth['amount']}",
+                  amount_in_words(float(truth['amount'])), 'MEMO']
+        return '\n'.join(lines)
+    if kind == 'buckslip':
+        donor = next(p for p in deposit['pages'] if p.get('check_index') == truth['check_index']
+                     and p.get('kind') in ('check', 'money_order'))
+        return '\n'.join(['Front Image - Document', donor['name'], donor['address_line1'],
+                          f"{donor['city']}, {donor['state']} {donor['zip_code']}",
+                          'Thank you for your gift!', f"Appeal {deposit['appeal_code']}"])
+    if kind == 'blank_back':
+        return 'Back Image\nFOR DEPOSIT ONLY'
+    return 'Lockbox Batch Detail Report\nDeposit Date 2024-06-03 Site Code 4471 Page 1 of 1'
+
+
+def start_app(work_dir):
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    app = create_app()
+    app.config['UPLOAD_FOLDER'] = os.path.join(work_dir, 'uploads')
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<34}{'count':>7}{'err%':>7}{'per_sec':>9}{'p50_ms':>9}{'p95_ms':>9}{'p99_ms':>9}{'max_ms':>9}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<34}{stats['count']:>7}{stats['error_rate'] * 100:>6.1f}%{stats['per_sec'] or 0:>9.2f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}")
+    print(f"\n{report['users']} users, {report['batches']} batches in {report['wall_s']}s "
+          f"({report['pages_per_sec']} pages/sec), peak {report['peak_open_streams']} open SSE streams")
+    print('counters: ' + ', '.join(f'{k}={v}' for k, v in sorted(report['counters'].items())))
+    stub = report.get('hubspot_stub')
+    if stub:
+        print(f"hubspot stub: calls={stub['calls']} throttled={stub['throttled']} deals={stub['deals_created']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=1, help='Deposits each user uploads and submits')
+    parser.add_argument('--checks', type=int, default=10, help='Checks per deposit')
+    parser.add_argument('--watchers', type=int, default=1, help='Extra SSE progress streams per batch')
+    parser.add_argument('--upload', choices=['chunked', 'form', 'mixed'], default='mixed')
+    parser.add_argument('--thumbnails', type=int, default=6, help='Thumbnails fetched per review page')
+    parser.add_argument('--edits-per-request', type=int, default=5)
+    parser.add_argument('--think-ms', type=float, default=200, help='Mean pause between user actions')
+    parser.add_argument('--ramp-seconds', type=float, default=2, help='Spread user start times over this long')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout (seconds)')
+    parser.add_argument('--ocr', choices=['fake', 'real'], default='fake')
+    parser.add_argument('--ocr-ms', type=float, default=150, help='Simulated OCR time per page with --ocr fake')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--verbose', action='store_true', help="Show the app's own output")
+    parser.add_argument('--database-url', help='Database to load (default: a fresh SQLite file)')
+    parser.add_argument('--contacts', type=int, default=5000, help='Extra random contacts in the HubSpot stub')
+    parser.add_argument('--hubspot-latency-ms', type=float, default=80)
+    parser.add_argument('--hubspot-jitter-ms', type=float, default=40)
+    parser.add_argument('--hubspot-rate-limit', type=int, default=0, help='Requests per second before 429 (0 = unlimited)')
+    parser.add_argument('--hubspot-error-rate', type=float, default=0.0, help='Fraction of random 429s')
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='checky-load-')
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    print(f"Generating {args.users * args.iterations} deposits...")
+    manifest = generate_corpus(corpus_dir, args.users * args.iterations, args.checks, args.seed)
+
+    donors = [p for d in manifest['deposits'] for p in d['pages'] if p.get('kind') in ('check', 'money_order')]
+    stub = HubSpotStub(contacts=make_contacts(args.contacts, seed=args.seed, donors=donors),
+                       latency_ms=args.hubspot_latency_ms, jitter_ms=args.hubspot_jitter_ms,
+                       rate_limit=args.hubspot_rate_limit, error_rate=args.hubspot_error_rate,
+                       seed=args.seed).start()
+
+    # Config reads the environment at import time, so set it before the app is imported.
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(work_dir, 'load.db')}"
+    os.environ['HUBSPOT_API_KEY'] = 'loadtest'
+    os.environ['HUBSPOT_BASE_URL'] = stub.url
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['RETENTION_WORKER_ENABLED'] = 'false'
+    os.environ['AUTO_MIGRATE'] = 'true'
+
+    if args.ocr == 'fake':
+        simulate_ocr(corpus_dir, manifest, args.ocr_ms)
+    server, base_url = start_app(work_dir)
+    print(f"App on {base_url}, fake HubSpot on {stub.url}; {args.users} users starting")
+
+    # The pipeline prints per page; keep it out of the report unless asked for.
+    app_log = open(os.path.join(work_dir, 'app.log'), 'w')
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(app_log)
+
+    recorder = Recorder()
+    deposits = manifest['deposits']
+    users = [User(n, base_url, recorder, args) for n in range(args.users)]
+    threads = []
+    started = time.perf_counter()
+    with quiet:
+        for n, user in enumerate(users):
+            mine = deposits[n * args.iterations:(n + 1) * args.iterations]
+            thread = threading.Thread(target=user.run, args=(mine, corpus_dir), daemon=True)
+            thread.start()
+            threads.append(thread)
+            if args.users > 1:
+                time.sleep(args.ramp_seconds / (args.users - 1))
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        server.shutdown()
+        stub.stop()
+    app_log.close()
+
+    pages = sum(len(d['pages']) for d in deposits)
+    report = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('out', 'database_url')},
+        'database': os.environ['DATABASE_URL'].split(':', 1)[0],
+        'users': args.users,
+        'batches': len(deposits),
+        'pages': pages,
+        'wall_s': round(wall, 2),
+        'pages_per_sec': round(pages / wall, 2),
+        'peak_open_streams': recorder.peak_streams,
+        'peak_rss_mb': peak_rss_mb(),
+        'endpoints': recorder.summary(wall),
+        'counters': dict(recorder.counters),
+        'hubspot_stub': stub.stats(),
+    }
+    print_report(report)
+
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"loadtest_{datetime.utcnow():%Y%m%d_%H%M%S}_{report['revision'] or 'local'}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out_path}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if any(stats['errors'] for stats in report['endpoints'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,371 @@
+"""Time each stage of the check pipeline against a synthetic corpus.
+
+Stages: rasterization, writing pages to the image store, OCR per engine (and the production dual-engine path),
+parse_check_data, pairing + persistence, and HubSpot matching against the
+local stub. Reports pages/sec, p50/p95 latency, peak RSS and field accuracy
+against ground truth, and writes the results as JSON so runs from different
+versions can be compared.
+
+    python -m benchmarks.run --deposits 2 --checks 10
+    python -m benchmarks.run --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.hubspot_stub import HubSpotStub, make_contacts
+
+CHECK_FIELDS = ['amount', 'check_number', 'check_date', 'name', 'zip_code']
+BUCKSLIP_FIELDS = ['name', 'zip_code']
+EXPECTED_TYPE = {'check': 'check', 'money_order': 'check', 'buckslip': 'buckslip'}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def disk_usage_mb(path):
+    total = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    return round(total / (1024 * 1024), 2)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+        self.walls = {}
+        self.rss = {}
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        yield
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def wall(self, stage):
+        start = time.perf_counter()
+        yield
+        self.walls[stage] = self.walls.get(stage, 0.0) + time.perf_counter() - start
+        self.rss[stage] = peak_rss_mb()
+
+    def summary(self):
+        stages = {}
+        for stage, samples in self.samples.items():
+            wall = self.walls.get(stage, sum(samples))
+            stages[stage] = {
+                'count': len(samples),
+                'total_s': round(wall, 4),
+                'per_sec': round(len(samples) / wall, 2) if wall else None,
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                'peak_rss_mb': self.rss.get(stage),
+            }
+        return stages
+
+
+def _same(field, parsed, expected):
+    if parsed is None or expected is None:
+        return parsed == expected
+    if field == 'amount':
+        return abs(float(parsed) - float(expected)) < 0.005
+    if field == 'check_date':
+        return str(parsed) == str(expected)
+    return str(parsed).strip().lower() == str(expected).strip().lower()
+
+
+class Accuracy:
+    def __init__(self):
+        self.hits = {}
+        self.totals = {}
+
+    def add(self, key, correct):
+        self.totals[key] = self.totals.get(key, 0) + 1
+        self.hits[key] = self.hits.get(key, 0) + (1 if correct else 0)
+
+    def summary(self):
+        return {key: round(self.hits[key] / self.totals[key], 3) for key in sorted(self.totals)}
+
+
+def run_benchmark(corpus_dir, manifest, engines, work_dir, stub):
+    from app import create_app, db
+    from app.hubspot import HubSpotClient, _search_cache
+    from app.models import Batch, Check
+    from app.ocr import OCREngine
+    from app.duplicates import image_hash
+    from app.processor import CheckProcessor, ContactMatchQueue
+
+    app = create_app()
+    app.config['UPLOAD_FOLDER'] = work_dir
+    processor = CheckProcessor(app)
+    ocr = OCREngine()
+    timer = StageTimer()
+    accuracy = {engine: Accuracy() for engine in engines + ['pipeline']}
+    quiet = io.StringIO()
+
+    engine_calls = {
+        'tesseract': ocr._extract_with_tesseract,
+        'onnxtr': ocr._extract_with_onnxtr,
+        'pipeline': ocr.extract_text_with_confidence,
+    }
+
+    pages_total = 0
+    for deposit in manifest['deposits']:
+        pdf_path = os.path.join(corpus_dir, deposit['filename'])
+        truth_pages = deposit['pages']
+        pages_total += len(truth_pages)
+
+        # Rasterization, then the content-addressed store write
+        store = processor.image_store
+        store_paths = {}
+        png_paths = {}
+        page_hashes = {}
+        with timer.wall('rasterize'):
+            for page_num in range(1, len(truth_pages) + 1):
+                with timer.time('rasterize'):
+                    image = processor._rasterize_page(pdf_path, page_num)
+                with timer.time('store'):
+                    stored = store.put(image)
+                with timer.time('fingerprint'):
+                    page_hashes[page_num] = image_hash(stored.image)
+                store_paths[page_num] = stored.path
+                png_paths[page_num] = store.storage.path(stored.path)  # local backend
+                stored.image.close()
+                image.close()
+
+        # OCR per engine, plus the production dual-engine path
+        results = {}
+        for engine in engines + ['pipeline']:
+            stage = f'ocr.{engine}'
+            results[engine] = {}
+            with timer.wall(stage):
+                for page_num, path in png_paths.items():
+                    with timer.time(stage), contextlib.redirect_stdout(quiet):
+                        try:
+                            results[engine][page_num] = engine_calls[engine](path)
+                        except Exception as e:
+                            print(f"{engine} failed on page {page_num}: {e}", file=sys.stderr)
+                            results[engine][page_num] = None
+
+        # Parsing, and field accuracy per engine
+        parsed = {}
+        for engine in engines + ['pipeline']:
+            stage = 'parse' if engine == 'pipeline' else None
+            with timer.wall(stage) if stage else contextlib.nullcontext():
+                for page_num, truth in enumerate(truth_pages, start=1):
+                    result = results[engine].get(page_num)
+                    text = result.text if result else ''
+                    is_buckslip = truth.get('kind') == 'buckslip'
+                    timing = timer.time(stage) if stage else contextlib.nullcontext()
+                    with timing, contextlib.redirect_stdout(quiet):
+                        data = ocr.parse_check_data(text, is_buckslip=is_buckslip)
+                    if engine == 'pipeline':
+                        parsed[page_num] = data
+                    quiet.seek(0)
+                    quiet.truncate()
+
+                    kind = truth.get('kind')
+                    fields = CHECK_FIELDS if kind in ('check', 'money_order') else BUCKSLIP_FIELDS if is_buckslip else []
+                    for field in fields:
+                        accuracy[engine].add(field, _same(field, data.get(field), truth.get(field)))
+                    if deposit['appeal_code'] == '035':
+                        accuracy[engine].add('page_type', ocr.detect_image_type(text) == EXPECTED_TYPE.get(kind, 'unknown'))
+
+        # Pairing + persistence, fed from the cached OCR so only that stage is timed
+        with app.app_context():
+            batch = Batch(filename=deposit['filename'], appeal_code=deposit['appeal_code'], status='processing')
+            db.session.add(batch)
+            db.session.commit()
+            pipeline_results = results['pipeline']
+
+            def classified(pdf, page_num):
+                result = pipeline_results[page_num]
+                text = result.text if result else ''
+                return {'page_num': page_num, 'type': ocr.detect_image_type(text),
+                        'image_path': store_paths[page_num], 'image_hash': page_hashes[page_num],
+                        'raw_text': text, 'ocr_result': result}
+
+            def mail_page(pdf, page_num):
+                return (page_num, store_paths[page_num], pipeline_results[page_num], parsed[page_num],
+                        page_hashes[page_num])
+
+            processor._classify_page = classified
+            processor._read_mail_page = mail_page
+
+            class NoMatching:
+                def submit(self, check):
+                    pass
+
+            with timer.wall('pair_persist'), timer.time('pair_persist'), contextlib.redirect_stdout(quiet):
+                if deposit['appeal_code'] == '035':
+                    processor._process_bank_batch(batch.id, pdf_path, len(truth_pages), NoMatching())
+                else:
+                    processor._process_mail_batch(batch.id, pdf_path, len(truth_pages), NoMatching())
+            quiet.seek(0)
+            quiet.truncate()
+
+            checks = Check.query.filter_by(batch_id=batch.id).order_by(Check.page_number).all()
+            donors = [p for p in truth_pages if p.get('kind') in ('check', 'money_order')]
+            accuracy['pipeline'].add('checks_found', len(checks) == len(donors))
+
+            # HubSpot matching: per-check latency, then the concurrent queue as used in production
+            client = HubSpotClient()
+            truth_by_page = {n: p for n, p in enumerate(truth_pages, start=1)}
+            _search_cache.clear()
+            with timer.wall('match.search'):
+                for check in checks:
+                    if not check.name:
+                        continue
+                    with timer.time('match.search'):
+                        matches = client.search_contacts(check.name, check.zip_code) or []
+                    truth = truth_by_page.get(check.page_number, {})
+                    best = matches[0]['name'] if matches else ''
+                    accuracy['pipeline'].add('match', best.lower() == (truth.get('name') or '').lower())
+
+            _search_cache.clear()
+            queue = ContactMatchQueue(client)
+            with timer.wall('match.queue'), timer.time('match.queue'):
+                for check in checks:
+                    queue.submit(check)
+                list(queue.results())
+
+    return {
+        'pages': pages_total,
+        'stages': timer.summary(),
+        'accuracy': {engine: acc.summary() for engine, acc in accuracy.items()},
+        'peak_rss_mb': peak_rss_mb(),
+        'image_store_mb': disk_usage_mb(os.path.join(work_dir, 'store')),
+        'hubspot_stub': stub.stats(),
+    }
+
+
+def print_report(report, baseline=None):
+    base_stages = (baseline or {}).get('stages', {})
+    print(f"\n{'stage':<16}{'count':>7}{'per_sec':>10}{'p50_ms':>10}{'p95_ms':>10}{'rss_mb':>9}"
+          + (f"{'Δp50':>9}" if baseline else ''))
+    for stage, stats in report['stages'].items():
+        line = (f"{stage:<16}{stats['count']:>7}{stats['per_sec'] or 0:>10.2f}{stats['p50_ms']:>10.2f}"
+                f"{stats['p95_ms']:>10.2f}{stats['peak_rss_mb'] or 0:>9.1f}")
+        before = base_stages.get(stage)
+        if before and before.get('p50_ms'):
+            line += f"{(stats['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100:>+8.1f}%"
+        print(line)
+
+    print('\naccuracy')
+    base_accuracy = (baseline or {}).get('accuracy', {})
+    for engine, fields in report['accuracy'].items():
+        parts = []
+        for field, value in fields.items():
+            before = base_accuracy.get(engine, {}).get(field)
+            delta = f" ({value - before:+.3f})" if before is not None and before != value else ''
+            parts.append(f"{field}={value:.3f}{delta}")
+        print(f"  {engine:<10} " + ', '.join(parts))
+    print(f"\npeak RSS {report['peak_rss_mb']} MB, {report['pages']} pages, "
+          f"image store {report.get('image_store_mb', 0)} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help='Existing corpus directory (default: generate a fresh one)')
+    parser.add_argument('--deposits', type=int, default=2)
+    parser.add_argument('--checks', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--noise', type=float, default=0.0)
+    parser.add_argument('--engines', default='tesseract,onnxtr')
+    parser.add_argument('--contacts', type=int, default=5000, help='Extra random contacts in the HubSpot stub')
+    parser.add_argument('--hubspot-latency-ms', type=float, default=40)
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+    parser.add_argument('--compare', help='Earlier results JSON to diff against')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='checky-bench-')
+    corpus_dir = args.corpus or os.path.join(work_dir, 'corpus')
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    else:
+        manifest = generate_corpus(corpus_dir, args.deposits, args.checks, args.seed, args.noise)
+
+    donors = [p for d in manifest['deposits'] for p in d['pages'] if p.get('kind') in ('check', 'money_order')]
+    stub = HubSpotStub(contacts=make_contacts(args.contacts, seed=args.seed, donors=donors),
+                       latency_ms=args.hubspot_latency_ms, jitter_ms=args.hubspot_latency_ms / 2).start()
+
+    # Config reads the environment at import time, so set it before the app is imported.
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ['HUBSPOT_API_KEY'] = 'benchmark'
+    os.environ['HUBSPOT_BASE_URL'] = stub.url
+    os.environ['STATUS_STORE'] = 'memory'
+    os.environ['CONTACT_MIRROR_ENABLED'] = 'false'
+    os.environ['PRERENDER_IMAGE_DERIVATIVES'] = 'false'
+    os.environ['RETENTION_WORKER_ENABLED'] = 'false'
+    os.environ['AUTO_MIGRATE'] = 'true'
+
+    from app import ocr as ocr_module
+    engines = [e for e in args.engines.split(',') if e]
+    if 'onnxtr' in engines and not ocr_module.ONNXTR_AVAILABLE:
+        print('onnxtr is not installed; skipping that engine', file=sys.stderr)
+        engines.remove('onnxtr')
+
+    try:
+        report = run_benchmark(corpus_dir, manifest, engines, work_dir, stub)
+    finally:
+        stub.stop()
+
+    report.update({
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'corpus': {'seed': manifest['seed'], 'noise': manifest['noise'],
+                   'deposits': len(manifest['deposits'])},
+        'engines': engines,
+    })
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"bench_{datetime.utcnow():%Y%m%d_%H%M%S}_{report['revision'] or 'local'}.json")
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out_path}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
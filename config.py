@@ -10,16 +10,93 @@ class Config:
         "pool_recycle": 300,
         "pool_pre_ping": True,
     }
+    # Apply pending migrations in create_app instead of via `flask db-upgrade` at deploy
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'false').lower() == 'true'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
     ALLOWED_EXTENSIONS = {'pdf'}
+    # Chunked uploads: the whole file may exceed MAX_CONTENT_LENGTH, each chunk may not
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS = 24
+    # Where PDFs and page images live: 'local' (UPLOAD_FOLDER) or 's3' (AWS or any
+    # S3-compatible service; credentials from the standard AWS_* variables)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET', '')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    S3_REGION = os.environ.get('S3_REGION', '')
+    # e.g. http://localhost:9000 for MinIO or http://localhost:4566 for LocalStack
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', '')
+    # 'proxy' streams images through the app; 'presigned' redirects browsers to short-lived S3 URLs
+    IMAGE_DELIVERY = os.environ.get('IMAGE_DELIVERY', 'proxy')
+    PRESIGNED_URL_TTL = int(os.environ.get('PRESIGNED_URL_TTL', 300))
+    # Opt in to storing colour page scans as grayscale (lossy; pages without colour are always stored grayscale/bilevel)
+    IMAGE_STORE_GRAYSCALE = os.environ.get('IMAGE_STORE_GRAYSCALE', 'false').lower() == 'true'
+    # Unreferenced page images younger than this are kept; a batch still processing may be about to use them
+    IMAGE_STORE_GRACE_HOURS = 6
+    # Browser cache lifetime for batch page images before they are revalidated (ETag)
+    IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', 3600))
+    # Render review thumbnails/medium WebP while pages are processed instead of on first view
+    PRERENDER_IMAGE_DERIVATIVES = os.environ.get('PRERENDER_IMAGE_DERIVATIVES', 'true').lower() == 'true'
     
     HUBSPOT_API_KEY = os.environ.get('HUBSPOT_API_KEY', '')
+    # Point at a local stand-in server for testing and load tests
+    HUBSPOT_BASE_URL = os.environ.get('HUBSPOT_BASE_URL', 'https://api.hubapi.com')
+    # Cached contact searches (normalized name + ZIP) for repeat donors
+    CONTACT_CACHE_SIZE = int(os.environ.get('CONTACT_CACHE_SIZE', '5000'))
+    CONTACT_CACHE_TTL_SECONDS = int(os.environ.get('CONTACT_CACHE_TTL_SECONDS', str(24 * 3600)))
+    # Match donors against the local contact mirror (see `flask sync-contacts`)
+    # instead of calling the HubSpot search API for every check
+    CONTACT_MIRROR_ENABLED = os.environ.get('CONTACT_MIRROR_ENABLED', '').lower() in ('1', 'true', 'yes')
+    CONTACT_INDEX_REFRESH_SECONDS = 60
+    # HubSpot caps batch create/associate inputs at 100 per call
+    HUBSPOT_BATCH_SIZE = 100
+    # Keep-alive connections to HubSpot shared across threads
+    HUBSPOT_POOL_SIZE = int(os.environ.get('HUBSPOT_POOL_SIZE', '16'))
+    # Client-side limits; defaults match a private app on a Professional account
+    HUBSPOT_RATE_PER_SECOND = float(os.environ.get('HUBSPOT_RATE_PER_SECOND', '10'))
+    HUBSPOT_SEARCH_RATE_PER_SECOND = float(os.environ.get('HUBSPOT_SEARCH_RATE_PER_SECOND', '4'))
+    HUBSPOT_DAILY_LIMIT = int(os.environ.get('HUBSPOT_DAILY_LIMIT', '650000'))
+    HUBSPOT_MAX_RETRIES = 5
+    HUBSPOT_BACKOFF_BASE_SECONDS = 0.5
+    HUBSPOT_BACKOFF_MAX_SECONDS = 30
+    HUBSPOT_CONNECT_TIMEOUT = 5
+    HUBSPOT_CIRCUIT_FAILURES = 5
+    HUBSPOT_CIRCUIT_RESET_SECONDS = 30
+    # Contact searches in flight at once while a batch is being OCR'd
+    HUBSPOT_MATCH_WORKERS = int(os.environ.get('HUBSPOT_MATCH_WORKERS', '8'))
+    # A submission whose heartbeat is older than this is assumed dead and may be resumed
+    SUBMISSION_STALE_MINUTES = int(os.environ.get('SUBMISSION_STALE_MINUTES', '10'))
     
-    DATA_RETENTION_HOURS = 48
+    # Max differing dHash bits for two check images to count as the same check (band index finds up to 3)
+    DUPLICATE_HASH_DISTANCE = int(os.environ.get('DUPLICATE_HASH_DISTANCE', 3))
     
+    DATA_RETENTION_HOURS = int(os.environ.get('DATA_RETENTION_HOURS', 48))
+    # Background janitor that purges images/PDFs/OCR text of submitted batches past retention
+    RETENTION_WORKER_ENABLED = os.environ.get('RETENTION_WORKER_ENABLED', 'true').lower() == 'true'
+    RETENTION_INTERVAL_MINUTES = int(os.environ.get('RETENTION_INTERVAL_MINUTES', 60))
+    RETENTION_CHUNK_SIZE = 20  # batches per transaction
+    RETENTION_CHUNK_PAUSE_SECONDS = 0.5
+
+    # Write a cProfile of these batches to uploads/profiles ('all' or comma-separated batch ids)
+    PROFILE_BATCHES = os.environ.get('PROFILE_BATCHES', '')
+
+    # 'memory' keeps progress in the worker process (single-process dev only);
+    # 'database' shares it across web workers and OCR workers.
+    STATUS_STORE = os.environ.get('STATUS_STORE', 'memory')
+    
+    # OCR worker threads shared by all batches in this process (0 = one per CPU core)
+    PROCESSING_CPU_BUDGET = int(os.environ.get('PROCESSING_CPU_BUDGET', '0'))
+    # Batches rasterized/OCR'd at the same time; the rest wait in the queue
+    MAX_ACTIVE_BATCHES = int(os.environ.get('MAX_ACTIVE_BATCHES', '3'))
+    # Lower runs first: small mail batches ahead of large bank batches
+    APPEAL_PRIORITIES = {
+        '020': 10,
+        '035': 20
+    }
+
     APPEAL_CODES = {
         '035': 'Bank Check',
         '020': 'General Mail'
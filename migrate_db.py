@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-"""Quick database migration using SQLAlchemy text"""
+"""Apply pending database migrations (same as `flask db-upgrade`)"""
 import os
 import sys
 
@@ -7,30 +7,15 @@ import sys
 os.environ.setdefault('FLASK_APP', 'run.py')
 
 try:
-    from app import create_app, db
-    from sqlalchemy import text
+    from app import create_app
+    from app.migrations import upgrade
 
     app = create_app()
 
     with app.app_context():
-        print("Running database migration...")
-
-        try:
-            # Add check_ocr_text column
-            db.session.execute(text("ALTER TABLE checks ADD COLUMN IF NOT EXISTS check_ocr_text TEXT"))
-            print("✓ Added check_ocr_text column")
-        except Exception as e:
-            print(f"Note: check_ocr_text - {e}")
-
-        try:
-            # Add buckslip_ocr_text column
-            db.session.execute(text("ALTER TABLE checks ADD COLUMN IF NOT EXISTS buckslip_ocr_text TEXT"))
-            print("✓ Added buckslip_ocr_text column")
-        except Exception as e:
-            print(f"Note: buckslip_ocr_text - {e}")
-
-        db.session.commit()
-        print("\n✓ Migration complete!")
+        print("Running database migrations...")
+        applied = upgrade()
+        print(f"\n✓ Applied {len(applied)} migration(s)." if applied else "\n✓ Database is up to date.")
 
 except ImportError as e:
     print(f"Error: {e}")
@@ -1,6 +1,14 @@
+import click
+
 from app import create_app
 
 app = create_app()
 
+# Web processes (python run.py, gunicorn run:app) run the retention janitor;
+# `flask` CLI commands load this module too and must not start one.
+if app.config.get('RETENTION_WORKER_ENABLED') and click.get_current_context(silent=True) is None:
+    from app.retention import start_retention_worker
+    start_retention_worker(app)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
@@ -0,0 +1,44 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import pytest
+
+from benchmarks.hubspot_stub import HubSpotStub
+from config import Config
+
+
+@pytest.fixture
+def hubspot_stub(monkeypatch):
+    """Start a fake HubSpot and point Config at it; pass stub options to the returned factory."""
+    stubs = []
+
+    def start(**options):
+        stub = HubSpotStub(contacts=[], **options).start()
+        monkeypatch.setattr(Config, 'HUBSPOT_API_KEY', 'test')
+        monkeypatch.setattr(Config, 'HUBSPOT_BASE_URL', stub.url)
+        stubs.append(stub)
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.stop()
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(Config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(Config, 'AUTO_MIGRATE', True)
+    monkeypatch.setattr(Config, 'RETENTION_WORKER_ENABLED', False)
+    monkeypatch.setattr(Config, 'STATUS_STORE', 'memory')
+
+    from app import create_app, db
+    app = create_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
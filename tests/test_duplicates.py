@@ -0,0 +1,79 @@
+import random
+
+from PIL import Image, ImageFilter
+
+from app import db
+from app.duplicates import find_duplicate, flag_duplicate, hamming, hash_bands, image_hash
+from app.models import Batch, Check
+
+BASE_HASH = '0123456789abcdef'
+
+
+def _flip(hash_hex, *bits):
+    value = int(hash_hex, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return f'{value:016x}'
+
+
+def _check(batch_id, page_number, amount=25, check_number=None):
+    check = Check(batch_id=batch_id, page_number=page_number, amount=amount, check_number=check_number)
+    db.session.add(check)
+    db.session.flush()
+    return check
+
+
+def _stored(hash_hex, **fields):
+    batch = Batch(filename='deposit.pdf', appeal_code='020', status='ready')
+    db.session.add(batch)
+    db.session.flush()
+    check = _check(batch.id, 1, **fields)
+    flag_duplicate(check, hash_hex)
+    db.session.commit()
+    return check
+
+
+def test_near_duplicate_matches_through_a_single_band(app):
+    original = _stored(BASE_HASH)
+    # One bit off in each of bands 0, 1 and 2: only band 3 still agrees
+    rescan_hash = _flip(BASE_HASH, 0, 20, 40)
+    agreeing = [a == b for a, b in zip(hash_bands(BASE_HASH), hash_bands(rescan_hash))]
+    assert agreeing == [False, False, False, True]
+    assert hamming(BASE_HASH, rescan_hash) == 3
+
+    rescan = _check(original.batch_id, 2)
+    assert find_duplicate(rescan, rescan_hash) == original.id
+
+
+def test_band_collision_with_a_distinct_image_is_not_a_match(app):
+    _stored(BASE_HASH)
+    # Shares band 3 with the stored hash, but the other 48 bits are inverted
+    distinct_hash = f'{int(BASE_HASH, 16) ^ 0x0000ffffffffffff:016x}'
+    assert hash_bands(distinct_hash)[3] == hash_bands(BASE_HASH)[3]
+
+    other = _check(db.session.query(Batch.id).scalar(), 2)
+    assert find_duplicate(other, distinct_hash) is None
+
+
+def test_near_identical_image_with_a_different_amount_is_not_a_match(app):
+    original = _stored(BASE_HASH, check_number='1001')
+    monthly = _check(original.batch_id, 2, amount=50, check_number='1001')
+    assert find_duplicate(monthly, _flip(BASE_HASH, 5)) is None
+
+
+def test_rescanned_page_hashes_close_and_another_page_does_not():
+    rng = random.Random(3)
+    page = Image.new('L', (900, 400), 255)
+    pixels = page.load()
+    for _ in range(60):
+        x, y, w, h = rng.randrange(860), rng.randrange(360), rng.randrange(10, 200), rng.randrange(5, 40)
+        shade = rng.randrange(0, 200)
+        for px in range(x, min(x + w, 900)):
+            for py in range(y, min(y + h, 400)):
+                pixels[px, py] = shade
+
+    rescan = page.filter(ImageFilter.GaussianBlur(1)).point(lambda v: min(255, v + 6))
+    other = page.transpose(Image.Transpose.ROTATE_180)
+
+    assert hamming(image_hash(page), image_hash(rescan)) <= 3
+    assert hamming(image_hash(page), image_hash(other)) > 10
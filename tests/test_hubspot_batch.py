@@ -0,0 +1,56 @@
+import pytest
+
+from app.hubspot import HubSpotClient
+
+
+@pytest.fixture
+def client(hubspot_stub):
+    def make(**stub_options):
+        stub = hubspot_stub(**stub_options)
+        return HubSpotClient(), stub
+    return make
+
+
+def _items(count, with_keys=True):
+    return [
+        (check_id, {'amount': 10 + check_id, 'name': f'Donor {check_id}', 'check_number': str(check_id),
+                    'submission_key': f'key{check_id}' if with_keys else None},
+         f'contact{check_id}')
+        for check_id in range(1, count + 1)
+    ]
+
+
+def _deal_for(stub, submission_key):
+    return next(deal_id for deal_id, deal in stub.deals.items()
+                if f'Submission Key: {submission_key}' in deal['properties']['description'])
+
+
+def test_results_matched_by_trace_id(client):
+    hubspot, stub = client(shuffle_results=True)
+    results = hubspot.create_deals_batch(_items(20), '035')
+
+    for check_id in range(1, 21):
+        assert results[check_id] == {'deal_id': _deal_for(stub, f'key{check_id}'), 'error': None, 'associated': True}
+
+
+def test_shuffled_results_without_trace_ids_matched_by_submission_key(client):
+    hubspot, stub = client(echo_trace_ids=False, shuffle_results=True)
+    results = hubspot.create_deals_batch(_items(20), '035')
+
+    for check_id in range(1, 21):
+        assert results[check_id]['deal_id'] == _deal_for(stub, f'key{check_id}')
+    # Every association went to the contact of the check the deal belongs to
+    deal_contacts = dict(stub.associations)
+    for check_id in range(1, 21):
+        assert deal_contacts[results[check_id]['deal_id']] == f'contact{check_id}'
+
+
+def test_unmatchable_results_are_left_unknown(client):
+    hubspot, stub = client(echo_trace_ids=False, shuffle_results=True)
+    results = hubspot.create_deals_batch(_items(3, with_keys=False), '035')
+
+    assert len(stub.deals) == 3
+    for check_id in range(1, 4):
+        assert results[check_id]['deal_id'] is None
+        assert results[check_id]['unknown']
+    assert stub.associations == []
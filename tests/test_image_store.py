@@ -0,0 +1,86 @@
+import os
+import random
+import time
+
+from PIL import Image
+
+from app import images
+from app.image_store import ImageStore
+from app.images import derivative_key, get_derivative
+from app.storage import get_storage
+
+
+def _page(mode, colour):
+    rng = random.Random(7)
+    image = Image.new(mode, (320, 140), colour)
+    pixels = image.load()
+    for _ in range(4000):
+        x, y = rng.randrange(320), rng.randrange(140)
+        value = tuple(rng.randrange(256) for _ in range(3))
+        pixels[x, y] = value if mode == 'RGB' else value[0]
+    return image
+
+
+def _round_trip(image):
+    store = ImageStore(get_storage())
+    stored = store.put(image)
+    with store.local_path(stored.path) as path, Image.open(path) as saved:
+        saved.load()
+        return stored, saved.copy()
+
+
+def test_rgb_page_round_trips_pixel_for_pixel(app):
+    page = _page('RGB', (250, 240, 220))
+    stored, saved = _round_trip(page)
+
+    assert saved.mode == 'RGB'
+    assert saved.tobytes() == page.tobytes()
+
+
+def test_colourless_page_is_compacted_without_loss(app):
+    page = _page('L', 255).convert('RGB')
+    stored, saved = _round_trip(page)
+
+    assert saved.mode == 'L'
+    assert saved.convert('RGB').tobytes() == page.tobytes()
+
+
+def test_same_pixels_stored_once(app):
+    first, _ = _round_trip(_page('RGB', (250, 240, 220)))
+    second, _ = _round_trip(_page('RGB', (250, 240, 220)))
+
+    assert first.path == second.path
+    assert first.created and not second.created
+
+
+def test_reused_page_keeps_its_derivatives(app, monkeypatch):
+    storage = get_storage()
+    store = ImageStore(storage)
+    stored = store.put(_page('RGB', (250, 240, 220)))
+    store.prerender(stored)
+    thumb = derivative_key('thumb', stored.path, 'webp')
+
+    # Even an old blob that gets touched for its new reference keeps the
+    # derivatives it already has: its content (and name) can't have changed.
+    old = time.time() - 24 * 3600
+    os.utime(storage.path(stored.path), (old, old))
+    os.utime(storage.path(thumb), (old - 60, old - 60))
+    assert not store.put(_page('RGB', (250, 240, 220))).created
+    assert storage.modified(stored.path) > old
+
+    def render(*args):
+        raise AssertionError('derivative re-rendered')
+
+    monkeypatch.setattr(images, 'render_derivative', render)
+    assert get_derivative(storage, 'thumb', stored.path, 'webp') == thumb
+
+
+def test_recent_page_is_not_touched_on_reuse(app, monkeypatch):
+    storage = get_storage()
+    store = ImageStore(storage)
+    store.put(_page('RGB', (250, 240, 220)))
+
+    touched = []
+    monkeypatch.setattr(storage, 'touch', touched.append)
+    store.put(_page('RGB', (250, 240, 220)))
+    assert touched == []
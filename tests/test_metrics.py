@@ -0,0 +1,27 @@
+import threading
+
+from app import metrics
+from config import Config
+
+
+def test_one_batch_is_profiled_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'PROFILE_BATCHES', 'all')
+    started, release = threading.Event(), threading.Event()
+
+    def first_batch():
+        with metrics.profiled(1):
+            started.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=first_batch)
+    thread.start()
+    assert started.wait(5)
+    # A second batch (and page work under batch_context) must not start its
+    # own profiler while the first is active; Python 3.12+ would refuse it.
+    with metrics.profiled(2), metrics.batch_context(1):
+        sum(range(1000))
+    release.set()
+    thread.join()
+
+    assert metrics.write_profile(2, str(tmp_path)) is None
+    assert metrics.write_profile(1, str(tmp_path)) == str(tmp_path / 'profiles' / 'batch_1.prof')
@@ -0,0 +1,56 @@
+from app.pairing import PagePairer
+
+
+def _page(page_num, page_type):
+    return {'page_num': page_num, 'type': page_type}
+
+
+def _pairs(pairs):
+    return [(check['page_num'], buckslip['page_num'] if buckslip else None) for check, buckslip in pairs]
+
+
+def test_out_of_order_pages_pair_in_page_order():
+    pairer = PagePairer()
+    pages = [_page(1, 'check'), _page(2, 'buckslip'), _page(3, 'check'), _page(4, 'blank'), _page(5, 'buckslip')]
+
+    emitted = []
+    for page in [pages[4], pages[2], pages[3], pages[1]]:
+        emitted += pairer.add(page)
+    assert emitted == []
+    assert pairer.pending == 4
+
+    emitted += pairer.add(pages[0])
+    assert _pairs(emitted) == [(1, 2), (3, 5)]
+    assert pairer.pending == 0
+    assert _pairs(pairer.finish()) == []
+
+
+def test_odd_trailing_check_is_emitted_alone():
+    pairer = PagePairer()
+    emitted = []
+    for page in [_page(1, 'check'), _page(2, 'buckslip'), _page(3, 'check')]:
+        emitted += pairer.add(page)
+
+    assert _pairs(emitted) == [(1, 2)]
+    assert pairer.pending == 1
+    assert _pairs(pairer.finish()) == [(3, None)]
+
+
+def test_back_before_its_front_is_an_orphan():
+    pairer = PagePairer()
+    emitted = []
+    for page in [_page(1, 'buckslip'), _page(2, 'check'), _page(3, 'check'), _page(4, 'buckslip')]:
+        emitted += pairer.add(page)
+    emitted += pairer.finish()
+
+    assert _pairs(emitted) == [(2, None), (3, 4)]
+    assert pairer.orphan_buckslips == [1]
+
+
+def test_finish_flushes_pages_behind_a_gap():
+    pairer = PagePairer()
+    assert pairer.add(_page(2, 'check')) == []
+    assert pairer.add(_page(3, 'buckslip')) == []
+
+    # Page 1 never arrived (its worker failed)
+    assert _pairs(pairer.finish()) == [(2, 3)]
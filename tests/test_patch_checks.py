@@ -0,0 +1,76 @@
+import pytest
+
+from app import db
+from app.models import Batch, Check
+
+
+@pytest.fixture
+def check(app):
+    batch = Batch(filename='deposit.pdf', appeal_code='020', status='ready')
+    db.session.add(batch)
+    db.session.flush()
+    check = Check(batch_id=batch.id, page_number=1, amount=25, name='Donor')
+    db.session.add(check)
+    db.session.commit()
+    return check
+
+
+def _patch(app, body):
+    return app.test_client().patch('/api/checks', json=body)
+
+
+@pytest.mark.parametrize('body', [[1], 'edits', {'edits': {'id': 1}}, {}])
+def test_malformed_body_is_rejected(app, body):
+    response = _patch(app, body)
+    assert response.status_code == 400
+
+
+def test_bad_edits_get_per_edit_errors(app, check):
+    response = _patch(app, {'edits': [
+        {'id': check.id, 'version': check.version, 'fields': {'amount': {'a': 1}}},
+        {'id': check.id, 'fields': {'name': 'No version'}},
+        {'id': 'abc', 'version': 1, 'fields': {}},
+        {'id': check.id, 'version': check.version, 'fields': {'check_date': 20240101}},
+        'not an edit',
+    ]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['updated'] == []
+    assert [e['index'] for e in body['errors']] == [0, 1, 2, 3, 4]
+    db.session.refresh(check)
+    assert float(check.amount) == 25 and check.name == 'Donor'
+
+
+def test_string_ids_are_coerced(app, check):
+    response = _patch(app, {'edits': [{'id': str(check.id), 'version': str(check.version),
+                                       'fields': {'amount': '30.50'}}]})
+
+    body = response.get_json()
+    assert body['updated'] == [{'id': check.id, 'version': 2}]
+    assert body['missing'] == [] and body['errors'] == []
+
+
+def test_stale_version_conflicts(app, check):
+    response = _patch(app, {'edits': [{'id': check.id, 'version': check.version + 1, 'fields': {'name': 'X'}}]})
+
+    assert response.get_json()['conflicts'][0]['id'] == check.id
+
+
+def test_overlong_field_is_a_per_edit_error(app, check):
+    other = Check(batch_id=check.batch_id, page_number=2, amount=10, name='Other')
+    db.session.add(other)
+    db.session.commit()
+
+    response = _patch(app, {'edits': [
+        {'id': check.id, 'version': check.version, 'fields': {'state': 'Ohio'}},
+        {'id': other.id, 'version': other.version, 'fields': {'state': 'OH'}},
+    ]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['errors'] == [{'index': 0, 'id': check.id, 'error': 'state must be at most 2 characters'}]
+    assert [u['id'] for u in body['updated']] == [other.id]
+    db.session.refresh(check)
+    db.session.refresh(other)
+    assert check.state is None and other.state == 'OH'
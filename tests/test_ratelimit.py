@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from app import hubspot, ratelimit
+from app.hubspot import HubSpotClient, HubSpotUnavailable
+from app.ratelimit import CircuitBreaker, DailyQuota, TokenBucket
+from config import Config
+
+
+class FakeClock:
+    """Stands in for the ``time`` module; sleeping just moves the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    monkeypatch.setattr(hubspot, 'time', clock)
+    return clock
+
+
+def test_token_bucket_spends_its_burst_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.acquire() and bucket.acquire()
+    assert clock.sleeps == []
+
+    assert bucket.acquire()
+    assert clock.sleeps == [pytest.approx(0.5)]
+    assert not bucket.acquire(timeout=0.1)
+
+
+def test_token_bucket_pause_holds_every_caller(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.pause(3)
+    assert not bucket.acquire(timeout=1)
+    assert bucket.acquire()
+    assert clock.now == pytest.approx(1003)
+
+
+def test_daily_quota_resets_at_utc_midnight(monkeypatch):
+    today = datetime(2026, 3, 1, 23, 59)
+
+    class FakeDatetime:
+        @staticmethod
+        def utcnow():
+            return today
+
+    monkeypatch.setattr(ratelimit, 'datetime', FakeDatetime)
+    quota = DailyQuota(limit=2)
+    assert quota.consume() and quota.consume()
+    assert not quota.consume()
+
+    today += timedelta(minutes=2)
+    assert quota.consume()
+    assert quota.used == 1
+
+
+def test_circuit_breaker_opens_then_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # only one probe at a time
+
+    breaker.record_failure()  # failed probe re-opens at once
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def client(clock, monkeypatch):
+    monkeypatch.setattr(Config, 'HUBSPOT_MAX_RETRIES', 2)
+    monkeypatch.setattr(Config, 'HUBSPOT_BACKOFF_BASE_SECONDS', 1)
+    monkeypatch.setattr(hubspot, '_rate_limiter', TokenBucket(100))
+    monkeypatch.setattr(hubspot, '_search_rate_limiter', TokenBucket(100))
+    monkeypatch.setattr(hubspot, '_daily_quota', DailyQuota(0))
+    monkeypatch.setattr(hubspot, '_circuit', CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    monkeypatch.setattr(hubspot.random, 'uniform', lambda low, high: high)
+    client = HubSpotClient()
+    client.base_url = 'https://hubspot.test'
+    return client
+
+
+def test_429_honours_retry_after_and_pauses_the_shared_bucket(client, clock):
+    client.session = FakeSession(FakeResponse(429, {'Retry-After': '7'}), FakeResponse(200))
+
+    response = client._request('GET', 'https://hubspot.test/crm/v3/objects/deals')
+    assert response.status_code == 200
+    assert client.session.calls == 2
+    assert clock.sleeps[0] == 7
+    assert hubspot._circuit.state == CircuitBreaker.CLOSED
+
+
+def test_server_errors_back_off_and_return_the_last_response(client, clock):
+    client.session = FakeSession(FakeResponse(503), FakeResponse(502), FakeResponse(500))
+
+    response = client._request('GET', 'https://hubspot.test/crm/v3/objects/deals')
+    assert response.status_code == 500
+    assert client.session.calls == 3
+    assert clock.sleeps == [1, 2]
+    assert hubspot._circuit.state == CircuitBreaker.OPEN
+
+
+def test_open_circuit_fails_fast_until_the_probe_succeeds(client, clock):
+    client.session = FakeSession(*[requests.ConnectionError('down')] * 3)
+    with pytest.raises(requests.ConnectionError):
+        client._request('GET', 'https://hubspot.test/crm/v3/objects/deals')
+
+    with pytest.raises(HubSpotUnavailable):
+        client._request('GET', 'https://hubspot.test/crm/v3/objects/deals')
+    assert client.session.calls == 3
+
+    clock.now += 60
+    client.session = FakeSession(FakeResponse(200))
+    assert client._request('GET', 'https://hubspot.test/crm/v3/objects/deals').status_code == 200
+    assert hubspot._circuit.state == CircuitBreaker.CLOSED
+
+
+def test_spent_daily_quota_raises(client, monkeypatch):
+    monkeypatch.setattr(hubspot, '_daily_quota', DailyQuota(1))
+    client.session = FakeSession(FakeResponse(200), FakeResponse(200))
+    client._request('GET', 'https://hubspot.test/crm/v3/objects/deals')
+
+    with pytest.raises(HubSpotUnavailable):
+        client._request('GET', 'https://hubspot.test/crm/v3/objects/deals')
+    assert client.session.calls == 1
@@ -0,0 +1,15 @@
+from app import create_app, retention
+from config import Config
+
+
+def test_create_app_does_not_start_the_janitor(app, monkeypatch):
+    # CLI commands and scripts build apps too; only run.py starts the worker.
+    monkeypatch.setattr(Config, 'RETENTION_WORKER_ENABLED', True)
+    create_app()
+    assert retention._worker is None
+
+
+def test_run_once_purges_without_a_lock_outside_postgres(app):
+    report = retention.RetentionJanitor(app).run_once()
+    assert 'skipped' not in report
+    assert report['batches'] == 0
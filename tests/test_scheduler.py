@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from app.scheduler import BatchScheduler
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def _drain(scheduler, batch_id, fn, items, into):
+    thread = threading.Thread(target=lambda: into.extend(scheduler.map_pages(batch_id, fn, items)))
+    thread.start()
+    return thread
+
+
+def test_two_batches_take_turns_on_the_page_workers(app):
+    scheduler = BatchScheduler(cpu_budget=1, max_active_batches=2)
+    order = []
+    first_running, both_queued = threading.Event(), threading.Event()
+
+    def page(name):
+        def run(item):
+            if not order and not first_running.is_set():
+                first_running.set()
+                both_queued.wait(5)  # hold the only worker until B has queued
+            order.append(f'{name}{item}')
+            return item
+        return run
+
+    a_results, b_results = [], []
+    a = _drain(scheduler, 'A', page('A'), range(4), a_results)
+    assert first_running.wait(5)
+    b = _drain(scheduler, 'B', page('B'), range(4), b_results)
+    _wait_for(lambda: 'B' in scheduler._page_queues)
+    both_queued.set()
+    a.join(5)
+    b.join(5)
+
+    # A0 was already running when B arrived; after that the batches alternate.
+    assert order == ['A0', 'A1', 'B0', 'A2', 'B1', 'A3', 'B2', 'B3']
+    assert sorted(a_results) == sorted(b_results) == [0, 1, 2, 3]
+    assert scheduler._page_queues == {} and not scheduler._round_robin
+
+
+def test_second_map_pages_for_a_batch_is_refused(app):
+    scheduler = BatchScheduler(cpu_budget=1, max_active_batches=1)
+    release = threading.Event()
+    first = scheduler.map_pages(1, lambda item: release.wait(5), [1, 2])
+    second = scheduler.map_pages(1, lambda item: item, [3])
+
+    started = threading.Thread(target=lambda: next(first))
+    started.start()
+    _wait_for(lambda: 1 in scheduler._page_queues)
+    with pytest.raises(RuntimeError):
+        next(second)
+    release.set()
+    started.join(5)
+    assert list(first) == [True]
+    assert list(scheduler.map_pages(1, lambda item: item * 2, [3])) == [6]
+
+
+def test_higher_priority_batch_is_admitted_first(app):
+    scheduler = BatchScheduler(cpu_budget=1, max_active_batches=1, priorities={'urgent': 1}, default_priority=100)
+    release = threading.Event()
+    ran = []
+    done = threading.Event()
+
+    def job(name):
+        def run():
+            ran.append(name)
+            if name == 'running':
+                release.wait(5)
+            if len(ran) == 3:
+                done.set()
+        return run
+
+    scheduler.submit_batch(1, 'other', 1, job('running'))
+    scheduler.submit_batch(2, 'other', 1, job('normal'))
+    scheduler.submit_batch(3, 'urgent', 1, job('urgent'))
+    assert scheduler.queue_position(3) == 1 and scheduler.queue_position(2) == 2
+
+    release.set()
+    assert done.wait(5)
+    assert ran == ['running', 'urgent', 'normal']
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.status_store import DatabaseStatusStore, MemoryStatusStore
+
+
+@pytest.fixture(params=['memory', 'database'])
+def store(request, app):
+    return MemoryStatusStore() if request.param == 'memory' else DatabaseStatusStore(app)
+
+
+def test_partial_updates_merge(store):
+    store.update(7, {'status': 'processing', 'processed': 1})
+    store.update(7, {'total_pages': 12})
+    store.update(7, {'processed': 2})
+
+    assert store.get(7) == {'status': 'processing', 'processed': 2, 'total_pages': 12}
+    assert store.get(8) is None
+
+
+def test_concurrent_writers_keep_each_others_keys(store):
+    def writer(name):
+        for i in range(20):
+            store.update('batch', {f'{name}_{i}': i})
+
+    threads = [threading.Thread(target=writer, args=(name,)) for name in ('pages', 'matches')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store.get('batch')) == 40
+
+
+def test_postgres_update_is_a_single_jsonb_merge_upsert(app, monkeypatch):
+    store = DatabaseStatusStore(app)
+    store._get_engine()
+    statements = []
+
+    class Conn:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, stmt):
+            statements.append(str(stmt.compile(dialect=postgresql.dialect())))
+
+    class Engine:
+        class dialect:
+            name = 'postgresql'
+
+        def begin(self):
+            return Conn()
+
+    store._engine = Engine()
+    store.update(7, {'processed': 2})
+
+    assert len(statements) == 1
+    assert 'ON CONFLICT (key) DO UPDATE' in statements[0]
+    assert 'processing_status.data || excluded.data' in statements[0]
@@ -0,0 +1,49 @@
+import io
+
+import pytest
+
+from app.storage import S3Storage
+
+moto = pytest.importorskip('moto')
+
+BLOB = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def s3(app, monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    app.config.update(S3_BUCKET='checks', S3_REGION='us-east-1', S3_ENDPOINT_URL='')
+    with moto.mock_aws():
+        storage = S3Storage(app)
+        storage.client.create_bucket(Bucket='checks')
+        storage.write('pdfs/batch.pdf', io.BytesIO(BLOB))
+        yield storage
+
+
+def _send(app, storage, **headers):
+    with app.test_request_context(headers=headers):
+        response = storage.send('pdfs/batch.pdf')
+        response.direct_passthrough = False
+        return response.status_code, response.headers, response.get_data()
+
+
+def test_range_request_returns_partial_content(app, s3):
+    status, headers, body = _send(app, s3, Range='bytes=100-199')
+    assert status == 206
+    assert headers['Content-Range'] == f'bytes 100-199/{len(BLOB)}'
+    assert headers['Content-Length'] == '100'
+    assert body == BLOB[100:200]
+
+
+def test_unsatisfiable_range_is_rejected(app, s3):
+    status, headers, _ = _send(app, s3, Range=f'bytes={len(BLOB)}-')
+    assert status == 416
+    assert headers['Content-Range'] == f'bytes */{len(BLOB)}'
+
+
+def test_stale_if_range_sends_the_whole_object(app, s3):
+    status, headers, body = _send(app, s3, Range='bytes=0-9', **{'If-Range': '"not-the-etag"'})
+    assert status == 200
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert body == BLOB
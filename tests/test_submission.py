@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.hubspot import HubSpotClient, HubSpotUnavailable
+from app.models import Batch, Check
+from app.submission import STALE_AFTER, BatchSubmitter, claim_submission
+
+
+def _batch(count=2):
+    batch = Batch(filename='deposit.pdf', appeal_code='035', status='ready')
+    db.session.add(batch)
+    db.session.flush()
+    for page in range(1, count + 1):
+        db.session.add(Check(batch_id=batch.id, page_number=page, amount=25 * page, check_number=str(page),
+                             name=f'Donor {page}', hubspot_contact_id=f'contact{page}', needs_review=False))
+    db.session.commit()
+    return batch.id
+
+
+def test_failed_associations_are_retried_on_resume(app, hubspot_stub, monkeypatch):
+    stub = hubspot_stub()
+    batch_id = _batch()
+
+    original = HubSpotClient._batch_associate_deals
+    monkeypatch.setattr(HubSpotClient, '_batch_associate_deals',
+                        lambda self, associations: [key for key, _, _ in associations])
+    BatchSubmitter(app)._run(batch_id)
+
+    checks = Check.query.filter_by(batch_id=batch_id).all()
+    assert all(c.hubspot_deal_id and c.hubspot_associated is False for c in checks)
+    assert db.session.get(Batch, batch_id).status == 'submit_incomplete'
+    assert stub.associations == []
+
+    monkeypatch.setattr(HubSpotClient, '_batch_associate_deals', original)
+    BatchSubmitter(app)._run(batch_id)
+
+    db.session.expire_all()
+    checks = Check.query.filter_by(batch_id=batch_id).all()
+    assert all(c.hubspot_associated for c in checks)
+    assert db.session.get(Batch, batch_id).status == 'submitted'
+    assert len(stub.deals) == 2
+    assert sorted(stub.associations) == sorted((c.hubspot_deal_id, c.hubspot_contact_id) for c in checks)
+
+
+def test_failed_deal_search_keeps_check_in_doubt(app, hubspot_stub, monkeypatch):
+    stub = hubspot_stub()
+    batch_id = _batch(count=1)
+    check = Check.query.filter_by(batch_id=batch_id).one()
+    check.submission_key = 'sentbefore'
+    db.session.commit()
+
+    def search_fails(self, submission_key):
+        raise HubSpotUnavailable("HubSpot circuit breaker is open")
+
+    monkeypatch.setattr(HubSpotClient, 'find_deal_by_submission_key', search_fails)
+    BatchSubmitter(app)._run(batch_id)
+
+    db.session.expire_all()
+    check = Check.query.filter_by(batch_id=batch_id).one()
+    assert check.hubspot_deal_id is None
+    assert check.submission_key == 'sentbefore'
+    assert stub.calls['deals.batch_create'] == 0
+    batch = db.session.get(Batch, batch_id)
+    assert batch.status == 'submit_incomplete'
+    assert 'Could not confirm' in batch.submission_report
+
+
+def test_only_one_claim_wins(app):
+    batch_id = _batch()
+    assert claim_submission(batch_id)
+    assert not claim_submission(batch_id)
+    assert db.session.get(Batch, batch_id).status == 'submitting'
+
+
+def test_stale_claim_can_be_resumed(app):
+    batch_id = _batch()
+    assert claim_submission(batch_id)
+    batch = db.session.get(Batch, batch_id)
+    batch.submission_heartbeat = datetime.utcnow() - STALE_AFTER - timedelta(seconds=1)
+    db.session.commit()
+    assert batch.submission_stalled
+    assert claim_submission(batch_id)
+
+
+def test_processing_batch_cannot_be_claimed(app):
+    batch_id = _batch()
+    db.session.get(Batch, batch_id).status = 'processing'
+    db.session.commit()
+    assert not claim_submission(batch_id)
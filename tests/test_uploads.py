@@ -0,0 +1,52 @@
+import fcntl
+import hashlib
+import io
+
+import pytest
+
+from app import uploads
+from app.uploads import UploadError, UploadManager
+
+PDF = b'%PDF-1.4\n' + b''.join(b'1 0 obj << /Type /Page >> endobj\n' for _ in range(3)) + b'%%EOF\n'
+
+
+def test_chunks_can_land_on_different_workers(tmp_path, monkeypatch):
+    first, second = UploadManager(str(tmp_path)), UploadManager(str(tmp_path))
+    upload_id = first.create('batch.pdf', len(PDF))['upload_id']
+
+    offset = 0
+    for worker, chunk in zip([first, second, first], [PDF[:20], PDF[20:60], PDF[60:]]):
+        offset = worker.write_chunk(upload_id, offset, io.BytesIO(chunk))
+    assert offset == len(PDF)
+    assert second.describe(upload_id)['pages_seen'] == 3
+
+    # The scan state comes from the sidecar; the hash only catches up on the
+    # bytes this worker hasn't seen yet.
+    reads = []
+
+    def read_range(path, start, end):
+        reads.append((start, end))
+        return real_read_range(path, start, end)
+
+    real_read_range = uploads._read_range
+    monkeypatch.setattr(uploads, '_read_range', read_range)
+
+    path, meta = second.complete(upload_id, expected_sha256=hashlib.sha256(PDF).hexdigest())
+    assert reads == [(60, len(PDF))]
+    assert meta['sha256'] == hashlib.sha256(PDF).hexdigest()
+    with open(path, 'rb') as f:
+        assert f.read() == PDF
+
+
+def test_concurrent_chunk_is_refused(tmp_path):
+    manager = UploadManager(str(tmp_path))
+    upload_id = manager.create('batch.pdf', len(PDF))['upload_id']
+    part_path, _ = manager._paths(upload_id)
+
+    with open(part_path, 'ab') as other_worker:
+        fcntl.flock(other_worker, fcntl.LOCK_EX)
+        with pytest.raises(UploadError) as excinfo:
+            manager.write_chunk(upload_id, 0, io.BytesIO(PDF))
+    assert excinfo.value.status == 409
+
+    assert manager.write_chunk(upload_id, 0, io.BytesIO(PDF)) == len(PDF)